@@ -0,0 +1,385 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+"""
+Render cache
+
+If ``render_cache`` is set, the output of content filters is kept in
+``cache_dir`` between builds. A file whose source, meta and filters haven't
+changed since it was cached, and which read nothing that has changed since
+(other files, directory listings and templates, see
+:attr:`Node.dependencies`), gets its content and marks from the cache rather
+than running its filters again.
+
+Keys don't depend on where the site is, when its files were modified or
+which machine it is built on, so the cache can be shared between machines by
+copying ``cache_dir``. Compiled Jinja2 templates are kept in ``cache_dir`` too,
+unless ``template_cache_dir`` says otherwise.
+
+Entries are pickled, so only use a ``cache_dir`` that you trust.
+"""
+
+from collections import namedtuple
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import pickle
+import sys
+import threading
+
+from . import __version__, deploy
+from .state import file_digest, get_cache_dir, meta_fingerprint, node_key
+
+RENDER_CACHE_META = "render_cache"
+RENDER_CACHE_SIZE_META = "render_cache_size"
+DEFAULT_RENDER_CACHE_SIZE = 256 * 1024 * 1024
+
+RENDER_CACHE_DIR_NAME = "render"
+TEMPLATE_CACHE_DIR_NAME = "templates"
+CACHE_FORMAT = 2
+
+logger = logging.getLogger(__name__)
+
+CacheStats = namedtuple("CacheStats", ["hits", "misses", "entries", "size", "max_size"])
+
+_module_digests = {}
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def module_digest(module):
+    """Returns a digest of the source of ``module``, or just its name if it
+    doesn't have a source file"""
+    name = module.__name__
+    if name not in _module_digests:
+        path = getattr(module, "__file__", None)
+        _module_digests[name] = file_digest(path) if path else name
+    return _module_digests[name]
+
+
+def _hash(*parts):
+    data = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.md5(data.encode("utf-8")).hexdigest()
+
+
+def filters_fingerprint(filters):
+    """Returns a fingerprint of ``filters``, a list of ``(module name, filter
+    module, globs)`` tuples as from :meth:`Node._content_filters`"""
+    return [(name, list(globs), module_digest(module)) for name, module, globs in filters]
+
+
+def find_node(root_node, key):
+    """Returns the node with ``key``, or ``None`` if there isn't one"""
+    node = root_node
+    if key == ".":
+        return node
+    for part in key.split("/"):
+        node = node._children.get(part)
+        if node is None:
+            return None
+    return node
+
+
+class RenderCache:
+    """
+    Content filter output, stored in a directory
+
+    Each entry is keyed by :meth:`key` and records the content and marks of a
+    node, what it read while being rendered and a fingerprint of each of
+    those things at the time.
+    """
+    def __init__(self, path, max_size=DEFAULT_RENDER_CACHE_SIZE):
+        """
+        :param path:
+            The directory to keep entries in
+        :param max_size:
+            How many bytes :meth:`prune` lets entries take up
+        """
+        self.path = pathlib.Path(path)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_node(cls, node):
+        """Returns the cache that ``node`` should use, or ``None`` if
+        ``render_cache`` isn't set for it. Nodes that use the same directory
+        share a cache object."""
+        if not node.meta.get(RENDER_CACHE_META):
+            return None
+        return cls.for_settings(node.root_node.meta)
+
+    @classmethod
+    def for_settings(cls, settings):
+        """Returns the cache in ``cache_dir``, whether or not ``render_cache``
+        is set"""
+        path = str((get_cache_dir(settings) / RENDER_CACHE_DIR_NAME).resolve())
+        with _caches_lock:
+            if path not in _caches:
+                max_size = settings.get(RENDER_CACHE_SIZE_META, DEFAULT_RENDER_CACHE_SIZE)
+                _caches[path] = cls(path, max_size)
+            return _caches[path]
+
+    def key(self, node, filters):
+        """Returns the key for ``node``, which will be rendered by
+        ``filters``"""
+        return _hash(
+            CACHE_FORMAT,
+            __version__,
+            sys.version_info[:2],
+            node_key(node),
+            file_digest(str(node.path_obj), node.stat),
+            meta_fingerprint(node),
+            filters_fingerprint(filters),
+        )
+
+    def entry_path(self, key):
+        return self.path / key[:2] / key[2:]
+
+    def _load(self, key):
+        try:
+            with self.entry_path(key).open("rb") as entry_file:
+                return pickle.load(entry_file)
+        except FileNotFoundError:
+            return None
+        except Exception as exp:
+            logger.warning("Could not load render cache entry %s: %s", key, exp)
+            return None
+
+    def get(self, node, key):
+        """
+        Returns the cached entry for ``node``, as a dictionary with the keys
+        ``content``, ``marks`` and ``dependencies``, or ``None`` if there
+        isn't one or it's out of date
+        """
+        entry = self._load(key)
+        if entry is not None and not self._is_current(node, entry, {node_key(node)}):
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if entry is not None:
+            # entries are evicted oldest first, so this one is now the newest
+            with contextlib.suppress(OSError):
+                os.utime(self.entry_path(key))
+        return entry
+
+    def put(self, node, key, content):
+        """Store ``content``, along with the marks and dependencies of
+        ``node``"""
+        dependencies = sorted(node._dependencies or ())
+        fingerprints = [self.fingerprint(node, dependency, {node_key(node)})
+                        for dependency in dependencies]
+        if None in fingerprints:
+            logger.debug("Not caching %s: it depends on itself", node_key(node))
+            return
+
+        entry = {
+            "content": content,
+            "hash": hashlib.md5(content.encode("utf-8")).hexdigest(),
+            "marks": dict(node._marks),
+            "dependencies": dependencies,
+            "fingerprints": fingerprints,
+        }
+        path = self.entry_path(key)
+        try:
+            data = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        except Exception as exp:
+            logger.debug("Not caching %s: %s", node_key(node), exp)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        deploy.write_file(str(path), data, 0o644)
+
+    def _is_current(self, node, entry, seen):
+        for dependency, fingerprint in zip(entry["dependencies"], entry["fingerprints"]):
+            if fingerprint is None or self.fingerprint(node, dependency, seen) != fingerprint:
+                return False
+        return True
+
+    def fingerprint(self, reader, dependency, seen):
+        """
+        Returns a fingerprint of ``dependency`` as read by ``reader``, or
+        ``None`` if it can't be worked out
+
+        :param seen:
+            Keys of the nodes whose fingerprints are already being worked
+            out. Nodes that depend on each other have no fingerprint.
+        """
+        kind, key = dependency
+        if kind == "template":
+            return self.template_fingerprint(reader, key)
+
+        node = find_node(reader.root_node, key)
+        if node is None:
+            return None
+        elif kind == "children":
+            return _hash(sorted(node._children))
+        elif kind == "node":
+            return self.node_fingerprint(node, seen)
+        elif kind == "url":
+            return self.url_fingerprint(node)
+        return None
+
+    def url_fingerprint(self, node):
+        """Returns a fingerprint of :attr:`Node.full_url` and
+        :attr:`Node.full_path` of ``node``, without ``deploy_path``"""
+        root_path = node.root_node.full_path
+        return _hash(node.full_url, os.path.relpath(node.full_path, root_path))
+
+    def template_fingerprint(self, reader, name):
+        """Returns a fingerprint of every template called ``name`` in the
+        ``templates`` directories of ``reader``"""
+        templates = reader.meta.get("templates") or []
+        if not isinstance(templates, (list, tuple)):
+            templates = [templates]
+
+        digests = []
+        for idx, template_dir in enumerate(templates):
+            path = os.path.join(template_dir, name)
+            if os.path.isfile(path):
+                digests.append((idx, file_digest(path)))
+        return _hash(name, digests)
+
+    def node_fingerprint(self, node, seen):
+        """
+        Returns a fingerprint of ``node``, which covers its source, its meta
+        and, if it has been through any filters, the content and marks they
+        produced
+
+        Fingerprints are remembered until :meth:`Node.forget` is called.
+        """
+        known = node.__dict__.get("_render_fingerprint")
+        if known is not None:
+            return known
+
+        key = node_key(node)
+        if not node.is_leaf:
+            fingerprint = _hash("dir", meta_fingerprint(node))
+        elif key in seen:
+            return None
+        else:
+            filters = node._matching_filters()
+            fingerprint = self.key(node, filters)
+            if filters:
+                output = self.output_fingerprint(node, fingerprint, seen | {key})
+                if output is None:
+                    return None
+                fingerprint = _hash(fingerprint, output)
+
+        node.__dict__["_render_fingerprint"] = fingerprint
+        return fingerprint
+
+    def output_fingerprint(self, node, key, seen):
+        """
+        Returns a fingerprint of the content and marks of ``node``, whose
+        entry would have ``key``
+
+        These are taken from its entry if it has one that is current,
+        otherwise its content is worked out, whether or not it uses a render
+        cache. Returns ``None`` if it read any of the nodes in ``seen``, or if
+        its content is still being worked out further up the stack.
+        """
+        cache = self.for_node(node)
+        if cache is not None:
+            entry = cache._load(key)
+            if entry is not None and cache._is_current(node, entry, seen):
+                return _hash(entry["hash"], entry["marks"])
+
+        if "_content" not in node.__dict__ and node._lock.is_owned():
+            return None
+        node.content
+        if any(kind == "node" and dependency in seen
+               for kind, dependency in node.dependencies or ()):
+            return None
+        return _hash(node.content_hash, node._marks)
+
+    def entries(self):
+        """Yields ``(path, stat)`` for every entry"""
+        if not self.path.is_dir():
+            return
+        for bucket in os.scandir(self.path):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    yield entry.path, entry.stat()
+
+    def stats(self):
+        """Returns a :class:`CacheStats` for this cache"""
+        entries = list(self.entries())
+        return CacheStats(self.hits, self.misses, len(entries),
+                          sum(stat.st_size for _, stat in entries), self.max_size)
+
+    def prune(self, max_size=None):
+        """
+        Delete the least recently used entries until the rest take up no more
+        than ``max_size`` bytes, which defaults to :attr:`max_size`
+
+        Returns the number of entries that were deleted.
+        """
+        if max_size is None:
+            max_size = self.max_size
+
+        entries = sorted(self.entries(), key=lambda entry: entry[1].st_mtime_ns)
+        size = sum(stat.st_size for _, stat in entries)
+        removed = 0
+        for path, stat in entries:
+            if size <= max_size:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            size -= stat.st_size
+            removed += 1
+
+        if removed:
+            logger.info("Render cache %s: evicted %s entries", self.path, removed)
+        return removed
+
+    def clear(self):
+        """Delete every entry"""
+        return self.prune(0)
+
+
+def build_finished(root_node):
+    """Report hits and misses of every render cache that has been used"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        if cache.hits or cache.misses:
+            logger.info("Render cache %s: %s hits, %s misses",
+                        cache.path, cache.hits, cache.misses)
+
+
+def prune_caches():
+    """Call :meth:`RenderCache.prune` on every render cache that has been
+    used"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.prune()
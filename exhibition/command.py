@@ -29,7 +29,7 @@ import shutil
 
 import click
 
-from exhibition import __version__, config, utils
+from exhibition import __version__, cache, config, manifest, utils, watch
 import exhibition as exhib_module
 
 logger = logging.getLogger("exhibition")
@@ -53,24 +53,73 @@ def exhibition(verbose):
 
 
 @exhibition.command(short_help="Generate site")
-def gen():
+@click.option("-j", "--jobs", default=1, type=click.IntRange(min=1),
+              help="Number of processes or threads used to render files.")
+@click.option("-m", "--mode", default="process", type=click.Choice(list(utils.RENDER_MODES)),
+              help="Render files in worker processes or threads.")
+@click.option("-i", "--incremental", is_flag=True,
+              help="Only render files that have changed since the last incremental build.")
+@click.option("-a", "--atomic", is_flag=True,
+              help="Render into a staging directory and swap it into place when finished.")
+def gen(jobs, mode, incremental, atomic):
     """
     Generate site from content_path
     """
     settings = config.Config.from_path(config.SITE_YAML_PATH)
-    utils.gen(settings)
+    utils.gen(settings, jobs=jobs, mode=mode, incremental=incremental, atomic=atomic)
+
+
+@exhibition.command("compile-templates", short_help="Compile templates ahead of time")
+@click.argument("target", metavar="PATH", required=False)
+@click.option("-f", "--filter", "filter_module", default="exhibition.filters.jinja2",
+              help="Jinja2 content filter whose template filters should be used.")
+def compile_templates(target, filter_module):
+    """
+    Compile every template in templates into Python modules. If PATH ends in
+    .zip then a zip file is created, otherwise PATH is a directory. PATH
+    defaults to compiled_templates from site.yaml.
+    """
+    settings = config.Config.from_path(config.SITE_YAML_PATH)
+    if target is None:
+        target = settings.get("compiled_templates")
+    if target is None:
+        raise click.UsageError("No PATH given and compiled_templates is not set")
+
+    utils.compile_templates(settings, target, filter_module)
+
+
+@exhibition.command("watch", short_help="Regenerate site when files change")
+@click.option("-j", "--jobs", default=1, type=click.IntRange(min=1),
+              help="Number of threads used to render files.")
+@click.option("--debounce", default=watch.DEFAULT_DEBOUNCE, type=click.FloatRange(min=0),
+              help="Seconds to wait for further changes before rendering.")
+@click.option("--poll", "poll_interval", type=click.FloatRange(min=0, min_open=True),
+              help="Poll for changes every this many seconds rather than using inotify.")
+def watch_site(jobs, debounce, poll_interval):
+    """
+    Generate site from content_path, then keep it up to date as files in
+    content_path, templates and site.yaml change
+    """
+    settings = config.Config.from_path(config.SITE_YAML_PATH)
+    try:
+        watch.watch(settings, config.SITE_YAML_PATH, jobs=jobs, debounce=debounce,
+                    poll_interval=poll_interval)
+    except (KeyboardInterrupt, SystemExit):
+        pass
 
 
 @exhibition.command(short_help="Serve site locally")
 @click.option("-s", "--server", default="localhost", help="Hostname to serve the site at.")
 @click.option("-p", "--port", default=8000, type=int, help="Port to serve the site at.")
-def serve(server, port):
+@click.option("--live", is_flag=True,
+              help="Render pages as they are requested rather than serving deploy_path.")
+def serve(server, port, live):
     """
     Serve files from deploy_path as a webserver would
     """
     settings = config.Config.from_path(config.SITE_YAML_PATH)
     server_address = (server, port)
-    httpd, thread = utils.serve(settings, server_address)
+    httpd, thread = utils.serve(settings, server_address, live=live)
 
     try:
         thread.join()
@@ -78,6 +127,44 @@ def serve(server, port):
         httpd.shutdown()
 
 
+@exhibition.command(short_help="List files that differ between two manifests")
+@click.argument("old", type=click.Path(exists=True, dir_okay=False))
+@click.argument("new", type=click.Path(exists=True, dir_okay=False))
+def diff(old, new):
+    """
+    Compare two manifests written to manifest_path by exhibit gen and print
+    the URL of each file that was added (A), modified (M) or deleted (D)
+    """
+    try:
+        changes = manifest.diff(manifest.load(old), manifest.load(new))
+    except ValueError as exp:
+        raise click.ClickException(str(exp))
+
+    for status, url in changes:
+        click.echo("%s %s" % (status, url))
+
+
+@exhibition.command("cache", short_help="Show or empty the render cache")
+@click.option("--prune", is_flag=True,
+              help="Evict the least recently used entries until render_cache_size is met.")
+@click.option("--clear", is_flag=True, help="Delete every entry.")
+def render_cache(prune, clear):
+    """
+    Show how many entries are in the render cache in cache_dir and how much
+    space they take up
+    """
+    settings = config.Config.from_path(config.SITE_YAML_PATH)
+    render_cache = cache.RenderCache.for_settings(settings)
+    if clear:
+        render_cache.clear()
+    elif prune:
+        render_cache.prune()
+
+    stats = render_cache.stats()
+    click.echo("Entries: %s" % stats.entries)
+    click.echo("Size: %s of %s bytes" % (stats.size, stats.max_size))
+
+
 @exhibition.command(short_help="Create a starter site")
 @click.argument("destination", metavar="PATH")
 @click.option("-f", "--force", is_flag=True, help="overwrite destination if it exists")
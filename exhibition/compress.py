@@ -0,0 +1,137 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+"""
+Precompressed copies of rendered files
+
+Files that match ``compress_glob`` are written to ``deploy_path`` a second
+time for each of ``compress_formats``, e.g. ``media/site.css.gz``. Web
+servers such as nginx can then send these to clients that accept them,
+rather than compressing each response.
+
+zstd needs the ``zstandard`` package, which can be installed with
+``pip install exhibition[zstd]``.
+"""
+
+from collections import namedtuple
+import contextlib
+import gzip
+import os
+
+from . import deploy, matcher
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESS_GLOB_META = "compress_glob"
+COMPRESS_FORMATS_META = "compress_formats"
+COMPRESS_LEVEL_META = "compress_level"
+
+DEFAULT_FORMATS = ["gzip"]
+
+
+def _gzip(data, level):
+    # a fixed mtime means the same input always gives the same output
+    return gzip.compress(data, level, mtime=0)
+
+
+def _zstd(data, level):
+    if zstandard is None:
+        raise ImportError("zstd compression needs the zstandard package")
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+Format = namedtuple("Format", ["suffix", "default_level", "compress"])
+
+FORMATS = {
+    "gzip": Format(".gz", 9, _gzip),
+    "zstd": Format(".zst", 19, _zstd),
+}
+
+# when a client accepts more than one format, the first of these is sent
+PREFERENCE = ["zstd", "gzip"]
+
+
+def node_formats(node):
+    """Returns a list of the formats that ``node`` should be compressed
+    with, which is empty if it doesn't match ``compress_glob``"""
+    globs = node.meta.get(COMPRESS_GLOB_META)
+    if not (globs and node.is_leaf and matcher.match_globs(globs, node.path_obj.name)):
+        return []
+
+    formats = node.meta.get(COMPRESS_FORMATS_META, DEFAULT_FORMATS)
+    if not isinstance(formats, (list, tuple)):
+        formats = [formats]
+    for name in formats:
+        if name not in FORMATS:
+            raise ValueError("Unknown compression format %r in %s, expected one of %s"
+                             % (name, COMPRESS_FORMATS_META, ", ".join(sorted(FORMATS))))
+
+    return list(formats)
+
+
+def compression_level(node, name):
+    """
+    Returns the level ``node`` should be compressed at with format ``name``
+
+    ``compress_level`` can either be a number, which is used for every
+    format, or a dictionary of levels keyed by format.
+    """
+    level = node.meta.get(COMPRESS_LEVEL_META)
+    if isinstance(level, dict):
+        level = level.get(name)
+    if level is None:
+        level = FORMATS[name].default_level
+    return level
+
+
+def write_compressed(node, data, file_mode):
+    """
+    Write compressed copies of ``data``, the content of ``node``, next to its
+    output
+
+    Copies in formats that ``node`` is no longer compressed with are removed,
+    unless they are the output of another node. If ``compress_glob`` isn't set
+    at all nothing is removed here, incremental builds remove copies that are
+    no longer written via :class:`exhibition.state.BuildState`.
+    """
+    if node.meta.get(COMPRESS_GLOB_META) is None:
+        return
+
+    formats = node_formats(node)
+    full_path = node.full_path
+    siblings = node.parent._children if node.parent is not None else {}
+    for name, fmt in FORMATS.items():
+        path = full_path + fmt.suffix
+        if name not in formats:
+            if os.path.basename(path) not in siblings:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+            continue
+
+        deploy.write_file(path, fmt.compress(data, compression_level(node, name)), file_mode)
+
+
+def compressed_paths(path, formats):
+    """Returns the paths of compressed copies of ``path`` in ``formats``"""
+    return [path + FORMATS[name].suffix for name in formats]
@@ -0,0 +1,191 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+"""
+Atomic deploys for ``exhibit gen --atomic``
+
+The site is rendered into a staging directory next to ``deploy_path``, which
+is then swapped into place in a single step, so a web server reading from
+``deploy_path`` either sees the old site or the new one and never a mixture
+of the two. The old site is deleted in a background thread afterwards.
+
+If ``deploy_path`` is a symlink, a new symlink pointing at the staging
+directory replaces it. Otherwise the two directories are exchanged with
+``renameat2(RENAME_EXCHANGE)``, which needs Linux 3.15 or later. Where that
+isn't available the old site is renamed out of the way and the staging
+directory renamed into its place, which leaves a very short gap where
+``deploy_path`` doesn't exist.
+"""
+
+import contextlib
+import ctypes
+import errno
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+CLEANUP_THREAD_NAME = "exhibition-cleanup"
+
+logger = logging.getLogger(__name__)
+
+_renameat2 = None
+
+
+def _get_renameat2():
+    global _renameat2
+    if _renameat2 is None:
+        try:
+            func = ctypes.CDLL(None, use_errno=True).renameat2
+        except (OSError, AttributeError):
+            func = False
+        else:
+            func.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p,
+                             ctypes.c_uint]
+            func.restype = ctypes.c_int
+        _renameat2 = func
+
+    return _renameat2
+
+
+def exchange(path_a, path_b):
+    """
+    Atomically swap ``path_a`` and ``path_b``, which must both exist
+
+    Raises :class:`OSError` with ``errno.ENOSYS`` if this isn't supported by
+    the platform, or ``errno.EINVAL`` if it isn't supported by the filesystem.
+    """
+    renameat2 = _get_renameat2()
+    if not renameat2:
+        raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS), path_a, None, path_b)
+
+    if renameat2(AT_FDCWD, os.fsencode(path_a), AT_FDCWD, os.fsencode(path_b),
+                 RENAME_EXCHANGE) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path_a, None, path_b)
+
+
+def make_staging(deploy_path):
+    """Create an empty staging directory next to ``deploy_path`` and return
+    its path"""
+    deploy_path = os.path.abspath(deploy_path)
+    parent, name = os.path.split(deploy_path)
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=".%s.staging-" % name, dir=parent)
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def copy_tree(src, dst):
+    """
+    Copy everything in ``src`` into ``dst`` using hard links where possible
+
+    Files in ``dst`` must be replaced rather than written to, otherwise the
+    change would show up in ``src`` too. See :func:`write_file`.
+    """
+    shutil.copytree(src, dst, symlinks=True, copy_function=_link_or_copy,
+                    dirs_exist_ok=True)
+
+
+def write_file(path, data, file_mode):
+    """
+    Write ``data``, which must be bytes, to ``path`` via a temporary file in
+    the same directory
+
+    Readers of ``path`` either see the old file or the new one, and any hard
+    links to the old file are left alone.
+    """
+    parent, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=".%s." % name, suffix=".tmp", dir=parent)
+    try:
+        with os.fdopen(fd, "wb") as fo:
+            fo.write(data)
+        os.chmod(tmp_path, file_mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
+
+def swap(staging, deploy_path):
+    """
+    Put ``staging`` in place of ``deploy_path``
+
+    Returns the path of the old site, which should be deleted, or ``None`` if
+    there wasn't one.
+    """
+    deploy_path = os.path.abspath(deploy_path)
+    if os.path.islink(deploy_path):
+        parent = os.path.dirname(deploy_path)
+        old = os.path.join(parent, os.readlink(deploy_path))
+        tmp_link = staging + ".link"
+        os.symlink(os.path.relpath(staging, parent), tmp_link)
+        os.replace(tmp_link, deploy_path)
+        return old if os.path.isdir(old) else None
+    elif not os.path.lexists(deploy_path):
+        os.rename(staging, deploy_path)
+        return None
+
+    try:
+        exchange(staging, deploy_path)
+        return staging
+    except OSError as exp:
+        if exp.errno not in (errno.ENOSYS, errno.EINVAL):
+            raise
+        logger.warning("Atomic rename isn't supported here, %s will briefly be missing",
+                       deploy_path)
+
+    old = staging + ".old"
+    os.rename(deploy_path, old)
+    try:
+        os.rename(staging, deploy_path)
+    except BaseException:
+        # put the old site back rather than leave nothing there
+        os.rename(old, deploy_path)
+        raise
+    return old
+
+
+def published_path(staging, deploy_path):
+    """Returns the real path that ``staging`` will have once it has been
+    swapped into place by :func:`swap`"""
+    if os.path.islink(deploy_path):
+        return os.path.realpath(staging)
+    return os.path.realpath(deploy_path)
+
+
+def remove_later(path):
+    """Delete the directory at ``path`` in a background thread, which is
+    returned"""
+    thread = threading.Thread(target=shutil.rmtree, args=(path, True),
+                              name=CLEANUP_THREAD_NAME)
+    thread.start()
+    return thread
@@ -22,6 +22,8 @@
 A base filter class for class based filters
 """
 
+import copy
+
 
 class BaseFilter:
     """Base filter for class-based filters
@@ -30,13 +32,32 @@ class BaseFilter:
     """
 
     def __call__(self, node, content):
-        self.node = node
-        self.content = content
-        return self.content_filter()
+        # work on a copy so that one filter can be used by several threads
+        fltr = copy.copy(self)
+        fltr.node = node
+        fltr.content = content
+        return fltr.content_filter()
 
     def content_filter(self):
         """Override this method in your subclass"""
         raise NotImplementedError
 
+    def build_finished(self, root_node):
+        """Called once the whole site has been generated. ``root_node`` is
+        the root of the tree that was rendered.
+
+        When a site is rendered by multiple processes, this is called once in
+        each worker process as well as in the main process.
+
+        Override this method in your subclass if you need it"""
+        pass
+
+    def templates_changed(self, root_node):
+        """Called by ``exhibit watch`` when a file in ``templates`` has
+        changed, before the tree at ``root_node`` is rendered again.
+
+        Override this method in your subclass if you need it"""
+        pass
+
 
 content_filter = BaseFilter()  # this line is here for completeness sake
@@ -31,9 +31,12 @@ Use an external command to process a file, like so:
 """
 
 from tempfile import TemporaryDirectory
+import asyncio
 import pathlib
 import subprocess
 
+from exhibition.locks import run_in_thread
+
 DEFAULT_GLOB = "*.*"
 
 INPUT_NAME = "input"
@@ -43,19 +46,15 @@ INPUT_KEY = "INPUT"
 OUTPUT_KEY = "OUTPUT"
 
 
-def content_filter(node, content):
+def prepare_command(node, content, tmp_dir):
     """
-    This is the actual content filter called by :class:`exhibition.main.Node`
-    on appropriate nodes.
+    Write ``content`` to an input file in ``tmp_dir`` and format
+    ``external_cmd`` with the input and output file names
 
-    :param node:
-        The node being rendered
-    :param content:
-        The content of the node, stripped of any YAML frontmatter
+    Returns a tuple of the command and the path of the output file
     """
-    tmp_dir = TemporaryDirectory()
-    input_file = pathlib.Path(tmp_dir.name, INPUT_NAME)
-    output_file = pathlib.Path(tmp_dir.name, OUTPUT_NAME)
+    input_file = pathlib.Path(tmp_dir, INPUT_NAME)
+    output_file = pathlib.Path(tmp_dir, OUTPUT_NAME)
 
     cmd = node.meta["external_cmd"]
     cmd = cmd.format(**{
@@ -66,7 +65,45 @@ def content_filter(node, content):
     with input_file.open("w") as f:
         f.write(content)
 
-    subprocess.run(cmd, shell=True)
+    return cmd, output_file
 
+
+def read_output(output_file):
+    """Returns the contents of ``output_file``"""
     with output_file.open("r") as f:
         return f.read()
+
+
+def content_filter(node, content):
+    """
+    This is the actual content filter called by :class:`exhibition.main.Node`
+    on appropriate nodes.
+
+    :param node:
+        The node being rendered
+    :param content:
+        The content of the node, stripped of any YAML frontmatter
+    """
+    with TemporaryDirectory() as tmp_dir:
+        cmd, output_file = prepare_command(node, content, tmp_dir)
+
+        subprocess.run(cmd, shell=True)
+
+        return read_output(output_file)
+
+
+async def async_content_filter(node, content):
+    """
+    Same as :func:`content_filter`, but runs the command without blocking the
+    event loop. Used when rendering with ``exhibit gen --mode async``.
+    """
+    with TemporaryDirectory() as tmp_dir:
+        cmd, output_file = await run_in_thread(prepare_command, node, content, tmp_dir)
+
+        process = await asyncio.create_subprocess_shell(cmd)
+        await process.wait()
+        if process.returncode != 0:
+            raise RuntimeError('External command died with exitcode "%s": %s'
+                               % (process.returncode, cmd))
+
+        return await run_in_thread(read_output, output_file)
@@ -30,8 +30,15 @@ To use, add the following to your configuration file:
 """
 
 from datetime import datetime, timezone
-
-from jinja2 import Environment, FileSystemLoader, pass_context
+import logging
+import os
+import pathlib
+import posixpath
+import threading
+import weakref
+
+from jinja2 import (ChoiceLoader, Environment, FileSystemBytecodeCache, FileSystemLoader,
+                    ModuleLoader, Undefined, pass_context)
 from jinja2.exceptions import TemplateRuntimeError
 from jinja2.ext import Extension
 from jinja2.nodes import CallBlock, Const, ContextReference
@@ -39,10 +46,13 @@ from markdown import markdown as md_func
 from pypandoc import convert_text as pandoc_func
 from typogrify.filters import amp, caps, initial_quotes, smartypants, titlecase, typogrify, widont
 
+from exhibition.cache import RENDER_CACHE_META, TEMPLATE_CACHE_DIR_NAME
 from exhibition.filters.base import BaseFilter
 from exhibition.filters.markdown import DEFAULT_MD_KWARGS, MARKDOWN_META_CONFIG
 from exhibition.filters.pandoc import (DEFAULT_PANDOC_KWARGS, PANDOC_META_CONFIG,
                                        PandocMissingFormatError)
+from exhibition.node import DEPENDS_ON_TEMPLATE, add_dependency
+from exhibition.state import get_cache_dir
 
 EXTENDS_TEMPLATE_TEMPLATE = """{%% extends "%s" %%}
 """
@@ -55,6 +65,11 @@ DEFAULT_GLOB = "*.html"
 
 NODE_TMPL_VAR = "node"
 
+TEMPLATE_CACHE_META = "template_cache_dir"
+COMPILED_TEMPLATES_META = "compiled_templates"
+
+logger = logging.getLogger(__name__)
+
 
 def metasort(nodes, key=None, reverse=False):
     """
@@ -164,6 +179,67 @@ class Mark(Extension):
         return out
 
 
+class CountingBytecodeCache(FileSystemBytecodeCache):
+    """
+    A :class:`jinja2.FileSystemBytecodeCache` that keeps count of how many
+    templates were found in the cache and how many had to be compiled.
+    """
+    def __init__(self, directory, pattern="__jinja2_%s.cache"):
+        pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+        super().__init__(str(directory), pattern)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_cache_key(self, name, filename=None):
+        """Templates are identified by their path relative to the current
+        directory, so that the cache can be used from anywhere"""
+        if filename is not None:
+            try:
+                filename = pathlib.Path(os.path.relpath(filename)).as_posix()
+            except ValueError:
+                # on another drive
+                pass
+        return super().get_cache_key(name, filename)
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        with self._lock:
+            if bucket.code is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+
+class DependencyTrackingEnvironment(Environment):
+    """
+    A :class:`jinja2.Environment` that records every template it is asked for
+    as a dependency of the node being rendered. This covers ``{% extends %}``,
+    ``{% include %}``, ``{% import %}`` and the ``extends`` meta key, as well
+    as any templates they load in turn.
+
+    Templates that could not be found are recorded too, as adding them could
+    change what is rendered.
+    """
+    def track_template(self, name, parent=None):
+        if not isinstance(name, str):
+            return
+        if parent is not None:
+            name = self.join_path(name, parent)
+        add_dependency(DEPENDS_ON_TEMPLATE, posixpath.normpath(name))
+
+    def get_template(self, name, parent=None, globals=None):
+        self.track_template(name, parent)
+        return super().get_template(name, parent, globals)
+
+    def select_template(self, names, parent=None, globals=None):
+        if not isinstance(names, Undefined):
+            names = list(names)
+            for name in names:
+                self.track_template(name, parent)
+        return super().select_template(names, parent, globals)
+
+
 class JinjaFilter(BaseFilter):
     """
     This is the actual content filter called by :class:`exhibition.main.Node`
@@ -174,7 +250,9 @@ class JinjaFilter(BaseFilter):
     :param content:
         The content of the node, stripped of any YAML frontmatter
     """
+    environment_class = DependencyTrackingEnvironment
     template_loader_class = FileSystemLoader
+    bytecode_cache_class = CountingBytecodeCache
     extensions = (RaiseError, Mark)
 
     def __init__(self, extra_filters=None):
@@ -185,17 +263,114 @@ class JinjaFilter(BaseFilter):
         else:
             self.extra_filters = extra_filters
 
+        # environments are shared between nodes of the same tree, so they
+        # only live as long as the root node does
+        self.environments = weakref.WeakKeyDictionary()
+        self.bytecode_caches = weakref.WeakKeyDictionary()
+        self.environments_lock = threading.RLock()
+
     def get_environment(self):
         """Get Jinja environment
 
-        Sets up template loader and extensions
+        Sets up template loader and extensions. Templates are not expected to
+        change during a build, so auto reloading is disabled.
         """
-        return Environment(
-            loader=self.template_loader_class(self.node.meta["templates"]),
+        return self.environment_class(
+            loader=self.get_loader(),
             extensions=self.extensions,
             autoescape=True,
+            auto_reload=False,
+            bytecode_cache=self.get_bytecode_cache(),
+        )
+
+    def get_source_loader(self):
+        """Get a loader for the templates found in ``templates``"""
+        return self.template_loader_class(self.node.meta["templates"])
+
+    def get_loader(self):
+        """Get template loader
+
+        If ``compiled_templates`` is set, templates are loaded from there
+        first, falling back to the loader from :meth:`get_source_loader` for
+        any templates that weren't compiled.
+        """
+        loader = self.get_source_loader()
+        compiled = self.node.meta.get(COMPILED_TEMPLATES_META)
+        if compiled is not None:
+            compiled = str(pathlib.Path(compiled).resolve())
+            loader = ChoiceLoader([ModuleLoader(compiled), loader])
+
+        return loader
+
+    def get_template_cache_dir(self):
+        """Returns the absolute path of the directory compiled templates are
+        cached in, or ``None`` if they aren't
+
+        This is ``template_cache_dir`` if set, otherwise a directory in
+        ``cache_dir`` if ``render_cache`` is set.
+        """
+        cache_dir = self.node.meta.get(TEMPLATE_CACHE_META)
+        if cache_dir is None and self.node.meta.get(RENDER_CACHE_META):
+            cache_dir = get_cache_dir(self.node.meta) / TEMPLATE_CACHE_DIR_NAME
+        if cache_dir is None:
+            return None
+        return str(pathlib.Path(cache_dir).resolve())
+
+    def get_bytecode_cache(self):
+        """Get the bytecode cache for the current node
+
+        Returns ``None`` unless there is a directory to cache templates in,
+        see :meth:`get_template_cache_dir`. Nodes in the same tree that use
+        the same directory share a cache object.
+        """
+        cache_dir = self.get_template_cache_dir()
+        if cache_dir is None:
+            return None
+
+        with self.environments_lock:
+            build_caches = self.bytecode_caches.setdefault(self.node.root_node, {})
+            if cache_dir not in build_caches:
+                build_caches[cache_dir] = self.bytecode_cache_class(cache_dir)
+
+            return build_caches[cache_dir]
+
+    def get_environment_key(self):
+        """Returns a key that identifies which environment the current node
+        should use. Nodes with the same key share an environment."""
+        templates = self.node.meta["templates"]
+        if not isinstance(templates, (list, tuple)):
+            templates = [templates]
+
+        compiled = self.node.meta.get(COMPILED_TEMPLATES_META)
+        if compiled is not None:
+            compiled = str(pathlib.Path(compiled).resolve())
+
+        return (
+            tuple(str(pathlib.Path(tmpl).resolve()) for tmpl in templates),
+            tuple(self.extensions),
+            self.get_template_cache_dir(),
+            compiled,
         )
 
+    def get_shared_environment(self):
+        """Get the Jinja environment for the current build
+
+        Environments are created via :meth:`get_environment` the first time
+        they're needed and then reused for every node in the same tree that
+        has the same key. This means templates are only loaded and compiled
+        once per build.
+        """
+        key = self.get_environment_key()
+        with self.environments_lock:
+            build_envs = self.environments.setdefault(self.node.root_node, {})
+            env = build_envs.get(key)
+            if env is None:
+                env = self.get_environment()
+                self.add_template_filters(env)
+                build_envs[key] = env
+
+        return env
+
     def add_template_filters(self, env):
         """Add template filters to current Environment"""
         env.filters["pandoc"] = pandoc
@@ -243,12 +418,45 @@ class JinjaFilter(BaseFilter):
 
     def content_filter(self):
         """Bring everything together and render the template"""
-        env = self.get_environment()
-        self.add_template_filters(env)
+        env = self.get_shared_environment()
 
         template = env.from_string(self.prepare_content())
 
         return template.render(self.get_context_data())
 
+    def compile_templates(self, node, target):
+        """Compile every template found in ``templates`` into Python modules
+
+        :param node:
+            The node whose meta should be used to find templates, usually the
+            root node
+        :param target:
+            Where to write the compiled templates. If it ends with ``.zip``,
+            a zip file is created. Otherwise it is a directory.
+        """
+        self.node = node
+        env = self.get_environment()
+        self.add_template_filters(env)
+        env = env.overlay(loader=self.get_source_loader(), bytecode_cache=None)
+
+        target = str(target)
+        zip_method = "deflated" if target.endswith(".zip") else None
+        env.compile_templates(target, zip=zip_method, log_function=logger.info)
+
+    def templates_changed(self, root_node):
+        """Templates are cached by each environment and are not reloaded
+        automatically, so clear the caches of environments used by
+        ``root_node``"""
+        with self.environments_lock:
+            for env in self.environments.get(root_node, {}).values():
+                if env.cache is not None:
+                    env.cache.clear()
+
+    def build_finished(self, root_node):
+        """Report template cache hits and misses for the build"""
+        for cache_dir, cache in self.bytecode_caches.get(root_node, {}).items():
+            logger.info("Template cache %s: %s hits, %s misses",
+                        cache_dir, cache.hits, cache.misses)
+
 
 content_filter = JinjaFilter()
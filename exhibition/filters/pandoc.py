@@ -33,7 +33,11 @@ To use, add the following to your configuration file:
 ``format`` can be any format that Pandoc supports
 """
 
-from pypandoc import convert_text
+import asyncio
+
+from pypandoc import convert_text, get_pandoc_path, normalize_format
+
+from exhibition.locks import run_in_thread
 
 DEFAULT_GLOB = "*.html"
 
@@ -43,11 +47,46 @@ DEFAULT_PANDOC_KWARGS = {
     "to": "html",
 }
 
+# pandoc_config keys that async_content_filter can turn into command line
+# arguments itself, anything else is passed to pypandoc in a thread
+ASYNC_PANDOC_KWARGS = {"to", "format", "extra_args", "filters", "encoding"}
+
 
 class PandocMissingFormatError(TypeError):
     pass
 
 
+def get_pandoc_kwargs(node):
+    """Returns the keyword arguments for :func:`pypandoc.convert_text`"""
+    kwargs = DEFAULT_PANDOC_KWARGS.copy()
+    kwargs.update(node.meta.get(PANDOC_META_CONFIG, {}))
+    if kwargs.get("format") is None:
+        raise PandocMissingFormatError("You must specify a format, see documentation")
+    return kwargs
+
+
+def get_pandoc_args(kwargs):
+    """Returns the Pandoc command line for ``kwargs``, the same as
+    :func:`pypandoc.convert_text` would run"""
+    args = [
+        get_pandoc_path(),
+        "--from=" + normalize_format(kwargs["format"]),
+        "--to=" + normalize_format(kwargs["to"]),
+    ]
+    args.extend(kwargs.get("extra_args", ()))
+
+    filters = kwargs.get("filters") or []
+    if isinstance(filters, str):
+        filters = filters.split()
+    for fltr in filters:
+        if fltr.endswith(".lua"):
+            args.append("--lua-filter=" + fltr)
+        else:
+            args.append("--filter=" + fltr)
+
+    return args
+
+
 def content_filter(node, content):
     """
     This is the actual content filter called by :class:`exhibition.main.Node`
@@ -58,8 +97,31 @@ def content_filter(node, content):
     :param content:
         The content of the node, stripped of any YAML frontmatter
     """
-    kwargs = DEFAULT_PANDOC_KWARGS.copy()
-    kwargs.update(node.meta.get(PANDOC_META_CONFIG, {}))
-    if kwargs.get("format") is None:
-        raise PandocMissingFormatError("You must specify a format, see documentation")
-    return convert_text(content, **kwargs)
+    return convert_text(content, **get_pandoc_kwargs(node))
+
+
+async def async_content_filter(node, content):
+    """
+    Same as :func:`content_filter`, but runs Pandoc without blocking the event
+    loop. Used when rendering with ``exhibit gen --mode async``.
+    """
+    kwargs = get_pandoc_kwargs(node)
+    if not ASYNC_PANDOC_KWARGS.issuperset(kwargs):
+        return await run_in_thread(content_filter, node, content)
+
+    encoding = kwargs.get("encoding", "utf-8")
+    # finding Pandoc can run it the first time
+    args = await run_in_thread(get_pandoc_args, kwargs)
+
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate(content.encode(encoding))
+    if process.returncode != 0:
+        raise RuntimeError('Pandoc died with exitcode "%s" during conversion: %s'
+                           % (process.returncode, stderr.decode("utf-8", errors="replace")))
+
+    return stdout.decode(encoding)
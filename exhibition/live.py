@@ -0,0 +1,187 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+"""
+Render pages on demand for ``exhibit serve --live``
+
+Nothing is written to ``deploy_path``. Each request is matched to a node by
+its :attr:`Node.full_url` and only that node, plus whatever it reads, is
+rendered.
+"""
+
+from collections import OrderedDict, defaultdict
+import threading
+
+from .locks import concurrency_limits
+from .state import node_key
+
+DEFAULT_CACHE_SIZE = 256
+
+
+class LiveRenderer:
+    """
+    Renders nodes from a :class:`exhibition.watch.WatchedTree` and keeps the
+    results in memory
+
+    The most recently used ``cache_size`` responses are kept. When a response
+    is dropped to make room, its node forgets its content too. Nodes that were
+    only read by other nodes, such as posts listed on an index page, keep
+    theirs until they change.
+
+    When a source file or template changes, the responses for it and for any
+    node that read it (see :attr:`Node.dependencies`) are thrown away, as is
+    anything those nodes had worked out.
+    """
+    def __init__(self, tree, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :param tree:
+            A :class:`exhibition.watch.WatchedTree`
+        :param cache_size:
+            The number of rendered nodes to keep
+        """
+        self.tree = tree
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # full URLs of files, keyed by the node_key of their directory
+        self._urls = {}
+        self._lock = threading.Lock()
+        # bumped on every change, so renders that started before it aren't
+        # cached
+        self._generation = 0
+        tree.listeners.append(self.invalidate)
+
+    def resolve(self, path):
+        """
+        Returns the node for ``path``, or ``None`` if there isn't one
+
+        :param path:
+            The path of a URL relative to ``base_url``, without leading or
+            trailing slashes
+        """
+        root_node = self.tree.root_node
+        if not path:
+            return root_node
+
+        parts = path.split("/")
+        if any(part in ("", ".", "..") for part in parts):
+            return None
+
+        parent = root_node
+        for part in parts[:-1]:
+            parent = parent.children.get(part)
+            if parent is None or parent.is_leaf:
+                return None
+
+        name = parts[-1]
+        child = parent.children.get(name)
+        if child is not None and not (child.is_leaf and child.cache_bust):
+            return child
+
+        # names with stripped extensions or cache busting
+        return self._dir_urls(parent).get(parent.full_url + name)
+
+    def _dir_urls(self, parent):
+        """Returns a dictionary of the files in ``parent`` keyed by their
+        :attr:`Node.full_url`, which is only built once per change to the
+        tree"""
+        key = node_key(parent)
+        with self._lock:
+            urls = self._urls.get(key)
+            generation = self._generation
+        if urls is not None:
+            return urls
+
+        urls = {}
+        for child in parent.children.values():
+            if child.is_leaf:
+                urls.setdefault(child.full_url, child)
+        with self._lock:
+            if generation == self._generation:
+                self._urls[key] = urls
+        return urls
+
+    def render(self, node):
+        """Returns the content of ``node`` as bytes"""
+        key = node_key(node)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key][1]
+            generation = self._generation
+
+        with concurrency_limits(node.filter_limits()):
+            content = node.content
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+
+        evicted = []
+        with self._lock:
+            if generation == self._generation:
+                self._cache[key] = (node, content)
+                while len(self._cache) > self.cache_size:
+                    evicted.append(self._cache.popitem(last=False)[1][0])
+
+        for item in evicted:
+            # anything that read it must still be invalidated when what it
+            # read changes
+            item.forget(keep_dependencies=True)
+        return content
+
+    def invalidate(self, changed):
+        """
+        Forget anything that depends on ``changed``
+
+        :param changed:
+            A set of dependencies, as in :attr:`Node.dependencies`, or
+            ``None`` to forget everything
+        """
+        with self._lock:
+            self._generation += 1
+            self._urls.clear()
+            if changed is None:
+                self._cache.clear()
+                return
+
+        nodes = {}
+        dependents = defaultdict(set)
+        for item in self.tree.root_node.walk():
+            nodes[node_key(item)] = item
+            for dependency in item.dependencies or ():
+                dependents[dependency].add(item)
+
+        stale = {key for kind, key in changed if kind == "node"}
+        queue = list(changed)
+        # the URLs of removed or cache busted nodes have changed too
+        queue.extend(("url", key) for key in stale
+                     if key not in nodes or nodes[key].is_cache_busted)
+        while queue:
+            for item in dependents.pop(queue.pop(), ()):
+                key = node_key(item)
+                if key not in stale:
+                    stale.add(key)
+                    item.forget()
+                    queue.append(("node", key))
+                    if item.is_cache_busted:
+                        queue.append(("url", key))
+
+        with self._lock:
+            for key in stale:
+                self._cache.pop(key, None)
@@ -0,0 +1,237 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+"""
+Locking primitives that allow nodes to be rendered by several threads at once
+"""
+
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
+import asyncio
+import contextvars
+import functools
+import threading
+import weakref
+
+# one condition is shared by all node locks, it protects their owners and the
+# table of who is waiting for what
+_condition = threading.Condition()
+_waiting_for = {}
+
+_local = threading.local()
+
+# set by asyncio tasks, copied into the threads they run work in
+_context_owner = contextvars.ContextVar("exhibition_lock_owner", default=None)
+
+
+def current_owner():
+    """Returns a token that identifies the current thread, or the current
+    context if :func:`new_owner` has been called"""
+    owner = _context_owner.get()
+    if owner is not None:
+        return owner
+
+    try:
+        return _local.owner
+    except AttributeError:
+        _local.owner = object()
+        return _local.owner
+
+
+def new_owner():
+    """
+    Give the current context its own owner token
+
+    Call this at the start of an :mod:`asyncio` task so that locks are owned
+    by the task rather than the thread running the event loop. Work passed to
+    :func:`run_in_thread` acts as the same owner.
+    """
+    _context_owner.set(object())
+
+
+async def run_in_thread(func, *args):
+    """Run ``func`` in the event loop's default executor with a copy of the
+    current context, much like :func:`asyncio.to_thread`"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(ctx.run, func, *args))
+
+
+class NodeLock:
+    """
+    A re-entrant lock that refuses to deadlock
+
+    Nodes can read from each other while they're being rendered, so two
+    threads could end up waiting for each other. Rather than block forever,
+    :meth:`acquire` returns ``False`` if waiting would complete a cycle. The
+    caller should then carry on without the lock, just as a single thread
+    would have done.
+    """
+    def __init__(self):
+        self._owner = None
+        self._count = 0
+
+    def acquire(self):
+        """Acquire the lock, returns ``False`` if that would deadlock"""
+        owner = current_owner()
+        with _condition:
+            while True:
+                if self._owner is None or self._owner is owner:
+                    self._owner = owner
+                    self._count += 1
+                    return True
+                elif self._would_deadlock(owner):
+                    return False
+
+                _waiting_for[owner] = self
+                try:
+                    _condition.wait()
+                finally:
+                    del _waiting_for[owner]
+
+    def _would_deadlock(self, owner):
+        lock = self
+        # a chain can't be longer than the number of waiting owners
+        for _ in range(len(_waiting_for) + 1):
+            if lock._owner is owner:
+                return True
+            lock = _waiting_for.get(lock._owner)
+            if lock is None:
+                return False
+        return False
+
+    def is_owned(self):
+        """Returns ``True`` if the current thread or task holds the lock"""
+        return self._owner is current_owner()
+
+    def release(self):
+        with _condition:
+            self._count -= 1
+            if self._count == 0:
+                self._owner = None
+                _condition.notify_all()
+
+    @contextmanager
+    def held(self):
+        """Context manager that holds the lock, if that is possible without
+        deadlocking"""
+        acquired = self.acquire()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release()
+
+
+class locked_cached_property:
+    """
+    Like :func:`functools.cached_property`, but the value is computed while
+    holding the instance's ``_lock`` (a :class:`NodeLock`). If several
+    threads ask for the value at the same time, it is only computed once.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.attrname = None
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner, name):
+        self.attrname = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        cache = instance.__dict__
+        try:
+            return cache[self.attrname]
+        except KeyError:
+            pass
+
+        with instance._lock.held():
+            try:
+                return cache[self.attrname]
+            except KeyError:
+                value = self.func(instance)
+                cache[self.attrname] = value
+                return value
+
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+@contextmanager
+def concurrency_limit(name, limit):
+    """
+    Allow at most ``limit`` threads to enter this context for ``name`` at
+    once. Nested use for the same ``name`` in the same thread is not limited
+    again. If ``limit`` is ``None`` there is no limit.
+    """
+    held = getattr(_local, "limits", None)
+    if held is None:
+        held = _local.limits = set()
+
+    if limit is None or name in held:
+        yield
+        return
+
+    with _semaphores_lock:
+        key = (name, limit)
+        if key not in _semaphores:
+            _semaphores[key] = threading.BoundedSemaphore(limit)
+        semaphore = _semaphores[key]
+
+    with semaphore:
+        held.add(name)
+        try:
+            yield
+        finally:
+            held.discard(name)
+
+
+@contextmanager
+def concurrency_limits(limits):
+    """Enter :func:`concurrency_limit` for each ``(name, limit)`` in
+    ``limits``, in order"""
+    with ExitStack() as stack:
+        for name, limit in limits:
+            stack.enter_context(concurrency_limit(name, limit))
+        yield
+
+
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
+@asynccontextmanager
+async def async_concurrency_limits(limits):
+    """
+    Like :func:`concurrency_limits`, but for tasks running on the same event
+    loop. Limits are shared by tasks, not threads, so nested use for the same
+    name in the same task would wait on itself.
+    """
+    loop_semaphores = _async_semaphores.setdefault(asyncio.get_running_loop(), {})
+    async with AsyncExitStack() as stack:
+        for key in limits:
+            if key[1] is None:
+                continue
+            if key not in loop_semaphores:
+                loop_semaphores[key] = asyncio.Semaphore(key[1])
+            await stack.enter_async_context(loop_semaphores[key])
+        yield
@@ -0,0 +1,123 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+"""
+Manifests of deployed files
+
+If ``manifest_path`` is set, every build writes a JSON file listing each file
+in ``deploy_path`` by URL, with its path relative to ``deploy_path``, its size
+and a hash of its contents. Comparing the manifests of two builds with
+``exhibit diff`` gives the URLs that were added, changed or removed, so only
+those need to be uploaded or purged from a cache.
+"""
+
+import json
+import os
+import pathlib
+
+from . import compress
+from .state import file_digest
+
+MANIFEST_PATH_META = "manifest_path"
+MANIFEST_VERSION = 1
+
+ADDED = "A"
+MODIFIED = "M"
+DELETED = "D"
+
+
+def node_hash(node):
+    """Returns :attr:`Node.content_hash` if it is already known, otherwise
+    the output of ``node`` is hashed rather than rendering it again"""
+    if "content_hash" in node.__dict__ or "_content" in node.__dict__:
+        return node.content_hash
+    return file_digest(node.full_path)
+
+
+def from_tree(root_node):
+    """
+    Returns a manifest of every file rendered from the tree at ``root_node``
+
+    This is a dictionary keyed by :attr:`Node.full_url`, each value being a
+    dictionary with the keys ``path``, ``size`` and ``hash``. Compressed copies
+    are listed by the URL of their path in ``deploy_path``.
+    """
+    deploy_path = root_node.full_path
+    files = {}
+    for item in root_node.walk():
+        if not item.is_leaf:
+            continue
+        files[item.full_url] = {
+            "path": os.path.relpath(item.full_path, deploy_path),
+            "size": os.stat(item.full_path).st_size,
+            "hash": node_hash(item),
+        }
+        for path in compress.compressed_paths(item.full_path, compress.node_formats(item)):
+            rel_path = os.path.relpath(path, deploy_path)
+            files[root_node.full_url + pathlib.PurePath(rel_path).as_posix()] = {
+                "path": rel_path,
+                "size": os.stat(path).st_size,
+                "hash": file_digest(path),
+            }
+
+    return files
+
+
+def save(path, files):
+    """Write manifest ``files`` to ``path``, replacing it in a single step"""
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as manifest_file:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, manifest_file,
+                  indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load(path):
+    """Returns the files listed in the manifest at ``path``. Raises
+    :class:`ValueError` if it isn't a manifest this version can read."""
+    with open(path) as manifest_file:
+        data = json.load(manifest_file)
+
+    if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+        raise ValueError("%s is not a version %s manifest" % (path, MANIFEST_VERSION))
+    return data["files"]
+
+
+def diff(old, new):
+    """
+    Returns a sorted list of ``(status, url)`` tuples for every URL that
+    differs between manifests ``old`` and ``new``
+
+    ``status`` is one of :data:`ADDED`, :data:`MODIFIED` or :data:`DELETED`.
+    A file is modified if its hash, size or path has changed.
+    """
+    changes = []
+    for url in sorted(set(old) | set(new)):
+        if url not in old:
+            changes.append((ADDED, url))
+        elif url not in new:
+            changes.append((DELETED, url))
+        elif old[url] != new[url]:
+            changes.append((MODIFIED, url))
+
+    return changes
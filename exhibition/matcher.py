@@ -0,0 +1,160 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+"""
+Glob pattern matching for nodes
+
+Options such as ``ignore``, ``filter_glob`` and ``cache_bust_glob`` take glob
+patterns that are relative to the directory a node is in. Patterns are
+compiled to regular expressions once and no filesystem access is needed to
+test a node against them.
+
+Patterns follow :meth:`pathlib.Path.glob` as it is in Python 3.11 and 3.12,
+so they behave the same on every supported version of Python:
+
+- ``*``, ``?`` and ``[...]`` match within a single name, as in
+  :mod:`fnmatch`. Matching is case sensitive, except on Windows
+- A pattern ending with ``/`` only matches directories
+- ``**`` matches directories but never files, so ``**`` and ``**/**`` match
+  every directory, ``**/*.html`` matches ``*.html`` and ``sub/**`` matches
+  the directory ``sub``
+- ``.`` parts and empty parts are ignored, so ``./a.html`` and ``a.html/.``
+  both match ``a.html``
+- Patterns containing ``..``, or that need a directory between the parent
+  and a match, such as ``sub/*``, never match
+"""
+
+from functools import lru_cache
+import fnmatch
+import os
+import re
+
+RECURSIVE_PART = "**"
+CURRENT_DIR_PART = "."
+PARENT_DIR_PART = ".."
+
+_REGEX_FLAGS = re.IGNORECASE if os.name == "nt" else 0
+
+
+class GlobPattern:
+    """
+    A compiled glob pattern that can be tested against the names of the
+    direct children of a directory
+    """
+    def __init__(self, pattern):
+        """
+        :param pattern:
+            A glob pattern, as accepted by :meth:`pathlib.Path.glob`
+
+        If ``pattern`` is empty a :class:`ValueError` is raised and if it is
+        absolute a :class:`NotImplementedError` is raised, just as
+        :meth:`pathlib.Path.glob` would.
+        """
+        if not pattern:
+            raise ValueError("Unacceptable pattern: {!r}".format(pattern))
+        elif pattern.startswith("/"):
+            raise NotImplementedError("Non-relative patterns are unsupported")
+
+        self.pattern = pattern
+        self.dir_only = pattern.endswith("/")
+        self.regex = None
+
+        parts = [part for part in pattern.split("/") if part not in ("", CURRENT_DIR_PART)]
+        if not parts or PARENT_DIR_PART in parts:
+            # can never match a child of the directory
+            self.never = True
+            return
+
+        self.never = False
+        named = [idx for idx, part in enumerate(parts) if part != RECURSIVE_PART]
+        if not named:
+            # only recursive parts, which match directories
+            self.dir_only = True
+        elif len(named) > 1:
+            # would need at least one directory between the parent and a match
+            self.never = True
+        else:
+            idx = named[0]
+            if idx < len(parts) - 1:
+                # trailing "**" matches the directory itself
+                self.dir_only = True
+            self.regex = re.compile(fnmatch.translate(parts[idx]), _REGEX_FLAGS)
+
+    def match(self, name, is_dir=False):
+        """
+        Returns ``True`` if a child called ``name`` matches this pattern
+
+        :param name:
+            The file name of the child
+        :param is_dir:
+            Whether the child is a directory
+        """
+        if self.never or (self.dir_only and not is_dir):
+            return False
+        elif self.regex is None:
+            return True
+        else:
+            return self.regex.match(name) is not None
+
+    def __repr__(self):
+        return "<%s: %s>" % (self.__class__.__name__, self.pattern)
+
+
+@lru_cache(maxsize=None)
+def compile_glob(pattern):
+    """Returns a :class:`GlobPattern` for ``pattern``, patterns are only
+    compiled once"""
+    return GlobPattern(pattern)
+
+
+@lru_cache(maxsize=None)
+def _compile_globs(globs):
+    return tuple(compile_glob(glob) for glob in globs)
+
+
+def compile_globs(globs):
+    """
+    Returns a tuple of :class:`GlobPattern`
+
+    :param globs:
+        A single pattern, a list or tuple of patterns, or ``None``. This is
+        the same as what is accepted by ``ignore``, ``filter_glob``, etc.
+    """
+    if globs is None:
+        globs = ()
+    elif not isinstance(globs, (list, tuple)):
+        globs = (globs,)
+
+    return _compile_globs(tuple(globs))
+
+
+def match_globs(globs, name, is_dir=False):
+    """
+    Returns ``True`` if ``name`` matches any of ``globs``
+
+    :param globs:
+        Anything accepted by :func:`compile_globs`
+    :param name:
+        The file name of the child
+    :param is_dir:
+        Whether the child is a directory
+    """
+    return any(pattern.match(name, is_dir) for pattern in compile_globs(globs))
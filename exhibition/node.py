@@ -19,16 +19,24 @@
 #
 ##
 
-from collections import OrderedDict
-from functools import cached_property
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from importlib import import_module
+from stat import S_ISDIR, S_ISREG
+import contextvars
 import hashlib
+import io
+import os
 import pathlib
 
 from ruamel.yaml import YAML
 from ruamel.yaml.error import FileMark, MarkedYAMLError
 
+from . import cache, compress, deploy, matcher
 from .config import Config
+from .locks import (NodeLock, async_concurrency_limits, concurrency_limits, locked_cached_property,
+                    run_in_thread)
 
 yaml_parser = YAML(typ="safe")
 
@@ -42,11 +50,71 @@ DEFAULT_INDEX_FILE = "index.html"
 DEFAULT_DIR_MODE = 0o755
 DEFAULT_FILE_MODE = 0o644
 
+FILTER_CONCURRENCY_META = "filter_concurrency"
+
+# kinds of dependency recorded by Node.dependencies
+DEPENDS_ON_NODE = "node"
+DEPENDS_ON_CHILDREN = "children"
+DEPENDS_ON_TEMPLATE = "template"
+DEPENDS_ON_URL = "url"
+
+# the node whose content is being worked out in the current context
+_reader = contextvars.ContextVar("exhibition_reader", default=None)
+
+
+def add_dependency(kind, key):
+    """
+    Record that the node whose content is being worked out depends on
+    something other than a node, such as a template. Does nothing if no
+    node's content is being worked out.
+
+    :param kind:
+        What sort of thing ``key`` is, e.g. ``"template"``
+    :param key:
+        A string that identifies the thing between builds
+    """
+    reader = _reader.get()
+    if reader is not None:
+        reader._dependencies.add((kind, key))
+
 
 class FrontMatterNotFound(Exception):
     pass
 
 
+def _untracked(func, *args):
+    """Call ``func`` without attributing what it reads to any node"""
+    if _reader.get() is None:
+        return func(*args)
+    token = _reader.set(None)
+    try:
+        return func(*args)
+    finally:
+        _reader.reset(token)
+
+
+@contextmanager
+def _reading_as(node):
+    """Attribute reads of other nodes to ``node``, or to nothing if ``node``
+    is ``None``"""
+    token = _reader.set(node)
+    try:
+        yield
+    finally:
+        _reader.reset(token)
+
+
+def _run_now(func, *args):
+    """Like :meth:`concurrent.futures.Executor.submit`, but runs ``func``
+    straight away"""
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as exp:
+        future.set_exception(exp)
+    return future
+
+
 class Node:
     """
     A node represents a file or directory
@@ -56,7 +124,7 @@ class Node:
     _meta_header = "---\n"
     _meta_footer = "---\n"
 
-    def __init__(self, path, parent, meta=None):
+    def __init__(self, path, parent, meta=None, stat=None):
         """
         :param path:
             A :class:`pathlib.Path` that is either the ``content_path`` or a
@@ -66,12 +134,24 @@ class Node:
         :param meta:
             A dict-like object that will be passed to a :class:`Config`
             instance
+        :param stat:
+            A :class:`os.stat_result` for ``path``, or ``None`` if the path
+            hasn't been stat'ed yet
         """
         self.path_obj = path
         self.parent = parent
-        self.children = OrderedDict()
-
-        self.is_leaf = self.path_obj.is_file()
+        self._children = OrderedDict()
+        self._stat = stat
+        self._lock = NodeLock()
+        self._dependencies = None
+        self._key = None
+        # content_hash of what is already at full_path, if known
+        self.deployed_hash = None
+
+        if stat is None:
+            self.is_leaf = self.path_obj.is_file()
+        else:
+            self.is_leaf = S_ISREG(stat.st_mode)
 
         try:
             parent_meta = self.parent.meta
@@ -89,7 +169,7 @@ class Node:
             self.root_node = self
 
     @classmethod
-    def from_path(cls, path, parent=None, meta=None):
+    def from_path(cls, path, parent=None, meta=None, jobs=None):
         """
         Given a :class:`pathlib.Path`, create a Node from that path as well as
         any children. Children are loaded in Unicode codepoint order - this
@@ -107,38 +187,171 @@ class Node:
         :param meta:
             A dict-like object that will be passed to a :class:`Config`
             instance
+        :param jobs:
+            The number of threads used to read directories. If ``None`` or
+            ``1``, directories are read one at a time.
         """
         # path should be a pathlib object
-        assert path.is_file() or path.is_dir()
+        try:
+            stat = path.stat()
+        except OSError:
+            stat = None
+        assert stat is not None and (S_ISREG(stat.st_mode) or S_ISDIR(stat.st_mode))
 
-        node = cls(path, parent=parent, meta=meta)
+        node = cls(path, parent=parent, meta=meta, stat=stat)
 
-        if path.is_dir():
-            children = []
+        if not node.is_leaf:
+            if jobs is not None and jobs > 1:
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    cls._load_children(node, executor.submit)
+            else:
+                cls._load_children(node, _run_now)
 
-            dir_files = sorted(path.iterdir(), key=lambda p: p.name)
-            for child in dir_files:
-                if child.name in cls._meta_names and child.is_file():
-                    with child.open() as co:
-                        node.meta.load(co)
-                else:
-                    children.append(child)
+        return node
+
+    @classmethod
+    def _load_children(cls, node, submit):
+        """
+        Load all descendants of ``node``
 
-            for child in children:
-                ignored = False
-                globs = node.meta.get("ignore", [])
+        Directories are read via ``submit``, which should behave like
+        :meth:`concurrent.futures.Executor.submit`. The tree is assembled in
+        the calling thread as each directory is read, in the order that
+        directories were found, so the resulting tree does not depend on how
+        long each directory took to read.
+        """
+        pending = deque([(node, submit(cls._scan_dir, node.path_obj))])
+        while pending:
+            node, future = pending.popleft()
+            meta_files, entries = future.result()
 
-                if not isinstance(globs, (list, tuple)):
-                    globs = [globs]
+            for meta_file in meta_files:
+                node.meta.load(meta_file)
 
-                for glob in globs:
-                    if child in path.glob(glob):
-                        ignored = True
-                        break
-                if not ignored:
-                    cls.from_path(child, node)
+            globs = node.meta.get("ignore", [])
+            for name, entry_stat in entries:
+                is_dir = entry_stat is not None and S_ISDIR(entry_stat.st_mode)
+                if matcher.match_globs(globs, name, is_dir):
+                    continue
 
-        return node
+                assert entry_stat is not None and (is_dir or S_ISREG(entry_stat.st_mode))
+                child = cls(node.path_obj / name, parent=node, stat=entry_stat)
+                if is_dir:
+                    pending.append((child, submit(cls._scan_dir, child.path_obj)))
+
+    @classmethod
+    def _scan_dir(cls, path):
+        """
+        Read a directory with :func:`os.scandir`, each entry is only stat'ed
+        once
+
+        Returns a list of meta files as file-like objects and a list of
+        ``(name, stat)`` tuples for everything else, both sorted by name.
+        ``stat`` is ``None`` if the entry could not be stat'ed, e.g. a broken
+        symlink.
+        """
+        meta_files = []
+        entries = []
+
+        with os.scandir(path) as dir_iter:
+            dir_entries = sorted(dir_iter, key=lambda entry: entry.name)
+
+        for entry in dir_entries:
+            try:
+                entry_stat = entry.stat()
+            except OSError:
+                entry_stat = None
+
+            if entry.name in cls._meta_names and entry_stat is not None \
+                    and S_ISREG(entry_stat.st_mode):
+                with open(entry.path) as co:
+                    meta_file = io.StringIO(co.read())
+                # keep the file name for error messages
+                meta_file.name = entry.path
+                meta_files.append(meta_file)
+            else:
+                entries.append((entry.name, entry_stat))
+
+        return meta_files, entries
+
+    def rescan(self):
+        """
+        Read this directory again, so the tree matches what is on disk
+
+        Children that have been removed are dropped and new ones are loaded,
+        along with any descendants. Files whose size or modification time
+        have changed are replaced by new nodes, anything else is kept along
+        with whatever it has already worked out. Children that can't be
+        stat'ed or are neither files nor directories are skipped.
+
+        Meta files are not read again, see :meth:`from_path` for that.
+
+        Returns a set of the names of children that were added, removed or
+        replaced.
+        """
+        assert not self.is_leaf
+        _, entries = self._scan_dir(self.path_obj)
+        globs = self.meta.get("ignore", [])
+
+        old_children = self._children.copy()
+        children = OrderedDict()
+        for name, entry_stat in entries:
+            if entry_stat is None:
+                continue
+            is_dir = S_ISDIR(entry_stat.st_mode)
+            if not (is_dir or S_ISREG(entry_stat.st_mode)) \
+                    or matcher.match_globs(globs, name, is_dir):
+                continue
+
+            child = old_children.get(name)
+            if child is not None and not child.is_leaf and is_dir:
+                children[name] = child
+                continue
+            elif child is not None and child.is_leaf and not is_dir and \
+                    (child.stat.st_size, child.stat.st_mtime_ns) == \
+                    (entry_stat.st_size, entry_stat.st_mtime_ns):
+                children[name] = child
+                continue
+
+            child = type(self)(self.path_obj / name, parent=self, stat=entry_stat)
+            if is_dir:
+                self._load_children(child, _run_now)
+            children[name] = child
+
+        self._children = children
+        changed = set(old_children) ^ set(children)
+        changed.update(name for name, child in children.items()
+                       if old_children.get(name, child) is not child)
+        return changed
+
+    def forget(self, keep_dependencies=False):
+        """
+        Forget content and anything worked out from it, such as
+        :attr:`marks` and :attr:`cache_bust`, so they are worked out again
+        next time they are needed
+
+        :param keep_dependencies:
+            Keep :attr:`dependencies` until content is worked out again, so it
+            is still known what this node's content depended on
+        """
+        with self._lock.held():
+            for name in ["_content", "_data", "cache_bust", "content_hash", "_marks",
+                         "_render_fingerprint"]:
+                self.__dict__.pop(name, None)
+            if not keep_dependencies:
+                self._dependencies = None
+
+    @property
+    def stat(self):
+        """
+        :class:`os.stat_result` for this node's path
+
+        Nodes loaded via :meth:`from_path` have this information collected
+        during discovery, so the file system is not touched again.
+        """
+        if self._stat is None:
+            self._stat = self.path_obj.stat()
+        return self._stat
 
     def __repr__(self):
         return "<%s: %s>" % (self.__class__.__name__, self.path_obj.name)
@@ -169,17 +382,74 @@ class Node:
                 if part == "..":
                     found_node = found_node.parent
                 else:
-                    found_node = found_node.children[part]
+                    found_node = found_node._children[part]
         except KeyError as exp:
+            # this could be found if a file is added
+            found_node._track(DEPENDS_ON_CHILDREN)
             raise OSError("{} could not find {}".format(self, exp.args)) from exp
 
+        # only where it is, anything read from it is tracked separately
+        found_node._track(DEPENDS_ON_URL)
         return found_node
 
+    @property
+    def children(self):
+        """An ordered dictionary of child nodes, keyed by file name"""
+        self._track(DEPENDS_ON_CHILDREN)
+        return self._children
+
+    def _track(self, kind=DEPENDS_ON_NODE):
+        """Record that the node whose content is being worked out has read
+        this node"""
+        reader = _reader.get()
+        if reader is not None and reader is not self:
+            reader._dependencies.add((kind, self.key))
+
+    @property
+    def key(self):
+        """This node's path relative to the root node, see
+        :func:`exhibition.state.node_key`"""
+        if self._key is None:
+            if self.parent is None:
+                self._key = "."
+            elif self.parent.parent is None:
+                self._key = self.path_obj.name
+            else:
+                self._key = "%s/%s" % (self.parent.key, self.path_obj.name)
+        return self._key
+
+    @property
+    def dependencies(self):
+        """
+        A sorted list of ``(kind, path)`` tuples for every other node that was
+        read while working out this node's content, or ``None`` if content
+        hasn't been worked out yet. ``path`` is relative to the root node.
+
+        ``kind`` is ``"children"`` if the node's children were listed or
+        searched, for example via :attr:`siblings` or :meth:`get_from_path`.
+        It is ``"url"`` if the node was found, e.g. with :meth:`get_from_path`,
+        or its :attr:`full_url` or :attr:`full_path` was read, which only
+        change with its path, its meta and its :attr:`cache_bust`. Otherwise
+        it is ``"node"``, e.g. for :attr:`marks`, :attr:`data`, :attr:`meta`
+        and :attr:`content`.
+
+        Filters can add other kinds of dependency with :func:`add_dependency`,
+        e.g. the Jinja2 filter adds ``("template", name)`` for every template
+        it loads.
+        """
+        if self._dependencies is None:
+            return None
+        return sorted(self._dependencies)
+
     @property
     def full_path(self):
         """
         Full path of node when deployed
         """
+        self._track(DEPENDS_ON_URL)
+        return _untracked(self._full_path)
+
+    def _full_path(self):
         if self.parent is None:
             return self.meta["deploy_path"]
         else:
@@ -194,6 +464,10 @@ class Node:
     @property
     def full_url(self):
         """Get full URL for node, including trailing slash"""
+        self._track(DEPENDS_ON_URL)
+        return _untracked(self._full_url)
+
+    def _full_url(self):
         if self.parent is None:
             base_url = self.meta.get("base_url", "/")
             if not base_url.startswith("/"):
@@ -223,7 +497,8 @@ class Node:
         if include_self:
             yield self
 
-        for child in self.children.values():
+        self._track(DEPENDS_ON_CHILDREN)
+        for child in self._children.values():
             yield child
             for grandchild in child.walk():
                 yield grandchild
@@ -236,18 +511,52 @@ class Node:
         if not self.is_leaf:
             dir_mode = self.meta.get("dir_mode", DEFAULT_DIR_MODE)
             dir_obj = pathlib.Path(self.full_path)
-            dir_obj.mkdir()
+            dir_obj.mkdir(exist_ok=True)
             dir_obj.chmod(dir_mode)
             return
 
+        if "_content" not in self.__dict__:
+            # filter slots must be taken before this node is locked, otherwise
+            # a thread with a slot could wait for us while we wait for a slot
+            with concurrency_limits(self.filter_limits()):
+                self.content
+
         file_mode = self.meta.get("file_mode", DEFAULT_FILE_MODE)
         file_obj = pathlib.Path(self.full_path)
 
-        with file_obj.open("w" if type(self.content) is str else "wb") as fo:
-            fo.write(self.content)
-        file_obj.chmod(file_mode)
+        content = self.content
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        if self._is_deployed(file_obj, content):
+            return
+
+        deploy.write_file(self.full_path, content, file_mode)
+        compress.write_compressed(self, content, file_mode)
+
+    def _is_deployed(self, file_obj, content):
+        """Returns ``True`` if ``file_obj`` already holds ``content``, according
+        to :attr:`deployed_hash`"""
+        if self.deployed_hash is None or self.deployed_hash != self.content_hash:
+            return False
+        try:
+            return file_obj.stat().st_size == len(content)
+        except OSError:
+            return False
+
+    async def async_render(self):
+        """
+        Coroutine version of :meth:`render`
+
+        Content is fetched with :meth:`async_content` and then written to
+        disk in the event loop's default executor.
+        """
+        if self.is_leaf and "_content" not in self.__dict__:
+            limits = await run_in_thread(self.filter_limits)
+            async with async_concurrency_limits(limits):
+                await self.async_content()
+        await run_in_thread(self.render)
 
-    @cached_property
+    @property
     def content(self):
         """
         Get the actual content of the Node
@@ -255,23 +564,158 @@ class Node:
         If ``filter`` has been specified in :attr:`meta`, that filter will be
         used to further process the content.
         """
+        self._track()
+        return self._content
+
+    @locked_cached_property
+    def _content(self):
+        with _reading_as(self):
+            self._begin_content()
+            filters = self._matching_filters()
+            render_cache, key = self._render_cache_key(filters)
+            if key is not None:
+                content = self._from_render_cache(render_cache, key)
+                if content is not None:
+                    return content
+
+            content = self._read_content()
+            if type(content) is not str:
+                return content
+
+            for _, filter_module, _ in filters:
+                content = filter_module.content_filter(self, content)
+
+            if key is not None:
+                self._to_render_cache(render_cache, key, content)
+            return content
+
+    async def async_content(self):
+        """
+        Coroutine that gets the content of the Node, the same as
+        :attr:`content`
+
+        Filters that provide ``async_content_filter`` are awaited, all other
+        filters are run in the event loop's default executor via
+        :func:`exhibition.locks.run_in_thread`. Call
+        :func:`exhibition.locks.new_owner` at the start of each task that
+        calls this.
+        """
+        if "_content" in self.__dict__:
+            return self.content
+
+        # waiting for the lock can block, so don't do that on the event loop
+        acquired = await run_in_thread(self._lock.acquire)
+        try:
+            if "_content" not in self.__dict__:
+                token = _reader.set(self)
+                try:
+                    self.__dict__["_content"] = await self._async_filter_content()
+                finally:
+                    _reader.reset(token)
+        finally:
+            if acquired:
+                self._lock.release()
+
+        return self.content
+
+    async def _async_filter_content(self):
+        self._begin_content()
+        filters = await run_in_thread(self._matching_filters)
+        render_cache, key = await run_in_thread(self._render_cache_key, filters)
+        if key is not None:
+            content = await run_in_thread(self._from_render_cache, render_cache, key)
+            if content is not None:
+                return content
+
+        content = await run_in_thread(self._read_content)
+        if type(content) is not str:
+            return content
+
+        for _, filter_module, _ in filters:
+            async_filter = getattr(filter_module, "async_content_filter", None)
+            if async_filter is None:
+                content = await run_in_thread(filter_module.content_filter, self, content)
+            else:
+                content = await async_filter(self, content)
+
+        if key is not None:
+            await run_in_thread(self._to_render_cache, render_cache, key, content)
+        return content
+
+    def _render_cache_key(self, filters):
+        """Returns the :class:`exhibition.cache.RenderCache` for this node and
+        its key, or ``(None, None)`` if its content isn't cached"""
+        if not (filters and self.is_leaf):
+            return None, None
+
+        return _untracked(self._find_render_cache, filters)
+
+    def _find_render_cache(self, filters):
+        render_cache = cache.RenderCache.for_node(self)
+        if render_cache is None:
+            return None, None
+        return render_cache, render_cache.key(self, filters)
+
+    def _from_render_cache(self, render_cache, key):
+        """Restores content, marks and dependencies from ``render_cache``.
+        Returns the content, or ``None`` if there was no usable entry."""
+        entry = _untracked(render_cache.get, self, key)
+        if entry is None:
+            return None
+
+        self._dependencies = {tuple(dep) for dep in entry["dependencies"]}
+        self._marks.update(entry["marks"])
+        return entry["content"]
+
+    def _to_render_cache(self, render_cache, key, content):
+        _untracked(render_cache.put, self, key, content)
+
+    def _begin_content(self):
+        """Get ready to record what is read while working out content"""
+        self._dependencies = set()
+        if not hasattr(self, "_marks"):
+            # filters can add marks while we're still working out content
+            self._marks = {}
+
+    def _read_content(self):
+        """Read content from disk, decoded if possible"""
         self.meta  # fetch meta and set __content_start
         with self.path_obj.open("rb") as file_obj:
             file_obj.seek(self.__content_start)
             content = file_obj.read()
         try:
-            content = content.decode("utf-8")
+            return content.decode("utf-8")
         except UnicodeDecodeError:
             return content
-        for fltr, globs in self.content_filters():
-            for filter_glob in globs:
-                if self.path_obj in self.path_obj.parent.glob(filter_glob):
-                    content = fltr(self, content)
-                    break
-        return content
+
+    def filter_limits(self):
+        """
+        Returns a list of ``(filter name, limit)`` for each filter that
+        applies to this node and has a limit in ``filter_concurrency``
+        """
+        limits = self.meta.get(FILTER_CONCURRENCY_META) or {}
+        if not (limits and self.is_leaf):
+            return []
+
+        return sorted(
+            (name, limits[name]) for name, _, globs in self._content_filters()
+            if name in limits and matcher.match_globs(globs, self.path_obj.name)
+        )
+
+    def _matching_filters(self):
+        """Returns a list of (module name, filter module, glob pattern) for
+        each content filter that applies to this node"""
+        return [(name, filter_module, globs)
+                for name, filter_module, globs in self._content_filters()
+                if matcher.match_globs(globs, self.path_obj.name)]
 
     def content_filters(self):
         """Yields tuples in the form (filter_funct, glob pattern)"""
+        for _, filter_module, globs in self._content_filters():
+            yield (filter_module.content_filter, globs)
+
+    def _content_filters(self):
+        """Yields tuples in the form (module name, filter module, glob pattern)"""
         content_filter = self.meta.get("filter")
         if content_filter is None:
             content_filter = []
@@ -289,7 +733,7 @@ class Node:
                 globs = filter_module.DEFAULT_GLOB
             if not isinstance(globs, (list, tuple)):
                 globs = [globs]
-            yield (filter_module.content_filter, globs)
+            yield (fltr, filter_module, globs)
 
     def __read_frontmatter(self):
         found_header = False
@@ -320,11 +764,25 @@ class Node:
                     idx = found_meta.index(self._meta_footer)
                     return found_meta[:idx]
 
-    @cached_property
+    @property
     def meta(self):
         """
         Configuration object
 
+        Includes values inherited from parent nodes and any YAML front matter
+        """
+        self._track()
+        return self._meta
+
+    @meta.setter
+    def meta(self, value):
+        self.__dict__["_meta"] = value
+
+    @locked_cached_property
+    def _meta(self):
+        """
+        Configuration object
+
         Finds and processes the YAML front matter at the top of a file
 
         If the file does not start with ``---\\n``, then it's assumed the file
@@ -365,20 +823,55 @@ class Node:
         """
         Marked sections from content
         """
-        if not hasattr(self, "_marks"):
-            self._marks = {}
-            # make sure that _marks gets populated
-            self.content
+        self._track()
+        with self._lock.held():
+            if not hasattr(self, "_marks"):
+                self._marks = {}
+                # make sure that _marks gets populated
+                self.content
 
         return self._marks
 
-    @cached_property
+    def get_rendered_state(self):
+        """
+        Returns a dict of values that were computed while rendering this node
+        and which other nodes may need, such as :attr:`marks`. Used to copy
+        this state back from worker processes.
+        """
+        return {
+            "marks": self.marks,
+            "cache_bust": self.cache_bust,
+            "content_hash": self.content_hash,
+            "dependencies": self.dependencies,
+        }
+
+    def set_rendered_state(self, state):
+        """
+        Restores state from :meth:`get_rendered_state` so that it doesn't
+        need to be computed again. Keys that are missing from ``state`` are
+        left alone.
+        """
+        if "marks" in state:
+            self._marks = state["marks"]
+        if "cache_bust" in state:
+            self.__dict__["cache_bust"] = state["cache_bust"]
+        if "content_hash" in state:
+            self.__dict__["content_hash"] = state["content_hash"]
+        if state.get("dependencies") is not None:
+            self._dependencies = {tuple(dep) for dep in state["dependencies"]}
+
+    @property
     def data(self):
         """Extracts data from contents of file
 
         For example, a YAML file
         """
-        if self.path_obj.is_dir():
+        self._track()
+        return self._data
+
+    @locked_cached_property
+    def _data(self):
+        if not self.is_leaf:
             return
 
         func = DATA_EXTRACTORS[self.path_obj.suffix]
@@ -392,33 +885,40 @@ class Node:
         then an :class:`AssertionError` is raised.
         """
         assert child.parent == self
-        self.children[child.path_obj.name] = child
+        self._children[child.path_obj.name] = child
 
     @property
     def siblings(self):
         """Returns all children of the parent Node, except for itself"""
         return {k: v for k, v in self.parent.children.items() if v is not self}
 
-    @cached_property
+    @locked_cached_property
+    def content_hash(self):
+        """MD5 hex digest of :attr:`content`, or ``None`` for directories"""
+        if not self.is_leaf:
+            return None
+
+        content = self.content
+        if isinstance(content, str):
+            # content needs to be bytes just for this bit
+            content = content.encode("utf-8")
+        return hashlib.md5(content).hexdigest()
+
+    @locked_cached_property
     def cache_bust(self):
         cache_bust_version = None
-        globs = self.meta.get("cache_bust_glob", [])
-        if not isinstance(globs, (list, tuple)):
-            globs = [globs]
-        for cache_bust_glob in globs:
-            if self.path_obj in self.path_obj.parent.glob(cache_bust_glob):
-                hasher = hashlib.md5()
-                content = self.content
-                if isinstance(content, str):
-                    # content needs to be bytes just for this bit
-                    content = content.encode("utf-8")
-                hasher.update(content)
-
-                cache_bust_version = hasher.hexdigest()[:8]
-                break
+        if self.is_cache_busted:
+            cache_bust_version = self.content_hash[:8]
 
         return cache_bust_version
 
+    @property
+    def is_cache_busted(self):
+        """``True`` if this node matches ``cache_bust_glob``, so its
+        :attr:`full_url` changes with its content"""
+        globs = self.meta.get("cache_bust_glob", [])
+        return matcher.match_globs(globs, self.path_obj.name, not self.is_leaf)
+
     @property
     def strip_exts(self):
         strip_exts = self.meta.get("strip_exts", DEFAULT_STRIP_EXTS)
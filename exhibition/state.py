@@ -0,0 +1,419 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+"""
+Build state for incremental builds
+
+After an incremental build, a record of every node is saved to
+``state.json`` in ``cache_dir``. The next incremental build compares the
+tree it finds with these records to work out which nodes need to be rendered
+again and which outputs should be deleted.
+
+Paths in the state are relative, so ``cache_dir`` can be copied to another
+checkout of the site, such as the next run of a CI job, along with the render
+and template caches that are kept there (see :mod:`exhibition.cache`).
+"""
+
+from collections import defaultdict
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import posixpath
+import time
+
+from . import compress, matcher
+
+CACHE_DIR_META = "cache_dir"
+DEFAULT_CACHE_DIR = ".exhibition"
+
+STATE_FILE_NAME = "state.json"
+STATE_VERSION = 6
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+# file systems can have timestamps as coarse as two seconds
+RACY_WINDOW_NS = 2 * 10**9
+
+# meta keys that don't affect what a node renders to, most of which are
+# paths that differ between machines
+FINGERPRINT_EXCLUDE = {"deploy_path", "content_path", CACHE_DIR_META, "template_cache_dir",
+                       "manifest_path"}
+
+logger = logging.getLogger(__name__)
+
+# file digests keyed by path, each with the stat signature it's valid for
+_file_digests = {}
+
+
+def get_cache_dir(settings):
+    """Returns the path to ``cache_dir`` as a :class:`pathlib.Path`"""
+    return pathlib.Path(settings.get(CACHE_DIR_META, DEFAULT_CACHE_DIR))
+
+
+def node_key(node):
+    """Returns the path of ``node`` relative to the root node, which is used
+    to identify it between builds"""
+    return node.key
+
+
+def parent_key(key):
+    """Returns the key of the parent of the node with ``key``"""
+    if key == ".":
+        return None
+    return posixpath.dirname(key) or "."
+
+
+def stat_signature(stat):
+    """
+    Returns ``[inode, size, modification time]`` from ``stat``
+
+    If the file was modified so recently that it could be modified again
+    without any of these changing, ``None`` is returned instead.
+    """
+    if stat.st_mtime_ns >= time.time_ns() - RACY_WINDOW_NS:
+        return None
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def file_digest(path, stat=None):
+    """
+    Returns the MD5 hex digest of the file at ``path``
+
+    Digests are remembered for as long as the file's :func:`stat_signature`
+    stays the same, so a file is only read once.
+    """
+    if stat is None:
+        stat = os.stat(path)
+    signature = stat_signature(stat)
+    known = _file_digests.get(path)
+    if signature is not None and known is not None and known[0] == signature:
+        return known[1]
+
+    hasher = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    if signature is not None:
+        _file_digests[path] = (signature, digest)
+    return digest
+
+
+def source_fingerprint(node, old_record=None):
+    """
+    Returns a hash of the source file of ``node``, or ``None`` for
+    directories
+
+    If ``old_record``, the node's record from the last build, has the same
+    :func:`stat_signature` as :attr:`Node.stat`, its hash is used rather
+    than reading the file again.
+    """
+    if not node.is_leaf:
+        return None
+
+    signature = stat_signature(node.stat)
+    if signature is not None and old_record is not None \
+            and old_record.get("stat") == signature and old_record.get("source"):
+        return old_record["source"]
+    return file_digest(str(node.path_obj), node.stat)
+
+
+def meta_fingerprint(node):
+    """
+    Returns a hash of the effective meta of ``node``
+
+    This includes values inherited from parent ``meta.yaml`` files and
+    ``site.yaml``, so a change to any of them changes the fingerprint.
+    Settings that say where things are rather than what is rendered, such as
+    ``content_path`` and ``deploy_path``, are left out so that fingerprints
+    are the same wherever the site is built.
+    """
+    meta = {key: node.meta[key] for key in node.meta if key not in FINGERPRINT_EXCLUDE}
+    data = json.dumps(meta, sort_keys=True, default=str)
+    return hashlib.md5(data.encode("utf-8")).hexdigest()
+
+
+def portable_path(path):
+    """Returns the real path of ``path`` relative to the current directory,
+    so that state saved in one checkout of a site can be used in another"""
+    path = os.path.realpath(path)
+    try:
+        return os.path.relpath(path)
+    except ValueError:
+        # on another drive
+        return path
+
+
+def template_dirs(root_node):
+    """Returns a sorted list of the absolute path of every ``templates``
+    directory used in the tree"""
+    dirs = set()
+    for item in root_node.walk(True):
+        templates = item.meta.get("templates") or []
+        if not isinstance(templates, (list, tuple)):
+            templates = [templates]
+        dirs.update(str(pathlib.Path(tmpl).resolve()) for tmpl in templates)
+
+    return sorted(dirs)
+
+
+def template_fingerprints(root_node):
+    """
+    Returns a dictionary of template names and fingerprints for every file in
+    every ``templates`` directory used in the tree
+
+    Names are relative to the ``templates`` directory, as they would be passed
+    to ``{% include %}``. If more than one directory has a template with the
+    same name, the fingerprint covers all of them.
+    """
+    hashers = defaultdict(hashlib.md5)
+    for idx, template_dir in enumerate(template_dirs(root_node)):
+        for dirpath, dirnames, filenames in os.walk(template_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                name = pathlib.Path(os.path.relpath(path, template_dir)).as_posix()
+                line = "%s %s\n" % (idx, file_digest(path))
+                hashers[name].update(line.encode())
+
+    return {name: hasher.hexdigest() for name, hasher in hashers.items()}
+
+
+def is_filtered(node):
+    """Returns ``True`` if any content filter applies to ``node``"""
+    return node.is_leaf and any(
+        matcher.match_globs(globs, node.path_obj.name) for _, globs in node.content_filters()
+    )
+
+
+class BuildState:
+    """
+    Records of every node from a build
+
+    :attr:`nodes` is a dictionary keyed by :func:`node_key`. Each value is a
+    dictionary with the following keys:
+
+    - ``is_leaf``: whether the node was a file
+    - ``source``: see :func:`source_fingerprint`
+    - ``stat``: see :func:`stat_signature`
+    - ``meta``: see :func:`meta_fingerprint`
+    - ``filtered``: whether any content filters applied to the node
+    - ``output``: where the node was rendered to, relative to ``deploy_path``
+    - ``compressed``: compressed copies of ``output`` that were written, see
+      :mod:`exhibition.compress`
+    - ``cache_bust``: the node's :attr:`Node.cache_bust`
+    - ``hash``: the node's :attr:`Node.content_hash`
+    - ``dependencies``: the node's :attr:`Node.dependencies`
+    """
+    def __init__(self, path, deploy_path=None, nodes=None, templates=None):
+        self.path = pathlib.Path(path)
+        self.deploy_path = deploy_path
+        self.nodes = {} if nodes is None else nodes
+        self.templates = templates
+
+    @classmethod
+    def load(cls, settings):
+        """
+        Load the state saved by the last incremental build
+
+        If there is no saved state, or it can't be used, an empty state is
+        returned.
+        """
+        path = get_cache_dir(settings) / STATE_FILE_NAME
+        deploy_path = portable_path(settings["deploy_path"])
+        try:
+            with path.open() as state_file:
+                data = json.load(state_file)
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError) as exp:
+            logger.warning("Could not load build state from %s: %s", path, exp)
+            return cls(path)
+
+        if data.get("version") != STATE_VERSION or data.get("deploy_path") != deploy_path:
+            return cls(path)
+
+        return cls(path, deploy_path, data["nodes"], data["templates"])
+
+    @classmethod
+    def from_tree(cls, settings, root_node, deploy_path=None, old_state=None):
+        """
+        Creates state for the tree at ``root_node``. Outputs are not recorded
+        until :meth:`record_output` is called.
+
+        :param deploy_path:
+            Where the outputs will end up, if not ``deploy_path`` from
+            ``settings``
+        :param old_state:
+            State from the last build, whose source hashes are reused for
+            files that haven't been touched since, see
+            :func:`source_fingerprint`
+        """
+        old_nodes = old_state.nodes if old_state is not None else {}
+        state = cls(
+            get_cache_dir(settings) / STATE_FILE_NAME,
+            portable_path(deploy_path or settings["deploy_path"]),
+            templates=template_fingerprints(root_node),
+        )
+        for item in root_node.walk(True):
+            key = node_key(item)
+            state.nodes[key] = {
+                "is_leaf": item.is_leaf,
+                "source": source_fingerprint(item, old_nodes.get(key)),
+                "stat": stat_signature(item.stat) if item.is_leaf else None,
+                "meta": meta_fingerprint(item),
+                "filtered": is_filtered(item),
+            }
+
+        return state
+
+    def record_output(self, node, old_state=None):
+        """
+        Record where ``node`` was rendered to, a hash of what was written and
+        which other nodes it read
+
+        If the content of ``node`` wasn't worked out during this build, its
+        hash and dependencies are copied from ``old_state``.
+        """
+        key = node_key(node)
+        record = self.nodes[key]
+        record["output"] = os.path.relpath(node.full_path, node.root_node.full_path)
+        if not node.is_leaf:
+            return
+
+        record["compressed"] = compress.compressed_paths(record["output"],
+                                                         compress.node_formats(node))
+        record["cache_bust"] = node.cache_bust
+        dependencies = node.dependencies
+        if dependencies is not None:
+            content_hash = node.content_hash
+        elif old_state is not None and key in old_state.nodes:
+            dependencies = old_state.nodes[key].get("dependencies")
+            content_hash = old_state.nodes[key].get("hash")
+        else:
+            content_hash = None
+        if content_hash is not None:
+            record["hash"] = content_hash
+        if dependencies:
+            record["dependencies"] = [list(dep) for dep in dependencies]
+
+    def outputs(self, key):
+        """Returns every file written for the node with ``key``, relative to
+        ``deploy_path``"""
+        record = self.nodes[key]
+        return [record["output"]] + record.get("compressed", [])
+
+    def save(self):
+        """Write state to disk, replacing any previous state"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": STATE_VERSION,
+            "deploy_path": self.deploy_path,
+            "templates": self.templates,
+            "nodes": self.nodes,
+        }
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w") as state_file:
+            json.dump(data, state_file)
+        os.replace(tmp_path, self.path)
+
+    def changed(self, old_state):
+        """
+        Returns the keys of nodes that are new or have changed since
+        ``old_state``, or whose output has gone missing
+        """
+        changed = set()
+        deploy_path = pathlib.Path(self.deploy_path)
+        for key, record in self.nodes.items():
+            old_record = old_state.nodes.get(key)
+            if old_record is None or any(old_record[name] != record[name]
+                                         for name in ("is_leaf", "source", "meta", "filtered")):
+                changed.add(key)
+            elif not os.path.lexists(deploy_path / old_record["output"]):
+                changed.add(key)
+
+        return changed
+
+    def removed(self, old_state):
+        """Returns the keys of nodes from ``old_state`` that no longer exist"""
+        return set(old_state.nodes) - set(self.nodes)
+
+    def url_changed(self, old_state, changed, removed):
+        """Returns the keys of nodes whose :attr:`Node.full_url` may have
+        changed since ``old_state``, out of those that are ``changed`` or
+        ``removed``"""
+        url_changed = set(removed)
+        for key in changed:
+            old_record = old_state.nodes.get(key)
+            if old_record is None:
+                continue
+            elif old_record.get("cache_bust") or any(
+                    old_record[name] != self.nodes[key][name] for name in ("is_leaf", "meta")):
+                url_changed.add(key)
+
+        return url_changed
+
+    def affected(self, old_state, changed, removed):
+        """
+        Returns the keys of nodes that need to be rendered
+
+        These are the ``changed`` nodes, plus any nodes that read a changed or
+        removed node during the last build, plus any nodes that listed or
+        searched a directory that has gained or lost a child, plus any nodes
+        that loaded a template that has changed, been added or been removed,
+        and so on for any nodes that read those.
+
+        Nodes that only read the URL of another node are rendered if it has
+        been removed or its meta has changed, or if it is rendered again and
+        its URL includes :attr:`Node.cache_bust`.
+        """
+        affected = set(changed)
+        templates = self.templates or {}
+        old_templates = old_state.templates or {}
+        changed_templates = {name for name in set(templates) | set(old_templates)
+                             if templates.get(name) != old_templates.get(name)}
+
+        added = set(self.nodes) - set(old_state.nodes)
+        children_changed = {parent_key(key) for key in added | removed} - {None}
+
+        dependents = defaultdict(set)
+        for key, record in old_state.nodes.items():
+            if key in self.nodes:
+                for kind, dependency in record.get("dependencies", []):
+                    dependents[(kind, dependency)].add(key)
+
+        def cache_busted(key):
+            return bool(old_state.nodes[key].get("cache_bust"))
+
+        queue = [("node", key) for key in affected | removed]
+        queue.extend(("url", key) for key in self.url_changed(old_state, changed, removed))
+        queue.extend(("children", key) for key in children_changed)
+        queue.extend(("template", name) for name in changed_templates)
+        while queue:
+            for key in dependents.pop(queue.pop(), ()):
+                if key not in affected:
+                    affected.add(key)
+                    queue.append(("node", key))
+                    if cache_busted(key):
+                        queue.append(("url", key))
+
+        return affected
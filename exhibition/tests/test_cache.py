@@ -0,0 +1,277 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+import os
+import pathlib
+import shutil
+
+from exhibition import cache
+from exhibition.config import Config
+from exhibition.filters import jinja2 as jinja2_filter
+from exhibition.state import node_key
+from exhibition.tests.test_gen import GenTestCase, write_site
+from exhibition.utils import gen, load_tree
+
+
+class RenderCacheTestCase(TestCase):
+    def setUp(self):
+        self.content = TemporaryDirectory()
+        self.deploy = TemporaryDirectory()
+        self.cache = TemporaryDirectory()
+        self.templates = TemporaryDirectory()
+        write_site(self.content.name)
+        self.settings = {"content_path": self.content.name, "deploy_path": self.deploy.name,
+                         "cache_dir": self.cache.name, "filter": "exhibition.filters.jinja2",
+                         "templates": [self.templates.name], "render_cache": True}
+
+    def tearDown(self):
+        self.content.cleanup()
+        self.deploy.cleanup()
+        self.cache.cleanup()
+        self.templates.cleanup()
+
+    def gen(self, **kwargs):
+        """Returns the keys of the nodes that were filtered"""
+        with mock.patch.object(jinja2_filter, "content_filter",
+                               side_effect=jinja2_filter.content_filter) as filter_mock:
+            gen(Config(dict(self.settings)), **kwargs)
+        return {node_key(call[0][0]) for call in filter_mock.call_args_list}
+
+    def write(self, name, data, root=None):
+        path = pathlib.Path(root or self.content.name, name)
+        with path.open("w") as f:
+            f.write(data)
+
+    def read(self, name):
+        with pathlib.Path(self.deploy.name, name).open() as f:
+            return f.read()
+
+    def get_cache(self):
+        path = str(pathlib.Path(self.cache.name, cache.RENDER_CACHE_DIR_NAME).resolve())
+        return cache._caches[path]
+
+    def assertSameAsUncached(self):
+        with TemporaryDirectory() as deploy:
+            gen(Config(dict(self.settings, deploy_path=deploy, render_cache=False)))
+            GenTestCase.assertSameTree(self, deploy, self.deploy.name)
+
+    def test_not_configured(self):
+        del self.settings["render_cache"]
+        self.gen()
+        self.assertEqual(len(self.gen()), 4)
+        self.assertFalse(pathlib.Path(self.cache.name, cache.RENDER_CACHE_DIR_NAME).exists())
+
+    def test_cached(self):
+        self.assertEqual(self.gen(), {"index.html", "blog/index.html", "blog/post1.html",
+                                      "blog/post2.html"})
+        self.assertEqual(self.gen(), set())
+        self.assertSameAsUncached()
+
+    def test_hit_restores_state(self):
+        self.maxDiff = None
+        self.gen()
+        self.write("blog/index.html", "{{ node.siblings['post1.html'].marks.intro }}")
+
+        # post1 comes from the cache, marks and all
+        self.assertEqual(self.gen(), {"blog/index.html"})
+        self.assertEqual(self.read("blog/index.html"), "Intro one")
+
+        # dependencies are the same as if the filters had been run
+        def dependencies(**settings):
+            root_node = load_tree(Config(dict(self.settings, **settings)))
+            return {node_key(item): item.dependencies for item in root_node.walk()
+                    if item.is_leaf and item.content is not None}
+
+        self.assertEqual(dependencies(), dependencies(render_cache=False))
+
+    def test_source_changed(self):
+        self.gen()
+        self.write("blog/post2.html", "{% mark intro %}Intro 2{% endmark %} Post two")
+
+        # index.html read post2, blog/index.html listed its siblings
+        self.assertEqual(self.gen(), {"blog/post2.html", "index.html", "blog/index.html"})
+        self.assertEqual(self.read("index.html"), "Intro 2")
+        self.assertSameAsUncached()
+
+    def test_dependency_of_dependency_changed(self):
+        self.write("about.html", "{{ node.get_from_path('index.html').content }}")
+        self.gen()
+        self.write("blog/post2.html", "{% mark intro %}Intro 2{% endmark %} Post two")
+
+        self.assertIn("about.html", self.gen())
+        self.assertEqual(self.read("about.html"), "Intro 2")
+
+    def test_child_added(self):
+        self.gen()
+        self.write("blog/post3.html", "{% mark intro %}Intro three{% endmark %}")
+
+        self.assertEqual(self.gen(), {"blog/post3.html", "blog/index.html"})
+        self.assertIn("Intro three", self.read("blog/index.html"))
+
+    def test_meta_changed(self):
+        self.gen()
+        self.write("blog/meta.yaml", "cache_bust_glob: \"*.css\"\nmarkdown_config: {}")
+
+        self.assertEqual(self.gen(), {"index.html", "blog/index.html", "blog/post1.html",
+                                      "blog/post2.html"})
+
+    def test_template_changed(self):
+        self.write("base.j2", "{% block body %}{% endblock %}", self.templates.name)
+        self.write("page.html", "---\nextends: base.j2\ndefault_block: body\n---\npage")
+        self.gen()
+        self.assertEqual(self.gen(), set())
+
+        self.write("base.j2", "base {% block body %}{% endblock %}", self.templates.name)
+        self.assertEqual(self.gen(), {"page.html"})
+        self.assertEqual(self.read("page.html").split(), ["base", "page"])
+
+    def test_filter_changed(self):
+        self.gen()
+        with mock.patch.object(cache, "module_digest", return_value="new"):
+            self.assertEqual(len(self.gen()), 4)
+
+    def test_disabled_in_meta(self):
+        self.write("index.html", "---\nrender_cache: false\n---\n"
+                   "{{ node.get_from_path('blog/post2.html').marks.intro }}")
+        self.gen()
+        self.assertEqual(self.gen(), {"index.html"})
+
+    def test_uncached_dependency_changed(self):
+        self.write("intro.j2", "OLD", self.templates.name)
+        self.write("blog/post2.html", "---\nrender_cache: false\n---\n"
+                   "{% mark intro %}{% include 'intro.j2' %}{% endmark %}")
+        self.gen()
+        self.assertEqual(self.read("index.html"), "OLD")
+
+        # index.html is cached, but what it read from post2 isn't
+        self.write("intro.j2", "NEW", self.templates.name)
+        self.assertIn("index.html", self.gen())
+        self.assertEqual(self.read("index.html"), "NEW")
+        self.assertSameAsUncached()
+
+    def test_cached_after_one_build(self):
+        links = "{% for name, item in node.siblings.items() %}{{ item.full_url }} {% endfor %}"
+        for name in ["a.html", "b.html", "c.html"]:
+            self.write(name, links)
+        self.gen()
+
+        cache_obj = self.get_cache()
+        cache_obj.hits = cache_obj.misses = 0
+        self.assertEqual(self.gen(), set())
+        self.assertEqual(cache_obj.misses, 0)
+        self.assertSameAsUncached()
+
+    def test_cycle_not_cached(self):
+        self.write("a.html", "{% mark a %}A{% endmark %}{{ node.get_from_path('b.html').marks.b }}")
+        self.write("b.html", "{% mark b %}B{% endmark %}{{ node.get_from_path('a.html').marks.a }}")
+        self.gen()
+        self.assertTrue({"a.html", "b.html"} & self.gen())
+        self.assertSameAsUncached()
+        self.assertTrue({"a.html", "b.html"} & self.gen(jobs=2, mode="thread"))
+
+    def test_modes(self):
+        self.gen()
+        self.assertEqual(self.gen(jobs=2, mode="thread"), set())
+        self.assertEqual(self.gen(jobs=2, mode="async"), set())
+        self.assertSameAsUncached()
+
+    def test_corrupt_entry(self):
+        self.gen()
+        for path, _ in self.get_cache().entries():
+            with open(path, "wb") as f:
+                f.write(b"not a pickle")
+
+        with self.assertLogs("exhibition.cache", "WARNING"):
+            self.assertEqual(len(self.gen()), 4)
+        self.assertSameAsUncached()
+
+    def test_stats(self):
+        self.gen()
+        render_cache = self.get_cache()
+        stats = render_cache.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.entries), (0, 4, 4))
+        self.assertGreater(stats.size, 0)
+        self.assertEqual(stats.max_size, cache.DEFAULT_RENDER_CACHE_SIZE)
+
+        self.gen()
+        self.assertEqual(render_cache.stats()[:3], (4, 4, 4))
+
+    def test_prune(self):
+        self.gen()
+        render_cache = self.get_cache()
+        entries = sorted(render_cache.entries())
+        for idx, (path, _) in enumerate(entries):
+            os.utime(path, (idx, idx))
+        newest_size = entries[-1][1].st_size
+
+        self.assertEqual(render_cache.prune(newest_size), 3)
+        self.assertEqual([path for path, _ in render_cache.entries()], [entries[-1][0]])
+
+        self.assertEqual(render_cache.clear(), 1)
+        self.assertEqual(render_cache.stats().entries, 0)
+
+    def test_size_limit(self):
+        self.settings["render_cache_size"] = 0
+        self.gen()
+        self.assertEqual(self.get_cache().stats().entries, 0)
+
+
+class PortableCacheTestCase(TestCase):
+    def setUp(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        self.first = TemporaryDirectory()
+        self.second = TemporaryDirectory()
+        self.settings = {"content_path": "content", "deploy_path": "deploy",
+                         "filter": "exhibition.filters.jinja2", "templates": ["templates"],
+                         "render_cache": True}
+
+    def tearDown(self):
+        self.first.cleanup()
+        self.second.cleanup()
+
+    def gen(self):
+        with mock.patch.object(jinja2_filter, "content_filter",
+                               side_effect=jinja2_filter.content_filter) as filter_mock:
+            gen(Config(dict(self.settings)), incremental=True)
+        return filter_mock.call_count
+
+    def test_relocated(self):
+        os.chdir(self.first.name)
+        write_site("content")
+        os.mkdir("templates")
+        with open("templates/base.j2", "w") as f:
+            f.write("{% block body %}{% endblock %}")
+        with open("content/page.html", "w") as f:
+            f.write("---\nextends: base.j2\ndefault_block: body\n---\npage")
+        self.assertEqual(self.gen(), 5)
+
+        # a fresh checkout elsewhere, with new modification times and only
+        # the cache directory kept
+        os.chdir(self.second.name)
+        for name in ["content", "templates"]:
+            shutil.copytree(os.path.join(self.first.name, name), name,
+                            copy_function=shutil.copyfile)
+        shutil.copytree(os.path.join(self.first.name, ".exhibition"), ".exhibition")
+
+        self.assertEqual(self.gen(), 0)
+        GenTestCase.assertSameTree(self, os.path.join(self.first.name, "deploy"), "deploy")
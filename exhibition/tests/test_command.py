@@ -27,7 +27,7 @@ import pathlib
 
 from click.testing import CliRunner
 
-from exhibition import command, config
+from exhibition import cache, command, config, manifest
 import exhibition
 
 
@@ -40,10 +40,69 @@ class CommandTestCase(TestCase):
 
         self.assertEqual(result.exit_code, 0)
         self.assertEqual(gen_mock.call_count, 1)
-        self.assertEqual(gen_mock.call_args, ((config_mock.return_value,), {}))
+        self.assertEqual(gen_mock.call_args, ((config_mock.return_value,),
+                                              {"jobs": 1, "mode": "process",
+                                               "incremental": False, "atomic": False}))
 
         self.assertEqual(config_mock.call_args, ((config.SITE_YAML_PATH,), {}))
 
+        result = runner.invoke(command.exhibition, ["gen", "--jobs", "4"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(gen_mock.call_count, 2)
+        self.assertEqual(gen_mock.call_args, ((config_mock.return_value,),
+                                              {"jobs": 4, "mode": "process",
+                                               "incremental": False, "atomic": False}))
+
+        result = runner.invoke(command.exhibition, ["gen", "--jobs", "4", "--mode", "thread"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(gen_mock.call_count, 3)
+        self.assertEqual(gen_mock.call_args, ((config_mock.return_value,),
+                                              {"jobs": 4, "mode": "thread",
+                                               "incremental": False, "atomic": False}))
+
+        result = runner.invoke(command.exhibition, ["gen", "--incremental"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(gen_mock.call_count, 4)
+        self.assertEqual(gen_mock.call_args, ((config_mock.return_value,),
+                                              {"jobs": 1, "mode": "process",
+                                               "incremental": True, "atomic": False}))
+
+        result = runner.invoke(command.exhibition, ["gen", "--atomic"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(gen_mock.call_count, 5)
+        self.assertEqual(gen_mock.call_args, ((config_mock.return_value,),
+                                              {"jobs": 1, "mode": "process",
+                                               "incremental": False, "atomic": True}))
+
+        result = runner.invoke(command.exhibition, ["gen", "--jobs", "0"])
+        self.assertEqual(result.exit_code, 2)
+        result = runner.invoke(command.exhibition, ["gen", "--mode", "bob"])
+        self.assertEqual(result.exit_code, 2)
+        self.assertEqual(gen_mock.call_count, 5)
+
+    @mock.patch("exhibition.command.watch.watch")
+    @mock.patch("exhibition.command.config.Config.from_path", return_value=config.Config())
+    def test_watch(self, config_mock, watch_mock):
+        runner = CliRunner()
+        result = runner.invoke(command.exhibition, ["watch"])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(watch_mock.call_args, ((config_mock.return_value, config.SITE_YAML_PATH),
+                                                {"jobs": 1, "debounce": 0.1,
+                                                 "poll_interval": None}))
+
+        watch_mock.side_effect = KeyboardInterrupt
+        result = runner.invoke(command.exhibition, ["watch", "-j", "2", "--debounce", "0.5",
+                                                    "--poll", "2"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(watch_mock.call_args, ((config_mock.return_value, config.SITE_YAML_PATH),
+                                                {"jobs": 2, "debounce": 0.5,
+                                                 "poll_interval": 2}))
+
+        result = runner.invoke(command.exhibition, ["watch", "--poll", "0"])
+        self.assertEqual(result.exit_code, 2)
+        self.assertEqual(watch_mock.call_count, 2)
+
     @mock.patch("exhibition.command.utils.serve", return_value=(mock.Mock(), mock.Mock()))
     @mock.patch("exhibition.command.config.Config.from_path", return_value=config.Config())
     def test_serve(self, config_mock, serve_mock):
@@ -52,7 +111,7 @@ class CommandTestCase(TestCase):
 
         self.assertEqual(result.exit_code, 0)
         self.assertEqual(serve_mock.call_count, 1)
-        expected_args = ((config_mock.return_value, ("localhost", 8000)), {})
+        expected_args = ((config_mock.return_value, ("localhost", 8000)), {"live": False})
         self.assertEqual(serve_mock.call_args, expected_args)
 
         self.assertEqual(config_mock.call_args, ((config.SITE_YAML_PATH,), {}))
@@ -64,7 +123,7 @@ class CommandTestCase(TestCase):
         result = runner.invoke(command.exhibition, ["serve"])
         self.assertEqual(result.exit_code, 0)
         self.assertEqual(serve_mock.call_count, 2)
-        expected_args = ((config_mock.return_value, ("localhost", 8000)), {})
+        expected_args = ((config_mock.return_value, ("localhost", 8000)), {"live": False})
         self.assertEqual(serve_mock.call_args, expected_args)
 
         self.assertEqual(config_mock.call_args, ((config.SITE_YAML_PATH,), {}))
@@ -83,12 +142,92 @@ class CommandTestCase(TestCase):
 
         self.assertEqual(result.exit_code, 0)
         self.assertEqual(serve_mock.call_count, 1)
-        expected_args = ((config_mock.return_value, ("localhost", 8001)), {})
+        expected_args = ((config_mock.return_value, ("localhost", 8001)), {"live": False})
         self.assertEqual(serve_mock.call_args, expected_args)
 
         self.assertEqual(serve_mock.return_value[0].shutdown.call_count, 0)
         self.assertEqual(serve_mock.return_value[1].join.call_count, 1)
 
+        result = runner.invoke(command.exhibition, ["serve", "--live"])
+        self.assertEqual(result.exit_code, 0)
+        expected_args = ((config_mock.return_value, ("localhost", 8000)), {"live": True})
+        self.assertEqual(serve_mock.call_args, expected_args)
+
+    @mock.patch("exhibition.command.utils.compile_templates")
+    @mock.patch("exhibition.command.config.Config.from_path", return_value=config.Config())
+    def test_compile_templates(self, config_mock, compile_mock):
+        runner = CliRunner()
+        result = runner.invoke(command.exhibition, ["compile-templates", "out.zip"])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(compile_mock.call_count, 1)
+        self.assertEqual(compile_mock.call_args, ((config_mock.return_value, "out.zip",
+                                                   "exhibition.filters.jinja2"), {}))
+
+        # target from settings and a custom filter
+        config_mock.return_value = config.Config({"compiled_templates": "compiled"})
+        result = runner.invoke(command.exhibition,
+                               ["compile-templates", "--filter", "mysite.filters"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(compile_mock.call_count, 2)
+        self.assertEqual(compile_mock.call_args, ((config_mock.return_value, "compiled",
+                                                   "mysite.filters"), {}))
+
+        # no target at all
+        config_mock.return_value = config.Config()
+        result = runner.invoke(command.exhibition, ["compile-templates"])
+        self.assertEqual(result.exit_code, 2)
+        self.assertEqual(compile_mock.call_count, 2)
+
+    def test_diff(self):
+        with TemporaryDirectory() as tmp_dir:
+            old = str(pathlib.Path(tmp_dir, "old.json"))
+            new = str(pathlib.Path(tmp_dir, "new.json"))
+            entry = {"path": "a.html", "size": 1, "hash": "x"}
+            manifest.save(old, {"/a": entry, "/b": entry})
+            manifest.save(new, {"/a": dict(entry, hash="y"), "/c": entry})
+
+            runner = CliRunner()
+            result = runner.invoke(command.exhibition, ["diff", old, new])
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(result.output, "M /a\nD /b\nA /c\n")
+
+            result = runner.invoke(command.exhibition, ["diff", old, old])
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(result.output, "")
+
+            with open(new, "w") as f:
+                f.write("{}")
+            result = runner.invoke(command.exhibition, ["diff", old, new])
+            self.assertEqual(result.exit_code, 1)
+
+            result = runner.invoke(command.exhibition, ["diff", old, tmp_dir + "/missing"])
+            self.assertEqual(result.exit_code, 2)
+
+    @mock.patch("exhibition.command.config.Config.from_path")
+    def test_cache(self, config_mock):
+        with TemporaryDirectory() as tmp_dir:
+            config_mock.return_value = config.Config({"cache_dir": tmp_dir,
+                                                      "render_cache_size": 10})
+            render_cache = cache.RenderCache.for_settings(config_mock.return_value)
+            for name in ["aa/one", "bb/two"]:
+                path = pathlib.Path(render_cache.path, name)
+                path.parent.mkdir(parents=True)
+                path.write_bytes(b"x" * 8)
+
+            runner = CliRunner()
+            result = runner.invoke(command.exhibition, ["cache"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(result.output, "Entries: 2\nSize: 16 of 10 bytes\n")
+
+            result = runner.invoke(command.exhibition, ["cache", "--prune"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(result.output, "Entries: 1\nSize: 8 of 10 bytes\n")
+
+            result = runner.invoke(command.exhibition, ["cache", "--clear"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(result.output, "Entries: 0\nSize: 0 of 10 bytes\n")
+
     @mock.patch.object(command, "logger")
     def test_exhibition(self, log_mock):
         @command.exhibition.command()
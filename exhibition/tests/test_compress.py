@@ -0,0 +1,124 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock, skipUnless
+import gzip
+import pathlib
+
+from exhibition import compress
+from exhibition.config import Config
+from exhibition.node import Node
+
+
+class CompressTestCase(TestCase):
+    def setUp(self):
+        self.content = TemporaryDirectory()
+        self.deploy = TemporaryDirectory()
+        self.content_path = pathlib.Path(self.content.name)
+        (self.content_path / "site.css").write_text("body { color: black; }" * 100)
+        (self.content_path / "image.png").write_bytes(b"\x89PNG")
+
+    def tearDown(self):
+        self.content.cleanup()
+        self.deploy.cleanup()
+
+    def get_tree(self, **settings):
+        settings.update({"content_path": self.content.name, "deploy_path": self.deploy.name})
+        return Node.from_path(self.content_path, meta=Config(settings))
+
+    def render(self, **settings):
+        root_node = self.get_tree(**settings)
+        for item in root_node.walk(True):
+            item.render()
+        return sorted(path.name for path in pathlib.Path(self.deploy.name).iterdir())
+
+    def test_not_configured(self):
+        self.assertEqual(self.render(), ["image.png", "site.css"])
+
+    def test_gzip(self):
+        self.assertEqual(self.render(compress_glob="*.css"),
+                         ["image.png", "site.css", "site.css.gz"])
+        deploy_path = pathlib.Path(self.deploy.name)
+        compressed = (deploy_path / "site.css.gz").read_bytes()
+        self.assertEqual(gzip.decompress(compressed), (deploy_path / "site.css").read_bytes())
+        self.assertEqual((deploy_path / "site.css.gz").stat().st_mode & 0o777, 0o644)
+
+        # output is the same every time
+        self.render(compress_glob="*.css")
+        self.assertEqual((deploy_path / "site.css.gz").read_bytes(), compressed)
+
+    def test_level(self):
+        root_node = self.get_tree(compress_glob="*.css")
+        node = root_node.get_from_path("site.css")
+        self.assertEqual(compress.compression_level(node, "gzip"), 9)
+        self.assertEqual(compress.compression_level(node, "zstd"), 19)
+
+        node.meta["compress_level"] = 3
+        self.assertEqual(compress.compression_level(node, "gzip"), 3)
+
+        node.meta["compress_level"] = {"zstd": 10}
+        self.assertEqual(compress.compression_level(node, "gzip"), 9)
+        self.assertEqual(compress.compression_level(node, "zstd"), 10)
+
+        with mock.patch("gzip.compress", wraps=gzip.compress) as gzip_mock:
+            node.meta["compress_level"] = 1
+            node.render()
+        self.assertEqual(gzip_mock.call_args[0][1], 1)
+
+    def test_node_formats(self):
+        root_node = self.get_tree(compress_glob="*.css", compress_formats="zstd")
+        self.assertEqual(compress.node_formats(root_node), [])
+        self.assertEqual(compress.node_formats(root_node.get_from_path("image.png")), [])
+        self.assertEqual(compress.node_formats(root_node.get_from_path("site.css")), ["zstd"])
+
+        root_node.meta["compress_formats"] = ["gzip", "brotli"]
+        with self.assertRaises(ValueError):
+            compress.node_formats(root_node.get_from_path("site.css"))
+
+    @skipUnless(compress.zstandard, "zstandard is not installed")
+    def test_zstd(self):
+        self.assertEqual(self.render(compress_glob="*.css", compress_formats=["gzip", "zstd"]),
+                         ["image.png", "site.css", "site.css.gz", "site.css.zst"])
+        deploy_path = pathlib.Path(self.deploy.name)
+        self.assertEqual(
+            compress.zstandard.ZstdDecompressor().decompress(
+                (deploy_path / "site.css.zst").read_bytes()),
+            (deploy_path / "site.css").read_bytes(),
+        )
+
+    def test_zstd_not_installed(self):
+        with mock.patch.object(compress, "zstandard", None), self.assertRaises(ImportError):
+            self.render(compress_glob="*.css", compress_formats="zstd")
+
+    def test_stale_copies_removed(self):
+        self.render(compress_glob="*.css")
+        self.assertEqual(self.render(compress_glob="*.png"),
+                         ["image.png", "image.png.gz", "site.css"])
+
+    def test_source_not_removed(self):
+        (self.content_path / "image.png.gz").write_bytes(b"source")
+        root_node = self.get_tree(compress_glob="*.css")
+        for item in root_node.walk(True):
+            item.render()
+        root_node.get_from_path("image.png").render()
+        self.assertEqual((pathlib.Path(self.deploy.name) / "image.png.gz").read_bytes(),
+                         b"source")
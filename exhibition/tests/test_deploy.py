@@ -0,0 +1,108 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+import errno
+import os
+
+from exhibition import deploy
+
+
+class DeployTestCase(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(data)
+        return path
+
+    def read(self, name):
+        with open(os.path.join(self.path, name)) as f:
+            return f.read()
+
+    def test_write_file(self):
+        path = self.write("a.txt", "old")
+        os.link(path, os.path.join(self.path, "b.txt"))
+
+        deploy.write_file(path, b"new", 0o640)
+
+        self.assertEqual(self.read("a.txt"), "new")
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+        # other links to the old file are untouched
+        self.assertEqual(self.read("b.txt"), "old")
+        self.assertEqual(sorted(os.listdir(self.path)), ["a.txt", "b.txt"])
+
+    def test_write_file_error(self):
+        path = os.path.join(self.path, "a.txt")
+        with mock.patch("os.chmod", side_effect=PermissionError), \
+                self.assertRaises(PermissionError):
+            deploy.write_file(path, b"new", 0o644)
+
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_copy_tree(self):
+        src = os.path.join(self.path, "src")
+        self.write("src/dir/a.txt", "a")
+        os.symlink("dir/a.txt", os.path.join(src, "link"))
+
+        dst = deploy.make_staging(src)
+        deploy.copy_tree(src, dst)
+
+        self.assertEqual(os.path.dirname(dst), self.path)
+        self.assertTrue(os.path.samefile(os.path.join(src, "dir", "a.txt"),
+                                         os.path.join(dst, "dir", "a.txt")))
+        self.assertEqual(os.readlink(os.path.join(dst, "link")), "dir/a.txt")
+
+    def test_exchange(self):
+        a = self.write("a/file", "a")
+        b = self.write("b/file", "b")
+        try:
+            deploy.exchange(os.path.dirname(a), os.path.dirname(b))
+        except OSError as exp:
+            if exp.errno in (errno.ENOSYS, errno.EINVAL):
+                self.skipTest("renameat2 is not supported here")
+            raise
+
+        self.assertEqual(self.read("a/file"), "b")
+        self.assertEqual(self.read("b/file"), "a")
+
+    def test_exchange_missing(self):
+        a = self.write("a/file", "a")
+        with mock.patch.object(deploy, "_renameat2", False), \
+                self.assertRaises(OSError) as cm:
+            deploy.exchange(os.path.dirname(a), os.path.join(self.path, "b"))
+        self.assertEqual(cm.exception.errno, errno.ENOSYS)
+
+    def test_swap_new(self):
+        staging = deploy.make_staging(os.path.join(self.path, "site"))
+        self.write(os.path.join(staging, "index.html"), "new")
+
+        self.assertIsNone(deploy.swap(staging, os.path.join(self.path, "site")))
+        self.assertEqual(os.listdir(self.path), ["site"])
+        self.assertEqual(self.read("site/index.html"), "new")
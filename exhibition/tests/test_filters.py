@@ -21,20 +21,24 @@
 
 from tempfile import TemporaryDirectory
 from unittest import TestCase, mock
+import asyncio
 import base64
+import os
 import pathlib
 
 from jinja2.exceptions import TemplateRuntimeError
 from markupsafe import Markup
 
 from exhibition.filters.base import content_filter as base_filter
+from exhibition.filters.external import async_content_filter as async_external_filter
 from exhibition.filters.external import content_filter as external_filter
-from exhibition.filters.jinja2 import JinjaFilter
+from exhibition.filters.jinja2 import CountingBytecodeCache, JinjaFilter
 from exhibition.filters.jinja2 import content_filter as jinja_filter
 from exhibition.filters.markdown import content_filter as markdown_filter
 from exhibition.filters.pandoc import PandocMissingFormatError
+from exhibition.filters.pandoc import async_content_filter as async_pandoc_filter
 from exhibition.filters.pandoc import content_filter as pandoc_filter
-from exhibition.node import Node
+from exhibition.node import Node, _reader, _reading_as
 
 PLAIN_TEMPLATE = """
 {% for i in range(3) -%}
@@ -131,6 +135,39 @@ class ExternalCommandTestCase(TestCase):
         expected_output = base64.b64encode(content.encode()).decode() + "\n"
         self.assertEqual(output, expected_output)
 
+    def test_async_input_output(self):
+        content = "hello, how are you?"
+        node = Node(mock.Mock(), None, meta={"external_cmd": "cat {INPUT} | base64 > {OUTPUT}"})
+        node.meta = node._Node__meta
+        output = asyncio.run(async_external_filter(node, content))
+
+        expected_output = base64.b64encode(content.encode()).decode() + "\n"
+        self.assertEqual(output, expected_output)
+
+    def test_async_error(self):
+        node = Node(mock.Mock(), None, meta={"external_cmd": "cat {INPUT} > {OUTPUT}; exit 3"})
+        node.meta = node._Node__meta
+        with self.assertRaises(RuntimeError) as error:
+            asyncio.run(async_external_filter(node, "hello"))
+
+        self.assertIn('exitcode "3"', str(error.exception))
+
+    @mock.patch("exhibition.filters.external.run_in_thread")
+    def test_async_file_io_in_thread(self, thread_mock):
+        calls = []
+
+        async def run_in_thread(func, *args):
+            calls.append(func.__name__)
+            return func(*args)
+
+        thread_mock.side_effect = run_in_thread
+        node = Node(mock.Mock(), None, meta={"external_cmd": "cat {INPUT} > {OUTPUT}"})
+        node.meta = node._Node__meta
+        output = asyncio.run(async_external_filter(node, "hello"))
+
+        self.assertEqual(output, "hello")
+        self.assertEqual(calls, ["prepare_command", "read_output"])
+
     def test_filter_glob(self):
         with TemporaryDirectory() as content_path, TemporaryDirectory() as deploy_path:
             # default glob is *.*
@@ -412,6 +449,178 @@ class Jinja2TestCase(TestCase):
         result = content_filter(node, EMOJI_TEMPLATE)
         self.assertEqual(result, "Hello 🖼️")
 
+    def test_shared_environment(self):
+        content_filter = JinjaFilter()
+        with TemporaryDirectory() as tmp1_dir, TemporaryDirectory() as tmp2_dir:
+            root = Node(mock.Mock(), None, meta={"templates": [tmp1_dir],
+                                                 "deploy_path": tmp2_dir})
+            root.meta = root._Node__meta
+            nodes = []
+            for templates in [None, None, [tmp2_dir]]:
+                meta = {"templates": templates} if templates else {}
+                node = Node(mock.Mock(), root, meta=meta)
+                node.meta = node._Node__meta
+                nodes.append(node)
+                self.assertEqual(content_filter(node, PLAIN_TEMPLATE), "<p>0</p><p>1</p><p>2</p>")
+
+            envs = content_filter.environments[root]
+            self.assertEqual(len(envs), 2)
+
+            content_filter.node = nodes[0]
+            env = content_filter.get_shared_environment()
+            self.assertFalse(env.auto_reload)
+            self.assertIn("markdown", env.filters)
+
+            content_filter.node = nodes[1]
+            self.assertIs(content_filter.get_shared_environment(), env)
+
+            content_filter.node = nodes[2]
+            self.assertIsNot(content_filter.get_shared_environment(), env)
+
+            # a new tree gets new environments
+            other_root = Node(mock.Mock(), None, meta={"templates": [tmp1_dir]})
+            other_root.meta = other_root._Node__meta
+            content_filter.node = other_root
+            self.assertIsNot(content_filter.get_shared_environment(), env)
+
+    def test_bytecode_cache(self):
+        content_filter = JinjaFilter()
+        with TemporaryDirectory() as tmp_dir, TemporaryDirectory() as cache_dir:
+            with pathlib.Path(tmp_dir, "bob.j2").open("w") as tmpl:
+                tmpl.write(BASE_TEMPLATE)
+
+            caches = []
+            for i in range(2):
+                node = Node(mock.Mock(), None, meta={"templates": [tmp_dir], "extends": "bob.j2",
+                                                     "template_cache_dir": cache_dir})
+                node.is_leaf = False
+                result = content_filter(node, CONTENT_BLOCK)
+                self.assertEqual(result, "<p>Title</p>\n<p>0</p><p>1</p><p>2</p>")
+                content_filter.node = node
+                caches.append(content_filter.get_bytecode_cache())
+
+            self.assertIsNot(caches[0], caches[1])
+            self.assertEqual((caches[0].hits, caches[0].misses), (0, 1))
+            self.assertEqual((caches[1].hits, caches[1].misses), (1, 0))
+
+            with self.assertLogs("exhibition.filters.jinja2", "INFO") as logs:
+                content_filter.build_finished(node)
+            self.assertEqual(len(logs.output), 1)
+            self.assertIn("1 hits, 0 misses", logs.output[0])
+
+    def test_bytecode_cache_key(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        keys = []
+        for i in range(2):
+            with TemporaryDirectory() as tmp_dir:
+                os.chdir(tmp_dir)
+                cache = CountingBytecodeCache("cache")
+                keys.append(cache.get_cache_key("bob.j2",
+                                                os.path.join(tmp_dir, "templates", "bob.j2")))
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], cache.get_cache_key("bob.j2"))
+
+    def test_render_cache_bytecode_cache(self):
+        with TemporaryDirectory() as cache_dir:
+            node = Node(mock.Mock(), None, meta={"templates": [], "cache_dir": cache_dir,
+                                                 "render_cache": True})
+            node.is_leaf = False
+            content_filter = JinjaFilter()
+            content_filter.node = node
+            self.assertEqual(content_filter.get_bytecode_cache().directory,
+                             str(pathlib.Path(cache_dir, "templates").resolve()))
+
+            node.meta["template_cache_dir"] = os.path.join(cache_dir, "other")
+            self.assertEqual(content_filter.get_bytecode_cache().directory,
+                             str(pathlib.Path(cache_dir, "other").resolve()))
+
+    def test_no_bytecode_cache(self):
+        node = Node(mock.Mock(), None, meta={"templates": []})
+        node.is_leaf = False
+        content_filter = JinjaFilter()
+        content_filter(node, PLAIN_TEMPLATE)
+        content_filter.node = node
+        self.assertIsNone(content_filter.get_bytecode_cache())
+        self.assertIsNone(content_filter.get_shared_environment().bytecode_cache)
+
+    def test_compiled_templates(self):
+        for target_name in ["templates.zip", "templates"]:
+            with self.subTest(target_name), TemporaryDirectory() as tmp_dir, \
+                    TemporaryDirectory() as src_dir:
+                with pathlib.Path(src_dir, "bob.j2").open("w") as tmpl:
+                    tmpl.write(BASE_TEMPLATE)
+                with pathlib.Path(src_dir, "md.j2").open("w") as tmpl:
+                    tmpl.write(MD_TEMPLATE)
+
+                target = pathlib.Path(tmp_dir, target_name)
+                node = Node(mock.Mock(), None, meta={"templates": [src_dir]})
+                node.is_leaf = False
+                JinjaFilter().compile_templates(node, target)
+                self.assertTrue(target.exists())
+                self.assertEqual(target.is_dir(), not target_name.endswith(".zip"))
+
+                # no templates to fall back to, so they must be loaded from target
+                node = Node(mock.Mock(), None, meta={"templates": [], "extends": "bob.j2",
+                                                     "compiled_templates": str(target)})
+                node.is_leaf = False
+                content_filter = JinjaFilter()
+                result = content_filter(node, CONTENT_BLOCK)
+                self.assertEqual(result, "<p>Title</p>\n<p>0</p><p>1</p><p>2</p>")
+
+                node = Node(mock.Mock(), None, meta={"templates": [],
+                                                     "compiled_templates": str(target)})
+                node.is_leaf = False
+                result = content_filter(node, "{% include 'md.j2' %}")
+                self.assertEqual(result, "<h2>Hello</h2>\n<p>This is <em>text</em></p>")
+
+    def test_compiled_templates_fallback(self):
+        with TemporaryDirectory() as tmp_dir, TemporaryDirectory() as src_dir:
+            target = pathlib.Path(tmp_dir, "templates.zip")
+            node = Node(mock.Mock(), None, meta={"templates": [src_dir]})
+            node.is_leaf = False
+            JinjaFilter().compile_templates(node, target)
+
+            # not compiled, so loaded from templates
+            with pathlib.Path(src_dir, "bob.j2").open("w") as tmpl:
+                tmpl.write(BASE_TEMPLATE)
+
+            node = Node(mock.Mock(), None, meta={"templates": [src_dir], "extends": "bob.j2",
+                                                 "compiled_templates": str(target)})
+            node.is_leaf = False
+            result = JinjaFilter()(node, CONTENT_BLOCK)
+            self.assertEqual(result, "<p>Title</p>\n<p>0</p><p>1</p><p>2</p>")
+
+    def test_template_dependencies(self):
+        with TemporaryDirectory() as tmp_dir, TemporaryDirectory() as src_dir:
+            pathlib.Path(src_dir, "partials").mkdir()
+            for name, data in [("bob.j2", BASE_TEMPLATE), ("partials/macros.j2", ""),
+                               ("partials/footer.j2", "{% include './md.j2' %}"),
+                               ("md.j2", MD_TEMPLATE)]:
+                with pathlib.Path(src_dir, name).open("w") as tmpl:
+                    tmpl.write(data)
+
+            path = pathlib.Path(tmp_dir, "page.html")
+            with path.open("w") as page:
+                page.write("{% block content %}{% import 'partials/macros.j2' as m %}"
+                           "{% include ['missing.j2', 'partials/footer.j2'] %}{% endblock %}")
+
+            node = Node(path, None, meta={"templates": [src_dir], "extends": "bob.j2",
+                                          "filter": "exhibition.filters.jinja2"})
+            node.content
+            self.assertEqual(node.dependencies, [
+                ("template", "bob.j2"),
+                ("template", "md.j2"),
+                ("template", "missing.j2"),
+                ("template", "partials/footer.j2"),
+                ("template", "partials/macros.j2"),
+            ])
+
+            # templates aren't recorded against anything outside of a render
+            content_filter = JinjaFilter()
+            content_filter.node = node
+            content_filter.get_shared_environment().get_template("md.j2")
+            self.assertEqual(len(node.dependencies), 5)
+
 
 class BaseFilterTestCase(TestCase):
     def test_not_implemented(self):
@@ -447,6 +656,104 @@ class PandocFilterTestCase(TestCase):
         with self.assertRaises(PandocMissingFormatError):
             pandoc_filter(node, content)
 
+    def fake_pandoc(self, tmp_dir, script):
+        path = pathlib.Path(tmp_dir, "pandoc")
+        with path.open("w") as f:
+            f.write("#!/bin/sh\n" + script)
+        path.chmod(0o755)
+        return mock.patch("exhibition.filters.pandoc.get_pandoc_path", return_value=str(path))
+
+    def test_async_filter(self):
+        node = Node(mock.Mock(), None, meta={"pandoc_config": {
+            "format": "md", "extra_args": ["--wrap=none"], "filters": ["a.lua", "b"],
+        }})
+        node.meta = node._Node__meta
+        with TemporaryDirectory() as tmp_dir, self.fake_pandoc(tmp_dir, 'echo "$@"; cat'):
+            output = asyncio.run(async_pandoc_filter(node, "Hello"))
+
+        self.assertEqual(
+            output,
+            "--from=markdown --to=html --wrap=none --lua-filter=a.lua --filter=b\nHello"
+        )
+
+    def test_async_filter_error(self):
+        node = Node(mock.Mock(), None, meta={"pandoc_config": {"format": "org"}})
+        node.meta = node._Node__meta
+        with TemporaryDirectory() as tmp_dir, self.fake_pandoc(tmp_dir, "echo oops >&2; exit 3"):
+            with self.assertRaises(RuntimeError) as error:
+                asyncio.run(async_pandoc_filter(node, "Hello"))
+
+        self.assertIn('exitcode "3"', str(error.exception))
+        self.assertIn("oops", str(error.exception))
+
+    def test_async_filter_encoding(self):
+        node = Node(mock.Mock(), None, meta={"pandoc_config": {"format": "md",
+                                                               "encoding": "latin-1"}})
+        node.meta = node._Node__meta
+        script = "od -An -tx1 | tr -d ' \\n'; printf ' caf\\351'"
+        with TemporaryDirectory() as tmp_dir, self.fake_pandoc(tmp_dir, script):
+            output = asyncio.run(async_pandoc_filter(node, "caf\xe9"))
+
+        self.assertEqual(output, "636166e9 caf\xe9")
+
+    def test_async_filter_bad_output(self):
+        node = Node(mock.Mock(), None, meta={"pandoc_config": {"format": "md"}})
+        node.meta = node._Node__meta
+        with TemporaryDirectory() as tmp_dir, self.fake_pandoc(tmp_dir, "printf 'caf\\351'"):
+            with self.assertRaises(UnicodeDecodeError):
+                asyncio.run(async_pandoc_filter(node, "Hello"))
+
+    def test_async_filter_path_off_loop(self):
+        node = Node(mock.Mock(), None, meta={"pandoc_config": {"format": "md"}})
+        node.meta = node._Node__meta
+        loops = []
+
+        with TemporaryDirectory() as tmp_dir, self.fake_pandoc(tmp_dir, "cat") as path_mock:
+            path = path_mock.return_value
+
+            def get_path():
+                try:
+                    loops.append(asyncio.get_running_loop())
+                except RuntimeError:
+                    loops.append(None)
+                return path
+
+            path_mock.side_effect = get_path
+            output = asyncio.run(async_pandoc_filter(node, "Hello"))
+
+        self.assertEqual(output, "Hello")
+        self.assertEqual(loops, [None])
+
+    @mock.patch("exhibition.filters.pandoc.convert_text")
+    def test_async_filter_fallback(self, convert_mock):
+        node = Node(mock.Mock(), None, meta={"pandoc_config": {"format": "org",
+                                                               "sandbox": True}})
+        node.meta = node._Node__meta
+        readers = []
+
+        def convert(*args, **kwargs):
+            readers.append(_reader.get())
+            return "converted"
+
+        async def render():
+            with _reading_as(node):
+                return await async_pandoc_filter(node, "Hello")
+
+        convert_mock.side_effect = convert
+        output = asyncio.run(render())
+
+        self.assertEqual(output, "converted")
+        self.assertEqual(convert_mock.call_args,
+                         (("Hello",), {"format": "org", "to": "html", "sandbox": True}))
+        # the thread has the same context, so what Pandoc reads is tracked
+        self.assertEqual(readers, [node])
+
+    def test_async_missing_format(self):
+        node = Node(mock.Mock(), None, meta={})
+        node.meta = node._Node__meta
+        with self.assertRaises(PandocMissingFormatError):
+            asyncio.run(async_pandoc_filter(node, "Hello"))
+
 
 class MultipleFiltersTestCase(TestCase):
     def build_and_render(self, filters=None):
@@ -19,14 +19,45 @@
 #
 ##
 
+from filecmp import dircmp
 from tempfile import TemporaryDirectory
-from unittest import TestCase
+from unittest import TestCase, mock
+import errno
 import os
 import pathlib
+import shutil
+import threading
 
+from exhibition import deploy
 from exhibition.config import Config
+from exhibition.filters.jinja2 import JinjaFilter
+from exhibition.node import Node
+from exhibition.state import node_key
 from exhibition.utils import gen
 
+SITE_FILES = {
+    "blog/meta.yaml": "cache_bust_glob: \"*.css\"",
+    "blog/post1.html": "{% mark intro %}Intro one{% endmark %} Post one",
+    "blog/post2.html": "{% mark intro %}Intro two{% endmark %} Post two",
+    "blog/style.css": "body { color: black; }",
+    "blog/index.html": """
+{%- for post in node.siblings.values() if post.marks.intro -%}
+<a href="{{ post.full_url }}">{{ post.marks.intro }}</a>
+{% endfor -%}
+<link href="{{ node.get_from_path('style.css').full_url }}">
+""",
+    "index.html": "{{ node.get_from_path('blog/post2.html').marks.intro }}",
+    "image.bin": b"\x00\xff\x00",
+}
+
+
+def write_site(content):
+    for name, data in SITE_FILES.items():
+        path = pathlib.Path(content, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+
 
 class GenTestCase(TestCase):
     def test_clean_deploy_dir(self):
@@ -62,3 +93,524 @@ class GenTestCase(TestCase):
             for item in files + dirs:
                 with self.subTest("%s exists in %s" % (item, deploy)):
                     self.assertTrue(pathlib.Path(deploy, item).exists())
+
+    @mock.patch.object(JinjaFilter, "build_finished")
+    def test_build_finished(self, finished_mock):
+        with TemporaryDirectory() as deploy, TemporaryDirectory() as content:
+            settings = Config({"deploy_path": deploy, "content_path": content,
+                               "filter": "exhibition.filters.jinja2", "templates": []})
+            for name in ["index.html", "page.html"]:
+                pathlib.Path(content, name).touch()
+
+            gen(settings)
+
+            self.assertEqual(finished_mock.call_count, 1)
+            root_node = finished_mock.call_args[0][0]
+            self.assertIsInstance(root_node, Node)
+            self.assertIsNone(root_node.parent)
+
+    def assertSameTree(self, left, right):
+        def compare(diff):
+            self.assertEqual(diff.left_only + diff.right_only + diff.diff_files + diff.funny_files,
+                             [])
+            for sub_diff in diff.subdirs.values():
+                compare(sub_diff)
+        compare(dircmp(left, right))
+
+    @mock.patch.object(JinjaFilter, "build_finished")
+    def test_jobs(self, finished_mock):
+        with TemporaryDirectory() as content, TemporaryDirectory() as serial_deploy, \
+                TemporaryDirectory() as deploy:
+            write_site(content)
+            settings = {"content_path": content, "filter": "exhibition.filters.jinja2",
+                        "templates": []}
+
+            gen(Config(dict(settings, deploy_path=serial_deploy)))
+            gen(Config(dict(settings, deploy_path=deploy)), jobs=3)
+
+            self.assertSameTree(serial_deploy, deploy)
+            with pathlib.Path(deploy, "index.html").open() as f:
+                self.assertEqual(f.read(), "Intro two")
+
+            # marks and cache busting were copied back from the workers
+            root_node = finished_mock.call_args[0][0]
+            post_node = root_node.get_from_path("/blog/post1.html")
+            self.assertEqual(post_node._marks, {"intro": "Intro one"})
+            css_node = root_node.get_from_path("/blog/style.css")
+            self.assertIn("cache_bust", css_node.__dict__)
+            self.assertTrue(pathlib.Path(css_node.full_path).exists())
+
+    @mock.patch("exhibition.utils.multiprocessing.get_context", side_effect=ValueError)
+    def test_jobs_without_fork(self, context_mock):
+        with TemporaryDirectory() as content, TemporaryDirectory() as deploy:
+            write_site(content)
+            settings = Config({"content_path": content, "deploy_path": deploy,
+                               "filter": "exhibition.filters.jinja2", "templates": []})
+
+            with self.assertLogs("exhibition", "WARNING"):
+                gen(settings, jobs=3)
+
+            with pathlib.Path(deploy, "index.html").open() as f:
+                self.assertEqual(f.read(), "Intro two")
+
+    def test_threads(self):
+        with TemporaryDirectory() as content, TemporaryDirectory() as serial_deploy, \
+                TemporaryDirectory() as deploy:
+            write_site(content)
+            settings = {"content_path": content, "filter": "exhibition.filters.jinja2",
+                        "templates": [],
+                        "filter_concurrency": {"exhibition.filters.jinja2": 2}}
+
+            gen(Config(dict(settings, deploy_path=serial_deploy)))
+            gen(Config(dict(settings, deploy_path=deploy)), jobs=3, mode="thread")
+
+            self.assertSameTree(serial_deploy, deploy)
+            with pathlib.Path(deploy, "index.html").open() as f:
+                self.assertEqual(f.read(), "Intro two")
+
+    def test_async(self):
+        with TemporaryDirectory() as content, TemporaryDirectory() as serial_deploy, \
+                TemporaryDirectory() as deploy:
+            write_site(content)
+            with pathlib.Path(content, "blog", "shout.txt").open("w") as f:
+                f.write("hello")
+            settings = {"content_path": content, "templates": [],
+                        "filter": ["exhibition.filters.jinja2",
+                                   ["exhibition.filters.external", "*.txt"]],
+                        "external_cmd": "tr a-z A-Z < {INPUT} > {OUTPUT}",
+                        "filter_concurrency": {"exhibition.filters.external": 1}}
+
+            gen(Config(dict(settings, deploy_path=serial_deploy)))
+            gen(Config(dict(settings, deploy_path=deploy)), jobs=3, mode="async")
+
+            self.assertSameTree(serial_deploy, deploy)
+            with pathlib.Path(deploy, "index.html").open() as f:
+                self.assertEqual(f.read(), "Intro two")
+            with pathlib.Path(deploy, "blog", "shout.txt").open() as f:
+                self.assertEqual(f.read(), "HELLO")
+
+
+class IncrementalTestCase(TestCase):
+    def setUp(self):
+        self.content = TemporaryDirectory()
+        self.deploy = TemporaryDirectory()
+        self.cache = TemporaryDirectory()
+        write_site(self.content.name)
+        self.settings = {"content_path": self.content.name, "deploy_path": self.deploy.name,
+                         "cache_dir": self.cache.name, "filter": "exhibition.filters.jinja2",
+                         "templates": []}
+
+    def tearDown(self):
+        self.content.cleanup()
+        self.deploy.cleanup()
+        self.cache.cleanup()
+
+    def build(self, **kwargs):
+        """Returns the paths of the nodes that were rendered"""
+        settings = Config(dict(self.settings, **kwargs))
+        with mock.patch.object(Node, "render", autospec=True, side_effect=Node.render) as render:
+            gen(settings, incremental=True)
+        return {node_key(call[0][0]) for call in render.call_args_list}
+
+    def write(self, name, data):
+        path = pathlib.Path(self.content.name, name)
+        with path.open("w") as f:
+            f.write(data)
+
+    def read(self, name):
+        with pathlib.Path(self.deploy.name, name).open() as f:
+            return f.read()
+
+    def assertSameAsFullBuild(self):
+        with TemporaryDirectory() as deploy:
+            gen(Config(dict(self.settings, deploy_path=deploy)))
+            GenTestCase.assertSameTree(self, deploy, self.deploy.name)
+
+    def test_first_build(self):
+        stray = pathlib.Path(self.deploy.name, "stray.txt")
+        stray.touch()
+
+        rendered = self.build()
+
+        self.assertEqual(len(rendered), len(SITE_FILES) + 1)
+        self.assertFalse(stray.exists())
+        self.assertTrue(pathlib.Path(self.cache.name, "state.json").exists())
+        self.assertSameAsFullBuild()
+
+    def test_no_changes(self):
+        self.build()
+        stray = pathlib.Path(self.deploy.name, "stray.txt")
+        stray.touch()
+
+        self.assertEqual(self.build(), set())
+        self.assertTrue(stray.exists())
+        stray.unlink()
+        self.assertSameAsFullBuild()
+
+    def test_touched(self):
+        self.build()
+        for dirpath, dirnames, filenames in os.walk(self.content.name):
+            for name in filenames:
+                os.utime(os.path.join(dirpath, name))
+
+        self.assertEqual(self.build(), set())
+
+    def test_fresh_checkout(self):
+        self.build()
+        # a copy of the content has new modification times and inodes
+        with TemporaryDirectory() as content:
+            content = os.path.join(content, "content")
+            shutil.copytree(self.content.name, content, copy_function=shutil.copy)
+            self.assertEqual(self.build(content_path=content), set())
+
+            with pathlib.Path(content, "blog", "post1.html").open("w") as f:
+                f.write("{% mark intro %}Intro 1{% endmark %} Post one")
+            self.assertEqual(self.build(content_path=content),
+                             {"blog/post1.html", "blog/index.html"})
+
+    def test_static_file_changed(self):
+        self.build()
+        with pathlib.Path(self.content.name, "image.bin").open("wb") as f:
+            f.write(b"\x00\x00")
+
+        rendered = self.build()
+
+        # nothing reads the static file
+        self.assertEqual(rendered, {"image.bin"})
+        self.assertSameAsFullBuild()
+
+    def test_content_changed(self):
+        self.build()
+        self.write("blog/post2.html", "{% mark intro %}Intro 2{% endmark %} Post two")
+
+        rendered = self.build()
+
+        # index.html reads post2 directly, blog/index.html via its siblings
+        self.assertEqual(rendered, {"blog/post2.html", "index.html", "blog/index.html"})
+        self.assertEqual(self.read("index.html"), "Intro 2")
+        self.assertSameAsFullBuild()
+
+    def test_unchanged_output_not_written(self):
+        self.build()
+        deployed = pathlib.Path(self.deploy.name, "blog", "index.html")
+        os.utime(deployed, ns=(0, 0))
+        # the intro, which is all blog/index.html uses, is the same
+        self.write("blog/post2.html", "{% mark intro %}Intro two{% endmark %} Post 2")
+
+        rendered = self.build()
+
+        self.assertIn("blog/index.html", rendered)
+        self.assertEqual(deployed.stat().st_mtime_ns, 0)
+        self.assertEqual(self.read("blog/post2.html"), "Intro two Post 2")
+        self.assertSameAsFullBuild()
+
+        # meta changes are always written out
+        self.write("blog/meta.yaml", "cache_bust_glob: \"*.css\"\nfile_mode: 0o600")
+        self.build()
+        self.assertEqual(deployed.stat().st_mode & 0o777, 0o600)
+        self.assertNotEqual(deployed.stat().st_mtime_ns, 0)
+
+    def test_added(self):
+        self.build()
+        self.write("blog/post3.html", "{% mark intro %}Intro three{% endmark %} Post three")
+
+        rendered = self.build()
+
+        self.assertEqual(rendered, {"blog/post3.html", "blog/index.html"})
+        self.assertIn("Intro three", self.read("blog/index.html"))
+        self.assertSameAsFullBuild()
+
+    def test_dependency_of_dependency_changed(self):
+        self.build()
+        self.write("about.html", "{{ node.get_from_path('index.html').content }}")
+        self.build()
+        self.write("blog/post2.html", "{% mark intro %}Intro 2{% endmark %} Post two")
+
+        rendered = self.build()
+
+        self.assertIn("about.html", rendered)
+        self.assertEqual(self.read("about.html"), "Intro 2")
+        self.assertSameAsFullBuild()
+
+    def test_url_read(self):
+        self.write("links.html", "{{ node.get_from_path('blog/post1.html').full_url }}")
+        self.build()
+
+        # only post1's URL was read, which hasn't changed
+        self.write("blog/post1.html", "{% mark intro %}Intro 1{% endmark %} Post one")
+        self.assertEqual(self.build(), {"blog/post1.html", "blog/index.html"})
+
+        self.write("blog/meta.yaml", "strip_exts: []")
+        self.assertIn("links.html", self.build())
+        self.assertEqual(self.read("links.html"), "/blog/post1.html")
+        self.assertSameAsFullBuild()
+
+    def test_cache_bust_changed(self):
+        self.build()
+        old_css = [p.name for p in pathlib.Path(self.deploy.name, "blog").glob("style.*.css")]
+        self.write("blog/style.css", "body { color: white; }")
+
+        self.build()
+
+        new_css = [p.name for p in pathlib.Path(self.deploy.name, "blog").glob("style.*.css")]
+        self.assertEqual(len(new_css), 1)
+        self.assertNotEqual(old_css, new_css)
+        self.assertIn(new_css[0], self.read("blog/index.html"))
+        self.assertSameAsFullBuild()
+
+    def test_removed(self):
+        self.build()
+        pathlib.Path(self.content.name, "blog", "post1.html").unlink()
+
+        rendered = self.build()
+
+        self.assertIn("blog/index.html", rendered)
+        self.assertFalse(pathlib.Path(self.deploy.name, "blog", "post1.html").exists())
+        self.assertSameAsFullBuild()
+
+    def test_removed_compressed(self):
+        self.settings["compress_glob"] = "*.html"
+        self.build()
+        compressed = pathlib.Path(self.deploy.name, "blog", "post1.html.gz")
+        self.assertTrue(compressed.exists())
+
+        pathlib.Path(self.content.name, "blog", "post1.html").unlink()
+        self.build()
+
+        self.assertFalse(compressed.exists())
+        self.assertSameAsFullBuild()
+
+    def test_compression_turned_off(self):
+        self.settings["compress_glob"] = "*.html"
+        self.build()
+        compressed = pathlib.Path(self.deploy.name, "blog", "post1.html.gz")
+        self.assertTrue(compressed.exists())
+
+        del self.settings["compress_glob"]
+        self.write("blog/post1.html", "{% mark intro %}Intro 1{% endmark %} Post one")
+        self.build()
+
+        self.assertFalse(compressed.exists())
+        self.assertSameAsFullBuild()
+
+    def test_compressed_source_kept(self):
+        self.settings["compress_glob"] = "*.html"
+        self.build()
+
+        # was a compressed copy, now it's the output of a source file
+        self.settings["compress_glob"] = "*.css"
+        self.write("index.html.gz", "not really gzip")
+        self.build()
+        self.assertEqual(self.read("index.html.gz"), "not really gzip")
+
+    def test_removed_dir(self):
+        self.build()
+        pathlib.Path(self.content.name, "old").mkdir()
+        self.write("old/page.txt", "hello")
+        self.build()
+        self.assertTrue(pathlib.Path(self.deploy.name, "old", "page.txt").exists())
+
+        pathlib.Path(self.content.name, "old", "page.txt").unlink()
+        pathlib.Path(self.content.name, "old").rmdir()
+        self.write("old", "now a file")
+
+        self.assertIn("old", self.build())
+        self.assertEqual(self.read("old"), "now a file")
+        self.assertSameAsFullBuild()
+
+    def test_meta_changed(self):
+        self.build()
+        self.write("blog/meta.yaml", "cache_bust_glob: \"*.css\"\nfile_mode: 0o600")
+
+        rendered = self.build()
+
+        self.assertIn("blog/style.css", rendered)
+        self.assertNotIn("image.bin", rendered)
+        self.assertEqual(pathlib.Path(self.deploy.name, "blog", "post1.html").stat().st_mode
+                         & 0o777, 0o600)
+
+    def test_template_changed(self):
+        templates = pathlib.Path(self.content.name, "templates")
+        (templates / "partials").mkdir(parents=True)
+        self.settings.update(templates=str(templates), ignore="templates")
+        for name, data in [("base.j2", "{% block body %}{% endblock %}"),
+                           ("partials/footer.j2", "footer"),
+                           ("partials/header.j2", "header")]:
+            self.write("templates/" + name, data)
+        self.write("page.html", "---\nextends: base.j2\ndefault_block: body\n---\n"
+                                "{% include 'partials/footer.j2' %}")
+        self.write("other.html", "{% include 'partials/header.j2' %}")
+        self.build()
+
+        self.write("templates/partials/footer.j2", "new footer")
+        self.assertEqual(self.build(), {"page.html"})
+        self.assertEqual(self.read("page.html").strip(), "new footer")
+
+        self.write("templates/base.j2", "base {% block body %}{% endblock %}")
+        self.assertEqual(self.build(), {"page.html"})
+        self.assertEqual(self.read("page.html").split(), ["base", "new", "footer"])
+
+        self.write("templates/unused.j2", "not used")
+        self.assertEqual(self.build(), set())
+        self.assertSameAsFullBuild()
+
+    def test_site_settings_changed(self):
+        self.build()
+
+        rendered = self.build(file_mode=0o600)
+
+        self.assertEqual(len(rendered), len(SITE_FILES) + 1)
+
+    def test_missing_output(self):
+        self.build()
+        pathlib.Path(self.deploy.name, "image.bin").unlink()
+
+        self.assertIn("image.bin", self.build())
+        self.assertSameAsFullBuild()
+
+    def test_deploy_path_changed(self):
+        self.build()
+        with TemporaryDirectory() as deploy:
+            rendered = self.build(deploy_path=deploy)
+
+        self.assertEqual(len(rendered), len(SITE_FILES) + 1)
+
+    def test_corrupt_state(self):
+        self.build()
+        with pathlib.Path(self.cache.name, "state.json").open("w") as f:
+            f.write("{")
+
+        with self.assertLogs("exhibition.state", "WARNING"):
+            rendered = self.build()
+
+        self.assertEqual(len(rendered), len(SITE_FILES) + 1)
+
+
+class AtomicTestCase(TestCase):
+    def setUp(self):
+        self.content = TemporaryDirectory()
+        self.parent = TemporaryDirectory()
+        self.cache = TemporaryDirectory()
+        write_site(self.content.name)
+        self.deploy_path = os.path.join(self.parent.name, "site")
+        self.settings = {"content_path": self.content.name, "deploy_path": self.deploy_path,
+                         "cache_dir": self.cache.name, "filter": "exhibition.filters.jinja2",
+                         "templates": []}
+
+    def tearDown(self):
+        self.content.cleanup()
+        self.parent.cleanup()
+        self.cache.cleanup()
+
+    def gen(self, **kwargs):
+        gen(Config(dict(self.settings)), atomic=True, **kwargs)
+        for thread in threading.enumerate():
+            if thread.name == deploy.CLEANUP_THREAD_NAME:
+                thread.join()
+
+    def write_old_site(self, path):
+        os.mkdir(path)
+        with open(os.path.join(path, "index.html"), "w") as f:
+            f.write("old")
+
+    def assertSameAsFullBuild(self):
+        with TemporaryDirectory() as full_deploy:
+            gen(Config(dict(self.settings, deploy_path=full_deploy)))
+            GenTestCase.assertSameTree(self, full_deploy, self.deploy_path)
+
+    def test_first_build(self):
+        self.gen()
+        self.assertEqual(os.listdir(self.parent.name), ["site"])
+        self.assertSameAsFullBuild()
+
+    def test_replaces_old_site(self):
+        self.write_old_site(self.deploy_path)
+        original_render = Node.render
+
+        def render(node):
+            # the old site is left alone until the new one is finished
+            with open(os.path.join(self.deploy_path, "index.html")) as f:
+                self.assertEqual(f.read(), "old")
+            original_render(node)
+
+        with mock.patch.object(Node, "render", autospec=True, side_effect=render) as render_mock:
+            self.gen()
+
+        self.assertEqual(render_mock.call_count, len(SITE_FILES) + 1)
+        self.assertEqual(os.listdir(self.parent.name), ["site"])
+        self.assertSameAsFullBuild()
+
+    def test_failed_build(self):
+        self.write_old_site(self.deploy_path)
+
+        with mock.patch.object(Node, "render", side_effect=ValueError), \
+                self.assertRaises(ValueError):
+            self.gen()
+
+        self.assertEqual(os.listdir(self.parent.name), ["site"])
+        self.assertEqual(os.listdir(self.deploy_path), ["index.html"])
+
+    def test_exchange_not_supported(self):
+        self.write_old_site(self.deploy_path)
+
+        with mock.patch.object(deploy, "exchange", side_effect=OSError(errno.ENOSYS, "")), \
+                self.assertLogs("exhibition.deploy", "WARNING"):
+            self.gen()
+
+        self.assertEqual(os.listdir(self.parent.name), ["site"])
+        self.assertSameAsFullBuild()
+
+    def test_fallback_rename_fails(self):
+        self.write_old_site(self.deploy_path)
+        rename = os.rename
+
+        def fail_second(src, dst):
+            fail_second.calls += 1
+            if fail_second.calls == 2:
+                raise OSError(errno.EXDEV, "")
+            rename(src, dst)
+
+        fail_second.calls = 0
+        with mock.patch.object(deploy, "exchange", side_effect=OSError(errno.ENOSYS, "")), \
+                mock.patch("os.rename", side_effect=fail_second), \
+                self.assertLogs("exhibition.deploy", "WARNING"), self.assertRaises(OSError):
+            self.gen()
+
+        # the old site is still there and nothing else is
+        self.assertEqual(os.listdir(self.parent.name), ["site"])
+        with open(os.path.join(self.deploy_path, "index.html")) as f:
+            self.assertEqual(f.read(), "old")
+
+    def test_symlink(self):
+        self.write_old_site(os.path.join(self.parent.name, "v1"))
+        os.symlink("v1", self.deploy_path)
+
+        self.gen()
+
+        self.assertTrue(os.path.islink(self.deploy_path))
+        target = os.readlink(self.deploy_path)
+        self.assertFalse(os.path.isabs(target))
+        self.assertEqual(sorted(os.listdir(self.parent.name)), sorted(["site", target]))
+        self.assertSameAsFullBuild()
+
+    def test_incremental(self):
+        self.gen(incremental=True)
+        image_inode = os.stat(os.path.join(self.deploy_path, "image.bin")).st_ino
+        index_path = os.path.join(self.deploy_path, "index.html")
+        index_inode = os.stat(index_path).st_ino
+        with pathlib.Path(self.content.name, "blog", "post2.html").open("w") as f:
+            f.write("{% mark intro %}Intro 2{% endmark %} Post two")
+
+        with mock.patch.object(Node, "render", autospec=True, side_effect=Node.render) as render:
+            self.gen(incremental=True)
+
+        self.assertEqual({node_key(call[0][0]) for call in render.call_args_list},
+                         {"blog/post2.html", "index.html", "blog/index.html"})
+        # unchanged files are carried over as hard links
+        self.assertEqual(os.stat(os.path.join(self.deploy_path, "image.bin")).st_ino,
+                         image_inode)
+        self.assertNotEqual(os.stat(index_path).st_ino, index_inode)
+        with open(index_path) as f:
+            self.assertEqual(f.read(), "Intro 2")
+        self.assertEqual(os.listdir(self.parent.name), ["site"])
+        self.assertSameAsFullBuild()
@@ -0,0 +1,209 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+import os
+import pathlib
+
+from exhibition.config import Config
+from exhibition.live import LiveRenderer
+from exhibition.node import Node
+from exhibition.state import node_key
+from exhibition.tests.test_gen import write_site
+from exhibition.watch import WatchedTree
+
+
+class LiveRendererTestCase(TestCase):
+    def setUp(self):
+        self.content = TemporaryDirectory()
+        self.deploy = TemporaryDirectory()
+        self.templates = TemporaryDirectory()
+        write_site(self.content.name)
+        settings = Config({"content_path": self.content.name,
+                           "deploy_path": self.deploy.name,
+                           "filter": "exhibition.filters.jinja2",
+                           "templates": [self.templates.name]})
+        # updates are made by the tests rather than in the background
+        self.tree = WatchedTree(settings, 60)
+        self.renderer = LiveRenderer(self.tree)
+
+    def tearDown(self):
+        self.tree.close()
+        self.content.cleanup()
+        self.deploy.cleanup()
+        self.templates.cleanup()
+
+    def write(self, name, data, root=None):
+        path = pathlib.Path(root or self.content.name, name)
+        with path.open("w") as f:
+            f.write(data)
+        return str(path)
+
+    def get(self, path):
+        return self.renderer.render(self.renderer.resolve(path)).decode()
+
+    def test_resolve(self):
+        root_node = self.tree.root_node
+        style = root_node.get_from_path("blog/style.css")
+        self.assertIs(self.renderer.resolve(""), root_node)
+        self.assertIs(self.renderer.resolve("blog"), root_node.get_from_path("blog"))
+        self.assertIs(self.renderer.resolve("blog/post1"),
+                      root_node.get_from_path("blog/post1.html"))
+        self.assertIs(self.renderer.resolve("blog/post1.html"),
+                      root_node.get_from_path("blog/post1.html"))
+        self.assertIs(self.renderer.resolve(style.full_url.strip("/")), style)
+
+        self.assertIsNone(self.renderer.resolve("blog/style.css"))
+        self.assertIsNone(self.renderer.resolve("blog/post3"))
+        self.assertIsNone(self.renderer.resolve("image.bin/post1"))
+        self.assertIsNone(self.renderer.resolve("blog/../index.html"))
+
+    def test_render(self):
+        self.assertEqual(self.get("index.html"), "Intro two")
+        self.assertEqual(self.get("blog/post1"), "Intro one Post one")
+        self.assertEqual(self.renderer.render(self.renderer.resolve("image.bin")),
+                         b"\x00\xff\x00")
+        # only what was asked for, and what it read, was rendered
+        root_node = self.tree.root_node
+        self.assertIn("_content", root_node.get_from_path("blog/post2.html").__dict__)
+        self.assertNotIn("_content", root_node.get_from_path("blog/index.html").__dict__)
+        self.assertEqual(os.listdir(self.deploy.name), [])
+
+    def test_cached(self):
+        node = self.renderer.resolve("index.html")
+        content = self.renderer.render(node)
+        node.forget()
+        with mock.patch.object(Node, "content", new_callable=mock.PropertyMock) as content_mock:
+            self.assertIs(self.renderer.render(node), content)
+        self.assertEqual(content_mock.call_count, 0)
+
+    def test_cache_size(self):
+        self.renderer.cache_size = 2
+        for path in ["blog/post1", "blog/post2", "index.html", "blog/post2"]:
+            self.get(path)
+        self.assertEqual(list(self.renderer._cache), ["index.html", "blog/post2.html"])
+
+    def test_evicted_forgotten(self):
+        self.renderer.cache_size = 1
+        self.get("blog/post2")
+        post2 = self.renderer.resolve("blog/post2")
+        self.assertIn("_content", post2.__dict__)
+
+        self.get("blog/post1")
+        self.assertEqual(list(self.renderer._cache), ["blog/post1.html"])
+        self.assertNotIn("_content", post2.__dict__)
+        self.assertIsNotNone(post2.dependencies)
+
+    def test_evicted_dependency_changed(self):
+        self.renderer.cache_size = 2
+        self.write("base.j2", "{% block body %}{% endblock %}", self.templates.name)
+        self.write("page.html", "---\nextends: base.j2\ndefault_block: body\n---\n"
+                   "{% mark intro %}page{% endmark %}")
+        self.write("list.html", "{% for mark in node.get_from_path('page.html').marks.intro %}"
+                   "{{ mark }}{% endfor %}")
+        self.tree.update([os.path.join(self.content.name, "page.html"),
+                          os.path.join(self.content.name, "list.html")])
+        self.get("page")
+        self.assertEqual(self.get("list"), "page")
+
+        # page.html is evicted, but list.html still depends on its template
+        self.get("index.html")
+        self.assertEqual(list(self.renderer._cache), ["list.html", "index.html"])
+
+        path = self.write("base.j2", "{% block body %}{% endblock %}!", self.templates.name)
+        self.tree.update([path])
+        self.assertNotIn("list.html", self.renderer._cache)
+
+    def test_resolve_lookup_built_once(self):
+        self.assertIsNotNone(self.renderer.resolve("blog/post1"))
+        with mock.patch.object(Node, "full_url", new_callable=mock.PropertyMock) as url_mock:
+            url_mock.return_value = "/blog/"
+            self.assertIsNotNone(self.renderer.resolve("blog/post2"))
+        self.assertEqual(url_mock.call_count, 1)
+
+    def test_invalidate(self):
+        self.assertEqual(self.get("index.html"), "Intro two")
+        self.assertEqual(self.get("blog/post1"), "Intro one Post one")
+
+        path = self.write("blog/post2.html", "{% mark intro %}Intro 2{% endmark %}")
+        self.tree.update([path])
+
+        self.assertEqual(list(self.renderer._cache), ["blog/post1.html"])
+        self.assertEqual(self.get("index.html"), "Intro 2")
+
+    def test_invalidate_url(self):
+        path = self.write("links.html",
+                          "{{ node.get_from_path('blog/post1.html').full_url }} "
+                          "{{ node.get_from_path('blog/style.css').full_url }}")
+        self.tree.update([path])
+        old_links = self.get("links")
+
+        # post1's URL doesn't change with its content
+        path = self.write("blog/post1.html", "{% mark intro %}Intro 1{% endmark %}")
+        self.tree.update([path])
+        self.assertIn("links.html", self.renderer._cache)
+
+        # but style.css is cache busted
+        path = self.write("blog/style.css", "body { color: white; }")
+        self.tree.update([path])
+        self.assertNotIn("links.html", self.renderer._cache)
+        self.assertNotEqual(self.get("links"), old_links)
+
+    def test_invalidate_children(self):
+        self.assertNotIn("post3", self.get("blog/index.html"))
+        path = self.write("blog/post3.html", "{% mark intro %}Intro three{% endmark %}")
+        self.tree.update([path])
+        self.assertIn("Intro three", self.get("blog/index.html"))
+
+        os.unlink(path)
+        self.tree.update([path])
+        self.assertNotIn("Intro three", self.get("blog/index.html"))
+        self.assertIsNone(self.renderer.resolve("blog/post3"))
+
+    def test_invalidate_template(self):
+        self.write("base.j2", "{% block body %}{% endblock %}", self.templates.name)
+        self.write("page.html", "---\nextends: base.j2\ndefault_block: body\n---\npage")
+        self.tree.update([os.path.join(self.content.name, "page.html")])
+        self.assertEqual(self.get("page").strip(), "page")
+
+        path = self.write("base.j2", "base {% block body %}{% endblock %}", self.templates.name)
+        self.tree.update([path])
+        self.assertEqual(self.get("page").split(), ["base", "page"])
+
+    def test_reload(self):
+        self.get("blog/post1")
+        path = self.write("blog/meta.yaml", "strip_exts: []")
+        self.tree.update([path])
+        self.assertEqual(list(self.renderer._cache), [])
+        self.assertIsNone(self.renderer.resolve("blog/post1"))
+        self.assertEqual(self.get("blog/post1.html"), "Intro one Post one")
+
+    def test_stale_render_not_cached(self):
+        node = self.renderer.resolve("blog/post1")
+
+        def content(item):
+            self.renderer.invalidate(set())
+            return "stale"
+
+        with mock.patch.object(Node, "content", property(content)):
+            self.assertEqual(self.renderer.render(node), b"stale")
+        self.assertNotIn(node_key(node), self.renderer._cache)
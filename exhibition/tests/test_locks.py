@@ -0,0 +1,202 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+import asyncio
+import threading
+
+from exhibition.locks import (NodeLock, async_concurrency_limits, concurrency_limit,
+                              concurrency_limits, current_owner, locked_cached_property, new_owner,
+                              run_in_thread)
+
+
+class Thing:
+    def __init__(self):
+        self._lock = NodeLock()
+        self.calls = 0
+        self.event = threading.Event()
+
+    @locked_cached_property
+    def value(self):
+        """The value"""
+        self.calls += 1
+        self.event.wait(1)
+        return self.calls
+
+
+class NodeLockTestCase(TestCase):
+    def test_reentrant(self):
+        lock = NodeLock()
+        self.assertTrue(lock.acquire())
+        self.assertTrue(lock.acquire())
+        lock.release()
+        self.assertIsNotNone(lock._owner)
+        lock.release()
+        self.assertIsNone(lock._owner)
+
+    def test_held(self):
+        lock = NodeLock()
+        with lock.held() as acquired:
+            self.assertTrue(acquired)
+            self.assertIsNotNone(lock._owner)
+        self.assertIsNone(lock._owner)
+
+    def test_waits(self):
+        lock = NodeLock()
+        lock.acquire()
+        order = []
+
+        def other():
+            with lock.held() as acquired:
+                order.append(("other", acquired))
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join(0.1)
+        order.append(("main", True))
+        lock.release()
+        thread.join()
+
+        self.assertEqual(order, [("main", True), ("other", True)])
+
+    def test_deadlock(self):
+        lock_a = NodeLock()
+        lock_b = NodeLock()
+        both_held = threading.Barrier(2)
+        results = {}
+
+        def first():
+            with lock_a.held():
+                both_held.wait()
+                with lock_b.held() as acquired:
+                    results["first"] = acquired
+
+        def second():
+            with lock_b.held():
+                both_held.wait()
+                with lock_a.held() as acquired:
+                    results["second"] = acquired
+
+        threads = [threading.Thread(target=first), threading.Thread(target=second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+        # one of them must have given up rather than wait forever
+        self.assertEqual(sorted(results.values()), [False, True])
+
+
+class LockedCachedPropertyTestCase(TestCase):
+    def test_computed_once(self):
+        thing = Thing()
+        with ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(lambda: thing.value) for _ in range(4)]
+            thing.event.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, [1, 1, 1, 1])
+        self.assertEqual(thing.calls, 1)
+
+    def test_class_access(self):
+        self.assertIsInstance(Thing.value, locked_cached_property)
+        self.assertEqual(Thing.value.__doc__, "The value")
+
+
+class ConcurrencyLimitTestCase(TestCase):
+    def test_limit(self):
+        lock = threading.Lock()
+        running = [0]
+        most = [0]
+
+        def work(_):
+            with concurrency_limit("test_limit", 2):
+                with lock:
+                    running[0] += 1
+                    most[0] = max(most[0], running[0])
+                threading.Event().wait(0.05)
+                with lock:
+                    running[0] -= 1
+
+        with ThreadPoolExecutor(6) as executor:
+            list(executor.map(work, range(12)))
+
+        self.assertEqual(most[0], 2)
+
+    def test_reentrant(self):
+        with concurrency_limit("test_reentrant", 1):
+            with concurrency_limit("test_reentrant", 1):
+                pass
+
+    def test_no_limit(self):
+        with concurrency_limit("test_no_limit", None):
+            with concurrency_limit("test_no_limit", None):
+                pass
+
+    def test_limits(self):
+        with concurrency_limits([("test_limits_a", 1), ("test_limits_b", None)]):
+            acquired = threading.Event()
+
+            def other():
+                with concurrency_limits([("test_limits_a", 1)]):
+                    acquired.set()
+
+            thread = threading.Thread(target=other)
+            thread.start()
+            self.assertFalse(acquired.wait(0.1))
+
+        thread.join()
+        self.assertTrue(acquired.is_set())
+
+
+class AsyncTestCase(TestCase):
+    def test_owner(self):
+        async def task():
+            new_owner()
+            owner = current_owner()
+            self.assertEqual(await run_in_thread(current_owner), owner)
+            return owner
+
+        async def main():
+            return await asyncio.gather(task(), task())
+
+        owners = asyncio.run(main())
+        self.assertIsNot(owners[0], owners[1])
+        self.assertIsNot(owners[0], current_owner())
+
+    def test_limits(self):
+        running = [0]
+        most = [0]
+
+        async def task():
+            async with async_concurrency_limits([("test_limits", 2), ("no_limit", None)]):
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+                await asyncio.sleep(0.01)
+                running[0] -= 1
+
+        async def main():
+            await asyncio.gather(*[task() for _ in range(6)])
+
+        asyncio.run(main())
+        self.assertEqual(most[0], 2)
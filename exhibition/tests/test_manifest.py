@@ -0,0 +1,142 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+import hashlib
+import json
+import os
+import pathlib
+
+from exhibition import manifest
+from exhibition.config import Config
+from exhibition.node import Node
+from exhibition.tests.test_gen import SITE_FILES, write_site
+from exhibition.utils import gen
+
+
+class ManifestTestCase(TestCase):
+    def setUp(self):
+        self.content = TemporaryDirectory()
+        self.deploy = TemporaryDirectory()
+        self.cache = TemporaryDirectory()
+        write_site(self.content.name)
+        self.manifest_path = os.path.join(self.cache.name, "manifest.json")
+        self.settings = {"content_path": self.content.name, "deploy_path": self.deploy.name,
+                         "cache_dir": self.cache.name, "filter": "exhibition.filters.jinja2",
+                         "templates": [], "manifest_path": self.manifest_path}
+
+    def tearDown(self):
+        self.content.cleanup()
+        self.deploy.cleanup()
+        self.cache.cleanup()
+
+    def gen(self, **kwargs):
+        gen(Config(dict(self.settings)), **kwargs)
+        return manifest.load(self.manifest_path)
+
+    def test_not_configured(self):
+        del self.settings["manifest_path"]
+        gen(Config(dict(self.settings)))
+        self.assertFalse(os.path.exists(self.manifest_path))
+
+    def test_gen(self):
+        files = self.gen()
+
+        leaves = [name for name in SITE_FILES if name != "blog/meta.yaml"]
+        self.assertEqual(len(files), len(leaves))
+        self.assertEqual(files["/image.bin"], {
+            "path": "image.bin",
+            "size": 3,
+            "hash": hashlib.md5(b"\x00\xff\x00").hexdigest(),
+        })
+        for url, entry in files.items():
+            with open(os.path.join(self.deploy.name, entry["path"]), "rb") as f:
+                data = f.read()
+            self.assertEqual(entry["size"], len(data), url)
+            self.assertEqual(entry["hash"], hashlib.md5(data).hexdigest(), url)
+
+        style = [url for url in files if url.startswith("/blog/style.")]
+        self.assertEqual(len(style), 1)
+        self.assertEqual(files[style[0]]["path"], style[0][1:])
+
+    def test_incremental(self):
+        files = self.gen(incremental=True)
+        with pathlib.Path(self.content.name, "blog", "post2.html").open("w") as f:
+            f.write("{% mark intro %}Intro 2{% endmark %} Post two")
+
+        # files that weren't rendered use the hash from the last build
+        with mock.patch.object(manifest, "file_digest") as hash_mock:
+            new_files = self.gen(incremental=True)
+        self.assertEqual(hash_mock.call_count, 0)
+        self.assertEqual(manifest.diff(files, new_files), [
+            ("M", "/"),
+            ("M", "/blog/"),
+            ("M", "/blog/post2"),
+        ])
+
+    def test_compressed(self):
+        self.settings["compress_glob"] = "*.css"
+        files = self.gen()
+
+        style = [url for url in files if url.startswith("/blog/style.")]
+        self.assertEqual(len(style), 2)
+        url = min(style)
+        self.assertEqual(files[url + ".gz"]["path"], url[1:] + ".gz")
+        with open(os.path.join(self.deploy.name, url[1:] + ".gz"), "rb") as f:
+            data = f.read()
+        self.assertEqual(files[url + ".gz"]["size"], len(data))
+        self.assertEqual(files[url + ".gz"]["hash"], hashlib.md5(data).hexdigest())
+
+        self.settings["compress_glob"] = []
+        self.assertEqual(manifest.diff(files, self.gen()), [("D", url + ".gz")])
+
+    def test_atomic(self):
+        files = self.gen(atomic=True)
+        self.assertEqual(files["/image.bin"]["path"], "image.bin")
+
+    def test_node_hash(self):
+        root_node = Node.from_path(pathlib.Path(self.content.name),
+                                   meta=Config(dict(self.settings)))
+        node = root_node.get_from_path("image.bin")
+        node.render()
+        node.forget()
+        self.assertNotIn("content_hash", node.__dict__)
+
+        self.assertEqual(manifest.node_hash(node), hashlib.md5(b"\x00\xff\x00").hexdigest())
+        self.assertNotIn("content_hash", node.__dict__)
+
+    def test_load(self):
+        with open(self.manifest_path, "w") as f:
+            json.dump({"version": manifest.MANIFEST_VERSION + 1, "files": {}}, f)
+        with self.assertRaises(ValueError):
+            manifest.load(self.manifest_path)
+
+    def test_diff(self):
+        entry = {"path": "a", "size": 1, "hash": "abc"}
+        old = {"/a": entry, "/b": entry, "/c": entry}
+        new = {"/a": entry, "/b": dict(entry, size=2), "/d": entry}
+        self.assertEqual(manifest.diff(old, new), [
+            (manifest.MODIFIED, "/b"),
+            (manifest.DELETED, "/c"),
+            (manifest.ADDED, "/d"),
+        ])
+        self.assertEqual(manifest.diff(old, old), [])
@@ -0,0 +1,113 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+
+from unittest import TestCase, skipIf
+import os
+
+from exhibition.matcher import GlobPattern, compile_glob, compile_globs, match_globs
+
+FILES = [".hidden", "[x].txt", "a.html", "b.HTML", "page.htm"]
+DIRS = [".config", "sub"]
+
+ALL = sorted(FILES + DIRS)
+
+# expected matches for each pattern, from the semantics documented in
+# exhibition.matcher rather than whatever pathlib the tests run on
+EXPECTED = {
+    "*": ALL,
+    "*.html": ["a.html"],
+    "*.htm*": ["a.html", "page.htm"],
+    "*/": [".config", "sub"],
+    "**": [".config", "sub"],
+    "**/": [".config", "sub"],
+    "**/**": [".config", "sub"],
+    "**/*.html": ["a.html"],
+    "**/sub": ["sub"],
+    "sub/**": ["sub"],
+    "sub/*": [],
+    "*/x.html": [],
+    "./a.html": ["a.html"],
+    "a.html/": [],
+    "a.html/.": ["a.html"],
+    "a.html/..": [],
+    "*/.": ALL,
+    "..": [],
+    "**/..": [],
+    "sub": ["sub"],
+    "?.html": ["a.html"],
+    "[[]x].txt": ["[x].txt"],
+    "*.[hH]*": [".hidden", "a.html", "b.HTML", "page.htm"],
+    "[!a]*": [".config", ".hidden", "[x].txt", "b.HTML", "page.htm", "sub"],
+    "A.HTML": [],
+    "missing": [],
+}
+
+
+class GlobPatternTestCase(TestCase):
+    @skipIf(os.name == "nt", "patterns are case insensitive on Windows")
+    def test_expected_matches(self):
+        for pattern, expected in EXPECTED.items():
+            with self.subTest(pattern):
+                compiled = GlobPattern(pattern)
+                result = sorted(name for name in ALL if compiled.match(name, name in DIRS))
+                self.assertEqual(result, expected)
+
+    def test_no_filesystem_access(self):
+        pattern = GlobPattern("*.html")
+        self.assertTrue(pattern.match("does-not-exist.html"))
+        self.assertFalse(pattern.match("does-not-exist.htm"))
+
+        pattern = GlobPattern("*/")
+        self.assertTrue(pattern.match("somedir", is_dir=True))
+        self.assertFalse(pattern.match("somedir", is_dir=False))
+
+    def test_bad_patterns(self):
+        with self.assertRaises(ValueError):
+            GlobPattern("")
+
+        with self.assertRaises(NotImplementedError):
+            GlobPattern("/absolute/*.html")
+
+    def test_repr(self):
+        self.assertEqual(repr(GlobPattern("*.html")), "<GlobPattern: *.html>")
+
+
+class CompileGlobsTestCase(TestCase):
+    def test_compiled_once(self):
+        self.assertIs(compile_glob("*.css"), compile_glob("*.css"))
+        self.assertIs(compile_globs(["*.css", "*.js"]), compile_globs(("*.css", "*.js")))
+        self.assertIs(compile_globs("*.css")[0], compile_glob("*.css"))
+
+    def test_compile_globs(self):
+        self.assertEqual(compile_globs(None), ())
+        self.assertEqual(compile_globs([]), ())
+        self.assertEqual([p.pattern for p in compile_globs("*.css")], ["*.css"])
+        self.assertEqual([p.pattern for p in compile_globs(["*.css", "*.js"])],
+                         ["*.css", "*.js"])
+
+    def test_match_globs(self):
+        self.assertTrue(match_globs("*.css", "site.css"))
+        self.assertTrue(match_globs(["*.js", "*.css"], "site.css"))
+        self.assertFalse(match_globs(["*.js", "*.css"], "site.html"))
+        self.assertFalse(match_globs(None, "site.html"))
+        self.assertFalse(match_globs([], "site.html"))
+        self.assertTrue(match_globs(["*.js", "**"], "blog", is_dir=True))
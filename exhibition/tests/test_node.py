@@ -19,14 +19,19 @@
 #
 ##
 
+from concurrent.futures import ThreadPoolExecutor
 from stat import S_IFDIR, S_IFREG
 from tempfile import TemporaryDirectory
-from unittest import TestCase
+from unittest import TestCase, mock
+import asyncio
 import hashlib
+import os
 import pathlib
+import threading
 
 from ruamel.yaml.error import MarkedYAMLError
 
+from exhibition.locks import new_owner
 from exhibition.node import DEFAULT_DIR_MODE, DEFAULT_FILE_MODE, Node
 
 GOOD_META = """---
@@ -426,6 +431,98 @@ class NodeTestCase(TestCase):
         self.assertEqual(list(parent_node.children.keys()), ["page1.html", "page2.html"])
         self.assertEqual(parent_node.meta["test"], "bob")
 
+    def test_from_path_stat(self):
+        parent_path = pathlib.Path(self.content_path.name)
+        pathlib.Path(self.content_path.name, "blog").mkdir()
+        with pathlib.Path(self.content_path.name, "blog", "post.html").open("w") as f:
+            f.write(GOOD_META)
+        pathlib.Path(self.content_path.name, "page.html").touch()
+        with pathlib.Path(self.content_path.name, "meta.yaml").open("w") as f:
+            f.write("test: bob")
+
+        real_stat = pathlib.Path.stat
+        with mock.patch.object(pathlib.Path, "is_file", side_effect=AssertionError), \
+                mock.patch.object(pathlib.Path, "is_dir", side_effect=AssertionError), \
+                mock.patch.object(pathlib.Path, "stat", autospec=True,
+                                  side_effect=real_stat) as stat_mock:
+            parent_node = Node.from_path(parent_path)
+            nodes = list(parent_node.walk(include_self=True))
+            for node in nodes:
+                node.stat
+
+        # only the root path is stat'ed via pathlib
+        self.assertEqual(stat_mock.call_count, 1)
+        self.assertEqual(len(nodes), 4)
+        self.assertEqual(parent_node.meta["test"], "bob")
+        for node in nodes:
+            with self.subTest(node):
+                expected = os.stat(node.path_obj)
+                self.assertEqual(node.stat.st_ino, expected.st_ino)
+                self.assertEqual(node.stat.st_size, expected.st_size)
+                self.assertEqual(node.stat.st_mtime_ns, expected.st_mtime_ns)
+                self.assertEqual(node.is_leaf, node.path_obj.is_file())
+
+    def test_from_path_with_jobs(self):
+        parent_path = pathlib.Path(self.content_path.name)
+        for i in range(5):
+            dir_path = pathlib.Path(self.content_path.name, "dir{}".format(i))
+            dir_path.mkdir()
+            pathlib.Path(dir_path, "sub").mkdir()
+            for name in ["b.html", "a.html", "c.jpg", "sub/z.html", "sub/y.css"]:
+                pathlib.Path(dir_path, name).touch()
+            with pathlib.Path(dir_path, "meta.yaml").open("w") as f:
+                f.write("ignore: \"*.jpg\"\nnumber: {}".format(i))
+        pathlib.Path(self.content_path.name, "index.html").touch()
+        with pathlib.Path(self.content_path.name, "meta.yaml").open("w") as f:
+            f.write("ignore: \"*.css\"")
+
+        def tree(node):
+            return [(repr(n), n.path_obj, n.meta.get("number"), n.stat.st_ino)
+                    for n in node.walk(include_self=True)]
+
+        serial_node = Node.from_path(parent_path)
+        threaded_node = Node.from_path(parent_path, jobs=4)
+
+        self.assertEqual(tree(threaded_node), tree(serial_node))
+        self.assertEqual(list(threaded_node.children.keys()),
+                         ["dir0", "dir1", "dir2", "dir3", "dir4", "index.html"])
+        self.assertEqual(list(threaded_node.children["dir3"].children.keys()),
+                         ["a.html", "b.html", "sub"])
+        self.assertEqual(list(threaded_node.children["dir3"].children["sub"].children.keys()),
+                         ["y.css", "z.html"])
+
+    def test_from_path_with_jobs_invalid_meta(self):
+        parent_path = pathlib.Path(self.content_path.name)
+        pathlib.Path(self.content_path.name, "blog").mkdir()
+        meta_path = pathlib.Path(self.content_path.name, "blog", "meta.yaml")
+        with meta_path.open("w") as f:
+            f.write(INVALID_YAML)
+
+        with self.assertRaises(MarkedYAMLError) as exp:
+            Node.from_path(parent_path, jobs=2)
+
+        self.assertEqual(exp.exception.problem_mark.name, str(meta_path))
+
+    def test_stat_without_from_path(self):
+        path = pathlib.Path(self.content_path.name, "page.html")
+        with path.open("w") as f:
+            f.write(GOOD_META)
+
+        node = Node(path, None)
+        self.assertEqual(node.stat.st_size, len(GOOD_META))
+        self.assertTrue(node.is_leaf)
+
+    def test_from_path_broken_symlink(self):
+        parent_path = pathlib.Path(self.content_path.name)
+        pathlib.Path(self.content_path.name, "page.html").touch()
+        pathlib.Path(self.content_path.name, "broken.html").symlink_to("not-here.html")
+
+        with self.assertRaises(AssertionError):
+            Node.from_path(parent_path)
+
+        parent_node = Node.from_path(parent_path, meta={"ignore": "broken.*"})
+        self.assertEqual(list(parent_node.children.keys()), ["page.html"])
+
     def test_from_path_meta_comes_first(self):
         parent_path = pathlib.Path(self.content_path.name)
 
@@ -536,6 +633,46 @@ class NodeTestCase(TestCase):
 
         self.assertEqual(child_node.full_url, "/bust-me.{}.jpg".format(JSON_DIGEST))
 
+    def test_content_hash(self):
+        path = pathlib.Path(self.content_path.name, "page.html")
+        path.write_text(JSON_FILE)
+        node = Node(path, None, meta=self.default_settings)
+        self.assertEqual(node.content_hash, hashlib.md5(JSON_FILE.encode()).hexdigest())
+        self.assertEqual(node.content_hash[:8], JSON_DIGEST)
+
+        path.write_text("changed")
+        node.forget()
+        self.assertEqual(node.content_hash, hashlib.md5(b"changed").hexdigest())
+
+        dir_node = Node(pathlib.Path(self.content_path.name), None, meta=self.default_settings)
+        self.assertIsNone(dir_node.content_hash)
+
+    def test_render_unchanged(self):
+        parent_node = Node.from_path(pathlib.Path(self.content_path.name))
+        parent_node.meta.update(**self.default_settings)
+        path = pathlib.Path(self.content_path.name, "page.html")
+        path.write_text("hello")
+        node = Node(path, parent_node)
+        deployed = pathlib.Path(node.full_path)
+        deployed.write_text("stale")
+        os.utime(deployed, ns=(0, 0))
+
+        # a different hash is written
+        node.deployed_hash = hashlib.md5(b"stale").hexdigest()
+        node.render()
+        self.assertEqual(deployed.read_text(), "hello")
+
+        # the same hash isn't
+        os.utime(deployed, ns=(0, 0))
+        node.deployed_hash = node.content_hash
+        node.render()
+        self.assertEqual(deployed.stat().st_mtime_ns, 0)
+
+        # unless the file isn't what was recorded
+        deployed.write_text("hello!")
+        node.render()
+        self.assertEqual(deployed.read_text(), "hello")
+
     def test_get_from_path_relative_str_on_leaf(self):
         parent_path = pathlib.Path(self.content_path.name)
         pathlib.Path(self.content_path.name, "images").mkdir()
@@ -896,3 +1033,188 @@ class NodeTestCase(TestCase):
         self.assertTrue(rendered_child.exists())
         self.assertTrue(rendered_child.is_file())
         self.assertEqual(rendered_child.stat().st_mode, S_IFREG + settings["file_mode"])
+
+    def test_content_with_threads(self):
+        path = pathlib.Path(self.content_path.name, "blog.html")
+        with path.open("w") as f:
+            f.write("Hello")
+        started = threading.Event()
+        calls = []
+
+        def fltr(node, content):
+            calls.append(node)
+            node.marks["greeting"] = content
+            started.set()
+            threading.Event().wait(0.1)
+            return content.upper()
+
+        node = Node(path, None, meta=self.default_settings)
+
+        filters = [("test_filter", mock.Mock(spec=["content_filter"], content_filter=fltr),
+                    "*.html")]
+        with mock.patch.object(Node, "_content_filters", side_effect=lambda: iter(filters)):
+            with ThreadPoolExecutor(4) as executor:
+                content_future = executor.submit(lambda: node.content)
+                started.wait(1)
+                marks = executor.submit(lambda: node.marks)
+                contents = list(executor.map(lambda _: node.content, range(4)))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(content_future.result(), "HELLO")
+        self.assertEqual(contents, ["HELLO"] * 4)
+        self.assertEqual(marks.result(), {"greeting": "Hello"})
+
+    def test_render_filter_concurrency(self):
+        lock = threading.Lock()
+        running = []
+        most = []
+
+        def fltr(node, content):
+            with lock:
+                running.append(node)
+                most.append(len(running))
+            threading.Event().wait(0.05)
+            with lock:
+                running.remove(node)
+            return content
+
+        settings = {"filter_concurrency": {"test_filter": 2, "other_filter": 1}}
+        settings.update(self.default_settings)
+        parent = Node(pathlib.Path(self.content_path.name), None, meta=settings)
+        nodes = []
+        for i in range(6):
+            path = pathlib.Path(self.content_path.name, "page%s.html" % i)
+            path.touch()
+            nodes.append(Node(path, parent))
+
+        filter_module = mock.Mock(spec=["content_filter"], content_filter=fltr)
+        with mock.patch.object(Node, "_content_filters",
+                               side_effect=lambda: iter([("test_filter", filter_module, "*.html"),
+                                                         ("unused", filter_module, "*.css")])):
+            self.assertEqual(nodes[0].filter_limits(), [("test_filter", 2)])
+            self.assertEqual(parent.filter_limits(), [])
+            with ThreadPoolExecutor(6) as executor:
+                list(executor.map(Node.render, nodes))
+
+        self.assertEqual(max(most), 2)
+        for node in nodes:
+            self.assertTrue(pathlib.Path(node.full_path).exists())
+
+    def test_async_content(self):
+        path = pathlib.Path(self.content_path.name, "blog.html")
+        with path.open("w") as f:
+            f.write("Hello")
+        calls = []
+
+        async def async_fltr(node, content):
+            calls.append(node)
+            await asyncio.sleep(0.05)
+            return content + " async"
+
+        def fltr(node, content):
+            node.marks["sync"] = content
+            return content + " sync"
+
+        modules = [
+            ("async_filter", mock.Mock(async_content_filter=async_fltr), "*.html"),
+            ("sync_filter", mock.Mock(spec=["content_filter"], content_filter=fltr), "*.html"),
+        ]
+        node = Node(path, None, meta=self.default_settings)
+
+        async def get_content():
+            new_owner()
+            return await node.async_content()
+
+        async def main():
+            return await asyncio.gather(*[get_content() for _ in range(4)])
+
+        with mock.patch.object(Node, "_content_filters", side_effect=lambda: iter(modules)):
+            contents = asyncio.run(main())
+
+        self.assertEqual(contents, ["Hello async sync"] * 4)
+        self.assertEqual(node.content, "Hello async sync")
+        self.assertEqual(node.marks, {"sync": "Hello async"})
+        self.assertEqual(len(calls), 1)
+
+    def test_dependencies(self):
+        content_path = pathlib.Path(self.content_path.name)
+        for name in ["index.html", "other.html", "blog/post.html"]:
+            path = content_path / name
+            path.parent.mkdir(exist_ok=True)
+            path.touch()
+
+        def fltr(node, content):
+            if node.path_obj.name != "index.html":
+                node.meta
+                return content
+            node.siblings
+            node.get_from_path("blog/post.html").marks
+            node.get_from_path("other.html").full_url
+            node.get_from_path("blog").meta
+            with self.assertRaises(OSError):
+                node.get_from_path("blog/missing.html")
+            return content
+
+        parent = Node.from_path(content_path, meta=self.default_settings)
+        node = parent.children["index.html"]
+        self.assertIsNone(node.dependencies)
+
+        filter_module = mock.Mock(spec=["content_filter"], content_filter=fltr)
+        with mock.patch.object(Node, "_content_filters",
+                               side_effect=lambda: iter([("test_filter", filter_module, "*")])):
+            node.content
+            parent.children["other.html"].content
+
+        self.assertEqual(node.dependencies, [
+            ("children", "."),
+            ("children", "blog"),
+            ("node", "blog"),
+            ("node", "blog/post.html"),
+            ("url", "blog"),
+            ("url", "blog/post.html"),
+            ("url", "other.html"),
+        ])
+        # a node reading itself is not a dependency
+        self.assertNotIn(("node", "other.html"), parent.children["other.html"].dependencies)
+
+    def test_rescan(self):
+        content_path = pathlib.Path(self.content_path.name)
+        for name in ["keep.html", "change.html", "remove.html", "dir/page.html"]:
+            path = content_path / name
+            path.parent.mkdir(exist_ok=True)
+            path.write_text(name)
+
+        settings = {"ignore": "*.txt"}
+        settings.update(self.default_settings)
+        parent = Node.from_path(content_path, meta=settings)
+        old_children = dict(parent.children)
+
+        (content_path / "change.html").write_text("changed")
+        (content_path / "remove.html").unlink()
+        (content_path / "add.html").touch()
+        (content_path / "ignored.txt").touch()
+        (content_path / "new_dir").mkdir()
+        (content_path / "new_dir" / "page.html").touch()
+        self.assertEqual(parent.rescan(), {"add.html", "change.html", "remove.html", "new_dir"})
+
+        self.assertEqual(list(parent.children),
+                         ["add.html", "change.html", "dir", "keep.html", "new_dir"])
+        self.assertIs(parent.children["keep.html"], old_children["keep.html"])
+        self.assertIs(parent.children["dir"], old_children["dir"])
+        self.assertIsNot(parent.children["change.html"], old_children["change.html"])
+        self.assertEqual(parent.children["change.html"].content, "changed")
+        self.assertEqual(list(parent.children["new_dir"].children), ["page.html"])
+        self.assertEqual(parent.rescan(), set())
+
+    def test_forget(self):
+        path = pathlib.Path(self.content_path.name, "page.html")
+        path.write_text("hello")
+        node = Node(path, None, meta=self.default_settings)
+        self.assertEqual(node.content, "hello")
+        self.assertEqual(node.dependencies, [])
+
+        path.write_text("goodbye")
+        self.assertEqual(node.content, "hello")
+        node.forget()
+        self.assertIsNone(node.dependencies)
+        self.assertEqual(node.content, "goodbye")
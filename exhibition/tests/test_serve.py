@@ -21,11 +21,16 @@
 
 from http.client import HTTPConnection
 from tempfile import TemporaryDirectory
-from unittest import TestCase
+from unittest import TestCase, mock
+import gzip
+import hashlib
 import pathlib
+import socket
+import threading
 
 from exhibition.config import Config
-from exhibition.utils import serve
+from exhibition.node import Node
+from exhibition.utils import accepted_encodings, routing_table, serve
 
 INDEX_CONTENTS = """<html>
     <head>
@@ -243,3 +248,405 @@ class ServeTestCase(TestCase):
         self.client.request("GET", "/blog/")
         response = self.client.getresponse()
         self.assertEqual(response.status, 200)
+
+    def test_tree_is_cached(self):
+        settings = Config({"deploy_path": self.tmp_dir.name, "content_path": self.tmp_dir.name})
+        self.get_server(settings)
+
+        with mock.patch.object(Node, "from_path", side_effect=Node.from_path) as from_path:
+            for url in ["/", "/page", "/style.css", "/blog/"]:
+                self.client.request("GET", url)
+                response = self.client.getresponse()
+                response.read()
+                self.assertEqual(response.status, 200)
+
+        self.assertEqual(from_path.call_count, 1)
+
+    def test_tree_is_updated(self):
+        settings = Config({"deploy_path": self.tmp_dir.name, "content_path": self.tmp_dir.name})
+        self.get_server(settings)
+
+        self.client.request("GET", "/news/")
+        response = self.client.getresponse()
+        response.read()
+        self.assertEqual(response.status, 404)
+
+        news = pathlib.Path(self.tmp_dir.name, "news")
+        news.mkdir()
+        with pathlib.Path(news, "item.html").open("w") as item:
+            item.write(PAGE_CONTENTS)
+
+        # the tree is updated in the background
+        for _ in range(50):
+            self.client.request("GET", "/news/item")
+            response = self.client.getresponse()
+            content = response.read()
+            if response.status == 200:
+                break
+            threading.Event().wait(0.1)
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(content, PAGE_CONTENTS.encode())
+
+    def test_routes_are_cached(self):
+        settings = Config({"deploy_path": self.tmp_dir.name, "content_path": self.tmp_dir.name})
+        self.get_server(settings)
+
+        with mock.patch("exhibition.utils.routing_table",
+                        side_effect=routing_table) as routing_table_mock:
+            for url in ["/", "/page", "/style.css", "/blog/"]:
+                self.client.request("GET", url)
+                response = self.client.getresponse()
+                response.read()
+                self.assertEqual(response.status, 200)
+
+        self.assertEqual(routing_table_mock.call_count, 1)
+
+    def test_etag(self):
+        settings = Config({"deploy_path": self.tmp_dir.name, "content_path": self.tmp_dir.name})
+        self.get_server(settings)
+
+        self.client.request("GET", "/style.css")
+        response = self.client.getresponse()
+        response.read()
+        etag = response.getheader("ETag")
+        last_modified = response.getheader("Last-Modified")
+        self.assertEqual(etag, '"%s"' % hashlib.md5(CSS_CONTENTS.encode()).hexdigest())
+        self.assertEqual(response.getheader("Accept-Ranges"), "bytes")
+        self.assertIsNotNone(last_modified)
+
+        for headers in [{"If-None-Match": etag}, {"If-None-Match": '"other", W/%s' % etag},
+                        {"If-None-Match": "*"}, {"If-Modified-Since": last_modified}]:
+            self.client.request("GET", "/style.css", headers=headers)
+            response = self.client.getresponse()
+            self.assertEqual(response.read(), b"")
+            self.assertEqual(response.status, 304, headers)
+            self.assertEqual(response.getheader("ETag"), etag)
+            self.assertEqual(response.getheader("Cache-Control"), "no-store")
+
+        for headers in [{"If-None-Match": '"other"'},
+                        {"If-None-Match": '"other"', "If-Modified-Since": last_modified},
+                        {"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"},
+                        {"If-Modified-Since": "not a date"}]:
+            self.client.request("GET", "/style.css", headers=headers)
+            response = self.client.getresponse()
+            self.assertEqual(response.read(), CSS_CONTENTS.encode())
+            self.assertEqual(response.status, 200, headers)
+
+    def test_etag_updated(self):
+        settings = Config({"deploy_path": self.tmp_dir.name, "content_path": self.tmp_dir.name})
+        self.get_server(settings)
+
+        self.client.request("GET", "/page")
+        response = self.client.getresponse()
+        response.read()
+        etag = response.getheader("ETag")
+
+        pathlib.Path(self.tmp_dir.name, "page.html").write_text("changed")
+        self.client.request("GET", "/page", headers={"If-None-Match": etag})
+        response = self.client.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), b"changed")
+        self.assertNotEqual(response.getheader("ETag"), etag)
+
+    def test_range(self):
+        settings = Config({"deploy_path": self.tmp_dir.name, "content_path": self.tmp_dir.name})
+        self.get_server(settings)
+        data = CSS_CONTENTS.encode()
+        size = len(data)
+
+        for header, (first, last) in [("bytes=0-9", (0, 9)), ("bytes=10-", (10, size - 1)),
+                                      ("bytes=-5", (size - 5, size - 1)),
+                                      ("bytes=5-1000", (5, size - 1))]:
+            self.client.request("GET", "/style.css", headers={"Range": header})
+            response = self.client.getresponse()
+            self.assertEqual(response.status, 206, header)
+            self.assertEqual(response.read(), data[first:last + 1], header)
+            self.assertEqual(response.getheader("Content-Range"),
+                             "bytes %d-%d/%d" % (first, last, size))
+
+        for header in ["bytes=0-1,5-6", "lines=0-1", "bytes=5-1", "bytes=a-b"]:
+            self.client.request("GET", "/style.css", headers={"Range": header})
+            response = self.client.getresponse()
+            self.assertEqual(response.status, 200, header)
+            self.assertEqual(response.read(), data)
+
+        for header in ["bytes=%d-" % size, "bytes=-0"]:
+            self.client.request("GET", "/style.css", headers={"Range": header})
+            response = self.client.getresponse()
+            self.assertEqual(response.read(), b"")
+            self.assertEqual(response.status, 416, header)
+            self.assertEqual(response.getheader("Content-Range"), "bytes */%d" % size)
+
+        # the range is ignored if the file has changed since the client saw it
+        self.client.request("GET", "/style.css", headers={"Range": "bytes=0-9",
+                                                          "If-Range": '"other"'})
+        response = self.client.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), data)
+
+        with mock.patch.object(socket.socket, "sendfile", autospec=True,
+                               side_effect=socket.socket.sendfile) as sendfile_mock:
+            self.client.request("GET", "/style.css", headers={"Range": "bytes=2-4"})
+            response = self.client.getresponse()
+            self.assertEqual(response.read(), data[2:5])
+        self.assertEqual(sendfile_mock.call_args[0][2:], (2, 3))
+
+    def test_cache_control(self):
+        (self.blog_dir / "meta.yaml").write_text("cache_control: max-age=60")
+        settings = Config({"deploy_path": self.tmp_dir.name, "content_path": self.tmp_dir.name,
+                           "cache_bust_glob": "*.css"})
+        self.get_server(settings)
+
+        self.client.request("GET", "/blog/")
+        response = self.client.getresponse()
+        response.read()
+        self.assertEqual(response.getheader("Cache-Control"), "max-age=60")
+
+        self.client.request("GET", "/page")
+        response = self.client.getresponse()
+        response.read()
+        self.assertEqual(response.getheader("Cache-Control"), "no-store")
+
+        # cache busted files are served as they would be once deployed
+        style = Node.from_path(pathlib.Path(self.tmp_dir.name), meta=settings).get_from_path(
+            "style.css")
+        busted = pathlib.Path(style.full_path)
+        busted.write_text(CSS_CONTENTS)
+        self.client.request("GET", style.full_url)
+        response = self.client.getresponse()
+        self.assertEqual(response.read(), CSS_CONTENTS.encode())
+        self.assertEqual(response.getheader("Cache-Control"),
+                         "public, max-age=31536000, immutable")
+        self.assertEqual(response.getheader("ETag"), '"%s"' % style.cache_bust)
+
+    def test_compressed(self):
+        settings = Config({"deploy_path": self.tmp_dir.name, "content_path": self.tmp_dir.name,
+                           "compress_glob": "*.css", "compress_formats": ["gzip", "zstd"]})
+        compressed = gzip.compress(CSS_CONTENTS.encode())
+        pathlib.Path(self.tmp_dir.name, "style.css.gz").write_bytes(compressed)
+        self.get_server(settings)
+
+        etags = set()
+        for accept, encoding, data in [("gzip", "gzip", compressed),
+                                       ("zstd;q=0.9, gzip;q=0.5", "gzip", compressed),
+                                       ("identity", None, CSS_CONTENTS.encode()),
+                                       ("gzip;q=0", None, CSS_CONTENTS.encode())]:
+            self.client.request("GET", "/style.css", headers={"Accept-Encoding": accept})
+            response = self.client.getresponse()
+            self.assertEqual(response.read(), data, accept)
+            self.assertEqual(response.getheader("Content-Encoding"), encoding)
+            self.assertEqual(response.getheader("Content-Type"), "text/css")
+            self.assertEqual(response.getheader("Vary"), "Accept-Encoding")
+            etags.add(response.getheader("ETag"))
+
+        self.assertEqual(len(etags), 2)
+
+        self.client.request("GET", "/page")
+        response = self.client.getresponse()
+        response.read()
+        self.assertIsNone(response.getheader("Vary"))
+
+    def test_keep_alive(self):
+        settings = Config({"deploy_path": self.tmp_dir.name, "content_path": self.tmp_dir.name})
+        self.get_server(settings)
+
+        socks = []
+        for url in ["/style.css", "/blog", "/blog/", "/page"]:
+            self.client.request("GET", url)
+            response = self.client.getresponse()
+            response.read()
+            self.assertFalse(response.will_close)
+            socks.append(self.client.sock)
+
+        self.assertEqual(len(set(socks)), 1)
+
+    def test_concurrent_requests(self):
+        settings = Config({"deploy_path": self.tmp_dir.name, "content_path": self.tmp_dir.name})
+        self.get_server(settings)
+
+        # a client that never finishes its request doesn't hold up others
+        with socket.create_connection(("localhost", 8000)) as slow:
+            slow.sendall(b"GET /style.css HTTP/1.1\r\n")
+            self.client.timeout = 5
+            self.client.request("GET", "/style.css")
+            response = self.client.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.read(), CSS_CONTENTS.encode())
+
+    def test_sendfile(self):
+        settings = Config({"deploy_path": self.tmp_dir.name, "content_path": self.tmp_dir.name})
+        self.get_server(settings)
+
+        with mock.patch.object(socket.socket, "sendfile", autospec=True,
+                               side_effect=socket.socket.sendfile) as sendfile_mock:
+            self.client.request("GET", "/style.css")
+            response = self.client.getresponse()
+            self.assertEqual(response.read(), CSS_CONTENTS.encode())
+
+            self.client.request("HEAD", "/style.css")
+            response = self.client.getresponse()
+            self.assertEqual(response.read(), b"")
+            self.assertEqual(response.getheader("Content-Length"), str(len(CSS_CONTENTS)))
+
+        self.assertEqual(sendfile_mock.call_count, 1)
+
+
+class RoutingTableTestCase(TestCase):
+    def test_routes(self):
+        with TemporaryDirectory() as content:
+            content_path = pathlib.Path(content)
+            for name in ["index.html", "page.html", "style.css", "blog/home.htm",
+                         "blog/post.htm", "empty/.keep"]:
+                (content_path / name).parent.mkdir(exist_ok=True)
+                (content_path / name).write_text(name)
+            (content_path / "blog" / "meta.yaml").write_text(
+                "index_file: home.htm\nstrip_exts: .htm")
+
+            root_node = Node.from_path(content_path, meta=Config({
+                "deploy_path": "/deploy", "base_url": "/site", "cache_bust_glob": "*.css",
+            }))
+            style = root_node.get_from_path("style.css")
+            style_path = "/deploy/style.%s.css" % style.cache_bust
+
+            routes = routing_table(root_node)
+            self.assertEqual({key: item.full_path for key, item in routes.items()}, {
+                "": "/deploy/index.html",
+                "index.html": "/deploy/index.html",
+                "page": "/deploy/page.html",
+                "page.html": "/deploy/page.html",
+                "style.%s.css" % style.cache_bust: style_path,
+                "blog": "/deploy/blog/home.htm",
+                "blog/home.htm": "/deploy/blog/home.htm",
+                "blog/post": "/deploy/blog/post.htm",
+                "blog/post.htm": "/deploy/blog/post.htm",
+                "empty": "/deploy/empty",
+                "empty/.keep": "/deploy/empty/.keep",
+            })
+
+
+class AcceptedEncodingsTestCase(TestCase):
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings(""), set())
+        self.assertEqual(accepted_encodings("gzip, deflate, br, zstd"),
+                         {"gzip", "deflate", "br", "zstd"})
+        self.assertEqual(accepted_encodings("GZIP;q=0.5, zstd;q=0, br;q=x"), {"gzip"})
+
+
+class LiveServeTestCase(TestCase):
+    def setUp(self):
+        self.content = TemporaryDirectory()
+        self.deploy = TemporaryDirectory()
+        content_path = pathlib.Path(self.content.name)
+        (content_path / "blog").mkdir()
+        (content_path / "empty").mkdir()
+        for name, data in [("index.html", INDEX_CONTENTS), ("page.html", PAGE_CONTENTS),
+                           ("style.css", CSS_CONTENTS), ("blog/index.html", BLOG_INDEX_CONTENTS),
+                           ("broken.html", "{% if %}")]:
+            (content_path / name).write_text(data)
+
+        self.settings = Config({"deploy_path": self.deploy.name,
+                                "content_path": self.content.name,
+                                "filter": "exhibition.filters.jinja2",
+                                "filter_glob": "broken.html"})
+        self.client = HTTPConnection("localhost", "8000")
+        self.server = None
+
+    def tearDown(self):
+        self.client.close()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self.content.cleanup()
+        self.deploy.cleanup()
+
+    def get_server(self):
+        self.server, thread = serve(self.settings, ("localhost", 8000), live=True)
+
+    def get(self, url, method="GET"):
+        self.client.request(method, url)
+        response = self.client.getresponse()
+        return response, response.read()
+
+    def test_fetch(self):
+        self.get_server()
+        for url, expected in [("/", INDEX_CONTENTS), ("/page", PAGE_CONTENTS),
+                              ("/page/", PAGE_CONTENTS), ("/page.html", PAGE_CONTENTS),
+                              ("/style.css?v=1", CSS_CONTENTS), ("/blog/", BLOG_INDEX_CONTENTS)]:
+            response, content = self.get(url)
+            self.assertEqual(response.status, 200, url)
+            self.assertEqual(content, expected.encode(), url)
+            self.assertEqual(response.getheader("Cache-Control"), "no-store")
+
+        response, content = self.get("/style.css")
+        self.assertEqual(response.getheader("Content-Type"), "text/css")
+        self.assertEqual(response.getheader("Content-Length"), str(len(CSS_CONTENTS)))
+
+        response, content = self.get("/style.css", "HEAD")
+        self.assertEqual(content, b"")
+        self.assertEqual(response.getheader("Content-Length"), str(len(CSS_CONTENTS)))
+
+        self.assertEqual(list(pathlib.Path(self.deploy.name).iterdir()), [])
+
+    def test_etag(self):
+        self.get_server()
+        response, content = self.get("/page")
+        etag = response.getheader("ETag")
+        self.assertEqual(etag, '"%s"' % hashlib.md5(PAGE_CONTENTS.encode()).hexdigest())
+        self.assertIsNone(response.getheader("Last-Modified"))
+
+        self.client.request("GET", "/page", headers={"If-None-Match": etag})
+        response = self.client.getresponse()
+        self.assertEqual(response.read(), b"")
+        self.assertEqual(response.status, 304)
+
+        self.client.request("GET", "/page", headers={"Range": "bytes=0-5"})
+        response = self.client.getresponse()
+        self.assertEqual(response.status, 206)
+        self.assertEqual(response.read(), PAGE_CONTENTS.encode()[:6])
+
+    def test_prefix(self):
+        self.settings["base_url"] = "/bob/"
+        self.get_server()
+        response, content = self.get("/bob/page")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(content, PAGE_CONTENTS.encode())
+
+        response, content = self.get("/page")
+        self.assertEqual(response.status, 404)
+
+    def test_directory_redirect(self):
+        self.get_server()
+        response, content = self.get("/blog?x=1")
+        self.assertEqual(response.status, 301)
+        self.assertEqual(response.getheader("Location"), "/blog/?x=1")
+        self.assertFalse(response.will_close)
+
+    def test_404(self):
+        self.get_server()
+        for url in ["/not-existing.html", "/page/other", "/../index.html", "/empty/"]:
+            response, content = self.get(url)
+            self.assertEqual(response.status, 404, url)
+            self.client.close()
+
+    def test_render_error(self):
+        self.get_server()
+        with mock.patch.object(self.server.RequestHandlerClass, "log_error") as log_error:
+            response, content = self.get("/broken")
+        self.assertEqual(response.status, 500)
+        self.assertIn("Could not render", log_error.call_args_list[0][0][0])
+
+    def test_content_changed(self):
+        self.get_server()
+        response, content = self.get("/page")
+        self.assertEqual(content, PAGE_CONTENTS.encode())
+
+        pathlib.Path(self.content.name, "page.html").write_text("new page")
+        # the tree is updated in the background
+        for _ in range(50):
+            response, content = self.get("/page")
+            if content == b"new page":
+                break
+            threading.Event().wait(0.1)
+
+        self.assertEqual(content, b"new page")
@@ -0,0 +1,230 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+import json
+import os
+import pathlib
+import shutil
+import time
+
+from exhibition import state as state_module
+from exhibition.config import Config
+from exhibition.node import Node
+from exhibition.state import (STATE_VERSION, BuildState, file_digest, meta_fingerprint, node_key,
+                              source_fingerprint, stat_signature, template_fingerprints)
+
+
+class StateTestCase(TestCase):
+    def setUp(self):
+        self.content = TemporaryDirectory()
+        self.deploy = TemporaryDirectory()
+        self.cache = TemporaryDirectory()
+        self.settings = Config({"content_path": self.content.name,
+                                "deploy_path": self.deploy.name,
+                                "cache_dir": self.cache.name})
+        pathlib.Path(self.content.name, "blog").mkdir()
+        with pathlib.Path(self.content.name, "blog", "post.html").open("w") as f:
+            f.write("---\ntitle: Post\n---\nHello")
+
+    def tearDown(self):
+        self.content.cleanup()
+        self.deploy.cleanup()
+        self.cache.cleanup()
+
+    def get_tree(self):
+        return Node.from_path(pathlib.Path(self.content.name), meta=self.settings)
+
+    def test_node_key(self):
+        root_node = self.get_tree()
+        self.assertEqual(node_key(root_node), ".")
+        self.assertEqual(node_key(root_node.get_from_path("blog/post.html")), "blog/post.html")
+
+    def test_meta_fingerprint(self):
+        post = self.get_tree().get_from_path("blog/post.html")
+        fingerprint = meta_fingerprint(post)
+        self.assertEqual(meta_fingerprint(self.get_tree().get_from_path("blog/post.html")),
+                         fingerprint)
+
+        # inherited from meta.yaml
+        with pathlib.Path(self.content.name, "blog", "meta.yaml").open("w") as f:
+            f.write("author: Bob")
+        post = self.get_tree().get_from_path("blog/post.html")
+        self.assertNotEqual(meta_fingerprint(post), fingerprint)
+
+    def test_meta_fingerprint_portable(self):
+        fingerprint = meta_fingerprint(self.get_tree())
+        with TemporaryDirectory() as content, TemporaryDirectory() as cache:
+            self.settings["content_path"] = content
+            self.settings["cache_dir"] = cache
+            self.assertEqual(meta_fingerprint(self.get_tree()), fingerprint)
+
+    def test_portable(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        with TemporaryDirectory() as first, TemporaryDirectory() as second:
+            os.chdir(first)
+            shutil.copytree(self.content.name, "content")
+            settings = Config({"content_path": "content", "deploy_path": "deploy",
+                               "cache_dir": ".exhibition"})
+            root_node = Node.from_path(pathlib.Path("content"), meta=settings)
+            state = BuildState.from_tree(settings, root_node)
+            for item in root_node.walk(True):
+                item.render()
+                state.record_output(item)
+            state.save()
+
+            # a copy of the whole site somewhere else
+            os.chdir(second)
+            shutil.copytree(os.path.join(first, "content"), "content")
+            shutil.copytree(os.path.join(first, "deploy"), "deploy")
+            shutil.copytree(os.path.join(first, ".exhibition"), ".exhibition")
+
+            loaded = BuildState.load(settings)
+            self.assertEqual(loaded.deploy_path, "deploy")
+            self.assertEqual(loaded.nodes, state.nodes)
+            root_node = Node.from_path(pathlib.Path("content"), meta=settings)
+            self.assertEqual(BuildState.from_tree(settings, root_node).removed(loaded), set())
+
+    def test_template_fingerprints(self):
+        with TemporaryDirectory() as templates, TemporaryDirectory() as other_templates:
+            self.settings["templates"] = [templates, other_templates]
+            pathlib.Path(templates, "partials").mkdir()
+            with pathlib.Path(templates, "partials", "footer.j2").open("w") as f:
+                f.write("footer")
+            fingerprints = template_fingerprints(self.get_tree())
+            self.assertEqual(list(fingerprints), ["partials/footer.j2"])
+
+            with pathlib.Path(templates, "base.j2").open("w") as f:
+                f.write("hello")
+            new_fingerprints = template_fingerprints(self.get_tree())
+            self.assertEqual(new_fingerprints["partials/footer.j2"],
+                             fingerprints["partials/footer.j2"])
+            self.assertIn("base.j2", new_fingerprints)
+
+            # the same name in another directory
+            pathlib.Path(other_templates, "partials").mkdir()
+            pathlib.Path(other_templates, "partials", "footer.j2").touch()
+            self.assertNotEqual(template_fingerprints(self.get_tree())["partials/footer.j2"],
+                                fingerprints["partials/footer.j2"])
+
+    def test_source_fingerprint(self):
+        post_path = pathlib.Path(self.content.name, "blog", "post.html")
+        root_node = self.get_tree()
+        self.assertIsNone(source_fingerprint(root_node))
+        post = root_node.get_from_path("blog/post.html")
+        self.assertEqual(source_fingerprint(post), file_digest(str(post_path)))
+
+        # only the content matters
+        os.utime(post_path, ns=(0, 0))
+        state = BuildState.from_tree(self.settings, self.get_tree())
+        self.assertEqual(state.nodes["blog/post.html"]["source"], source_fingerprint(post))
+        self.assertEqual(state.nodes["blog/post.html"]["stat"],
+                         stat_signature(post_path.stat()))
+        self.assertIsNone(state.nodes["blog"]["stat"])
+
+    def test_source_fingerprint_reused(self):
+        post_path = pathlib.Path(self.content.name, "blog", "post.html")
+        old = time.time_ns() - 10 * 10**9
+        os.utime(post_path, ns=(old, old))
+        state = BuildState.from_tree(self.settings, self.get_tree())
+
+        with mock.patch.object(state_module, "file_digest") as digest_mock:
+            new_state = BuildState.from_tree(self.settings, self.get_tree(), old_state=state)
+        self.assertEqual(digest_mock.call_count, 0)
+        self.assertEqual(new_state.nodes, state.nodes)
+
+        # the file is read again if it has changed since
+        with post_path.open("w") as f:
+            f.write("---\ntitle: Post\n---\nHello again")
+        new_state = BuildState.from_tree(self.settings, self.get_tree(), old_state=state)
+        self.assertNotEqual(new_state.nodes["blog/post.html"]["source"],
+                            state.nodes["blog/post.html"]["source"])
+
+    def test_stat_signature(self):
+        path = pathlib.Path(self.content.name, "blog", "post.html")
+        # modified too recently to be trusted
+        self.assertIsNone(stat_signature(path.stat()))
+
+        os.utime(path, ns=(0, 0))
+        stat = path.stat()
+        self.assertEqual(stat_signature(stat), [stat.st_ino, stat.st_size, 0])
+
+    def test_file_digest(self):
+        path = os.path.join(self.content.name, "file")
+        with open(path, "w") as f:
+            f.write("one")
+        digest = file_digest(path)
+
+        # recently modified files are always read again
+        with open(path, "w") as f:
+            f.write("two")
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns))
+        self.assertNotEqual(file_digest(path), digest)
+
+        old = time.time_ns() - 10 * 10**9
+        os.utime(path, ns=(old, old))
+        digest = file_digest(path)
+        with mock.patch("builtins.open") as open_mock:
+            self.assertEqual(file_digest(path), digest)
+        self.assertEqual(open_mock.call_count, 0)
+
+    def test_save_and_load(self):
+        root_node = self.get_tree()
+        state = BuildState.from_tree(self.settings, root_node)
+        for item in root_node.walk(True):
+            item.render()
+            state.record_output(item)
+        state.save()
+
+        loaded = BuildState.load(self.settings)
+        self.assertEqual(loaded.nodes, state.nodes)
+        self.assertEqual(loaded.templates, state.templates)
+        self.assertEqual(loaded.nodes["blog/post.html"]["output"], "blog/post.html")
+        self.assertEqual(loaded.changed(state), set())
+
+    def test_record_hash(self):
+        root_node = self.get_tree()
+        post = root_node.get_from_path("blog/post.html")
+        state = BuildState.from_tree(self.settings, root_node)
+        for item in root_node.walk(True):
+            item.render()
+        state.record_output(post)
+        self.assertEqual(state.nodes["blog/post.html"]["hash"], post.content_hash)
+
+        # copied from the old state if the node wasn't rendered
+        post = self.get_tree().get_from_path("blog/post.html")
+        new_state = BuildState.from_tree(self.settings, post.root_node)
+        new_state.record_output(post, state)
+        self.assertEqual(new_state.nodes["blog/post.html"]["hash"],
+                         state.nodes["blog/post.html"]["hash"])
+        self.assertNotIn("content_hash", post.__dict__)
+
+    def test_load_missing(self):
+        state = BuildState.load(self.settings)
+        self.assertEqual(state.nodes, {})
+
+    def test_load_old_version(self):
+        with pathlib.Path(self.cache.name, "state.json").open("w") as f:
+            json.dump({"version": STATE_VERSION - 1, "nodes": {"a": {}}}, f)
+
+        state = BuildState.load(self.settings)
+        self.assertEqual(state.nodes, {})
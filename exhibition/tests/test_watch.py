@@ -0,0 +1,350 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock, skipUnless
+import os
+import pathlib
+import threading
+
+from exhibition.config import Config
+from exhibition.node import Node
+from exhibition.state import node_key
+from exhibition.tests.test_gen import SITE_FILES, GenTestCase, write_site
+from exhibition.utils import gen
+from exhibition.watch import InotifyWatcher, PollingWatcher, Site, WatchedTree, get_watcher, watch
+
+
+def inotify_available():
+    try:
+        InotifyWatcher([]).close()
+    except OSError:
+        return False
+    return True
+
+
+class WatcherTests:
+    def get_watcher(self, paths):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp_dir.name)
+        (self.root / "content").mkdir()
+        (self.root / "site.yaml").touch()
+        (self.root / "other.txt").touch()
+        self.watcher = self.get_watcher([self.root / "content", self.root / "site.yaml"])
+
+    def tearDown(self):
+        self.watcher.close()
+        self.tmp_dir.cleanup()
+
+    def wait(self):
+        changed = set()
+        while True:
+            more = self.watcher.wait(0.2)
+            if not more:
+                return changed
+            changed.update(more)
+
+    def test_no_changes(self):
+        self.assertEqual(self.watcher.wait(0.05), set())
+
+    def test_files(self):
+        path = self.root / "content" / "page.html"
+        path.write_text("hello")
+        self.assertIn(str(path), self.wait())
+
+        path.write_text("hello again")
+        self.assertIn(str(path), self.wait())
+
+        path.unlink()
+        self.assertIn(str(path), self.wait())
+
+    def test_new_directory(self):
+        path = self.root / "content" / "blog"
+        path.mkdir()
+        self.assertIn(str(path), self.wait())
+
+        (path / "post.html").touch()
+        self.assertIn(str(path / "post.html"), self.wait())
+
+    def test_single_file(self):
+        (self.root / "other.txt").write_text("not watched")
+        self.assertEqual(self.wait(), set())
+
+        # editors often replace files rather than write to them
+        (self.root / "site.yaml.new").write_text("base_url: /")
+        os.replace(self.root / "site.yaml.new", self.root / "site.yaml")
+        self.assertEqual(self.wait(), {str(self.root / "site.yaml")})
+
+        (self.root / "site.yaml").write_text("base_url: /blog/")
+        self.assertEqual(self.wait(), {str(self.root / "site.yaml")})
+
+
+@skipUnless(inotify_available(), "inotify is not available")
+class InotifyWatcherTestCase(WatcherTests, TestCase):
+    def get_watcher(self, paths):
+        return InotifyWatcher(paths)
+
+
+class PollingWatcherTestCase(WatcherTests, TestCase):
+    def get_watcher(self, paths):
+        return PollingWatcher(paths, 0.01)
+
+
+class GetWatcherTestCase(TestCase):
+    def test_poll(self):
+        with get_watcher([], 2) as watcher:
+            self.assertIsInstance(watcher, PollingWatcher)
+            self.assertEqual(watcher.interval, 2)
+
+    def test_fallback(self):
+        with mock.patch("exhibition.watch.InotifyWatcher", side_effect=OSError), \
+                get_watcher([]) as watcher:
+            self.assertIsInstance(watcher, PollingWatcher)
+
+
+class WatchedTreeTestCase(TestCase):
+    def setUp(self):
+        self.content = TemporaryDirectory()
+        write_site(self.content.name)
+        self.tree = WatchedTree(Config({"content_path": self.content.name}), 0.01)
+
+    def tearDown(self):
+        self.tree.close()
+        self.content.cleanup()
+
+    def test_update(self):
+        root_node = self.tree.root_node
+        self.assertIs(self.tree.root_node, root_node)
+        blog = root_node.get_from_path("blog")
+
+        path = pathlib.Path(self.content.name, "blog", "post3.html")
+        path.touch()
+        self.tree.update([str(path)])
+        self.assertIs(self.tree.root_node, root_node)
+        self.assertIs(root_node.get_from_path("blog"), blog)
+        self.assertIn("post3.html", blog.children)
+
+        path = pathlib.Path(self.content.name, "blog", "meta.yaml")
+        path.write_text("index_file: post1.html")
+        self.tree.update([str(path)])
+        self.assertIsNot(self.tree.root_node, root_node)
+        self.assertEqual(self.tree.root_node.get_from_path("blog").index_file, "post1.html")
+
+    def test_background(self):
+        root_node = self.tree.root_node
+        pathlib.Path(self.content.name, "page.html").touch()
+        for _ in range(100):
+            if "page.html" in root_node.children:
+                break
+            threading.Event().wait(0.01)
+
+        self.assertIn("page.html", root_node.children)
+
+    def test_watcher_error(self):
+        root_node = self.tree.root_node
+        changes = []
+        self.tree.listeners.append(changes.append)
+        watcher = self.tree._watcher
+        with mock.patch.object(watcher, "wait", side_effect=OSError(28, "No space left")):
+            for _ in range(100):
+                if changes:
+                    break
+                threading.Event().wait(0.01)
+
+        self.assertEqual(changes, [None])
+        self.assertIsNot(self.tree._watcher, watcher)
+        self.assertIsInstance(self.tree._watcher, PollingWatcher)
+        self.assertIsNot(self.tree.root_node, root_node)
+
+        # still watching
+        root_node = self.tree.root_node
+        pathlib.Path(self.content.name, "page.html").touch()
+        for _ in range(100):
+            if "page.html" in root_node.children:
+                break
+            threading.Event().wait(0.01)
+
+        self.assertIn("page.html", root_node.children)
+
+
+class SiteTestCase(TestCase):
+    def setUp(self):
+        self.content = TemporaryDirectory()
+        self.deploy = TemporaryDirectory()
+        self.cache = TemporaryDirectory()
+        self.templates = TemporaryDirectory()
+        write_site(self.content.name)
+        self.settings = Config({"content_path": self.content.name,
+                                "deploy_path": self.deploy.name,
+                                "cache_dir": self.cache.name,
+                                "filter": "exhibition.filters.jinja2",
+                                "templates": [self.templates.name]})
+        self.site = Site(self.settings)
+        self.site.build()
+
+    def tearDown(self):
+        self.content.cleanup()
+        self.deploy.cleanup()
+        self.cache.cleanup()
+        self.templates.cleanup()
+
+    def write(self, name, data, root=None):
+        path = pathlib.Path(root or self.content.name, name)
+        with path.open("w") as f:
+            f.write(data)
+        return str(path)
+
+    def read(self, name):
+        with pathlib.Path(self.deploy.name, name).open() as f:
+            return f.read()
+
+    def update(self, *paths):
+        """Returns the paths of the nodes that were rendered"""
+        with mock.patch.object(Node, "render", autospec=True, side_effect=Node.render) as render:
+            self.site.update(paths)
+        return {node_key(call[0][0]) for call in render.call_args_list}
+
+    def assertSameAsFullBuild(self):
+        with TemporaryDirectory() as deploy:
+            gen(Config(dict(self.settings, deploy_path=deploy)))
+            GenTestCase.assertSameTree(self, deploy, self.deploy.name)
+
+    def test_watch_paths(self):
+        self.assertEqual(self.site.watch_paths(), [
+            str(pathlib.Path(self.content.name).resolve()),
+            str(pathlib.Path(self.templates.name).resolve()),
+        ])
+
+    def test_content_changed(self):
+        root_node = self.site.root_node
+        post1 = root_node.get_from_path("blog/post1.html")
+        post1.marks
+
+        path = self.write("blog/post2.html", "{% mark intro %}Intro 2{% endmark %} Post two")
+        rendered = self.update(path)
+
+        self.assertEqual(rendered, {"blog/post2.html", "index.html", "blog/index.html"})
+        self.assertEqual(self.read("index.html"), "Intro 2")
+        # the tree is kept, along with anything that hasn't changed
+        self.assertIs(self.site.root_node, root_node)
+        self.assertIs(root_node.get_from_path("blog/post1.html"), post1)
+        self.assertIn("_content", post1.__dict__)
+        self.assertSameAsFullBuild()
+
+    def test_added_and_removed(self):
+        path = self.write("blog/post3.html", "{% mark intro %}Intro three{% endmark %}")
+        self.assertEqual(self.update(path), {"blog/post3.html", "blog/index.html"})
+        self.assertIn("Intro three", self.read("blog/index.html"))
+        self.assertSameAsFullBuild()
+
+        os.unlink(path)
+        self.assertEqual(self.update(path), {"blog/index.html"})
+        self.assertNotIn("Intro three", self.read("blog/index.html"))
+        self.assertFalse(pathlib.Path(self.deploy.name, "blog", "post3.html").exists())
+        self.assertSameAsFullBuild()
+
+    def test_new_directory(self):
+        pathlib.Path(self.content.name, "news").mkdir()
+        self.write("news/item.html", "news")
+        # only the new directory is reported, as inotify might
+        self.update(os.path.join(self.content.name, "news"))
+        self.assertEqual(self.read("news/item.html"), "news")
+        self.assertSameAsFullBuild()
+
+    def test_meta_changed(self):
+        root_node = self.site.root_node
+        path = self.write("blog/meta.yaml", "cache_bust_glob: \"*.css\"\nfile_mode: 0o600")
+        self.update(path)
+
+        self.assertIsNot(self.site.root_node, root_node)
+        self.assertEqual(pathlib.Path(self.deploy.name, "blog", "post1.html").stat().st_mode
+                         & 0o777, 0o600)
+        self.assertSameAsFullBuild()
+
+    def test_settings_changed(self):
+        settings_path = self.write("site.yaml", "deploy_path: %s\ncontent_path: %s\n"
+                                   "cache_dir: %s\nbase_url: /site/\n"
+                                   % (self.deploy.name, self.content.name, self.cache.name),
+                                   self.cache.name)
+        self.site.settings_path = settings_path
+
+        # every node inherits from site.yaml
+        self.assertEqual(len(self.update(settings_path)), len(SITE_FILES) + 1)
+        self.assertEqual(self.site.settings["base_url"], "/site/")
+
+    def test_template_changed(self):
+        self.write("base.j2", "{% block body %}{% endblock %}", self.templates.name)
+        self.write("page.html", "---\nextends: base.j2\ndefault_block: body\n---\npage")
+        self.update(os.path.join(self.content.name, "page.html"))
+        self.assertEqual(self.read("page.html").strip(), "page")
+
+        path = self.write("base.j2", "base {% block body %}{% endblock %}", self.templates.name)
+        self.assertEqual(self.update(path), {"page.html"})
+        self.assertEqual(self.read("page.html").split(), ["base", "page"])
+
+    def test_unrelated_change(self):
+        self.assertFalse(self.site.update([os.path.join(self.cache.name, "state.json")]))
+
+    def test_build_failed(self):
+        self.site.state = None
+        with mock.patch.object(Site, "build") as build:
+            self.assertTrue(self.site.update([]))
+        self.assertEqual(build.call_count, 1)
+
+
+class WatchTestCase(TestCase):
+    def test_debounce(self):
+        with TemporaryDirectory() as content, TemporaryDirectory() as deploy, \
+                TemporaryDirectory() as cache:
+            settings = Config({"content_path": content, "deploy_path": deploy,
+                               "cache_dir": cache})
+            stop = threading.Event()
+            updated = threading.Event()
+            updates = []
+
+            def update(site, paths):
+                updates.append(paths)
+                updated.set()
+
+            with mock.patch.object(Site, "update", autospec=True, side_effect=update):
+                thread = threading.Thread(target=watch, args=(settings,),
+                                          kwargs={"poll_interval": 0.01, "debounce": 0.2,
+                                                  "stop": stop})
+                thread.start()
+                try:
+                    while not pathlib.Path(cache, "state.json").exists():
+                        threading.Event().wait(0.01)
+                    threading.Event().wait(0.05)
+                    for i in range(3):
+                        pathlib.Path(content, "page%s.html" % i).touch()
+                        threading.Event().wait(0.02)
+                    self.assertTrue(updated.wait(5))
+                finally:
+                    stop.set()
+                    thread.join(5)
+
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(len(updates), 1)
+            self.assertTrue({os.path.join(content, "page%s.html" % i) for i in range(3)}
+                            <= updates[0])
@@ -19,32 +19,493 @@
 #
 ##
 
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from urllib.parse import urlsplit, urlunsplit
+import asyncio
+import hashlib
+import io
 import logging
+import multiprocessing
+import os
 import pathlib
 import shutil
 import threading
 
+from . import cache, compress, deploy, manifest, watch
+from .config import Config
+from .live import LiveRenderer
+from .locks import new_owner
 from .node import Node
+from .state import BuildState, file_digest, node_key
 
 logger = logging.getLogger("exhibition")
 
+CACHE_CONTROL_META = "cache_control"
+DEFAULT_CACHE_CONTROL = "no-store"
+IMMUTABLE_CACHE_CONTROL_META = "immutable_cache_control"
+DEFAULT_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
-def gen(settings):
+
+# nodes to be rendered by worker processes, set before the pool is forked
+_worker_nodes = None
+_worker_barrier = None
+
+
+def gen(settings, jobs=1, mode="process", incremental=False, atomic=False):
     """
     Generate site
 
-    Deletes ``deploy_path`` first.
+    Deletes ``deploy_path`` first, unless this is an incremental or atomic
+    build.
+
+    :param jobs:
+        The number of workers used to render files. Directories are always
+        created by the main process before any files are rendered.
+    :param mode:
+        How files are rendered when ``jobs`` is more than one, one of
+        ``"process"``, ``"thread"`` or ``"async"``. See :data:`RENDER_MODES`.
+    :param incremental:
+        Only render nodes that have changed since the last incremental build
+        and delete the outputs of nodes that have been removed. If there is
+        no state from a previous build, ``deploy_path`` is deleted and the
+        whole site is rendered. See :mod:`exhibition.state`.
+    :param atomic:
+        Render into a staging directory and swap it into place once the build
+        has finished, see :mod:`exhibition.deploy`. Incremental builds start
+        from a hard linked copy of ``deploy_path``.
     """
-    shutil.rmtree(settings["deploy_path"], True)
-    root_node = Node.from_path(pathlib.Path(settings["content_path"]), meta=settings)
+    old_state = BuildState.load(settings) if incremental else None
+    if atomic:
+        gen_atomic(settings, jobs, mode, old_state)
+        return
+
+    if not (old_state and old_state.nodes):
+        shutil.rmtree(settings["deploy_path"], True)
+
+    root_node = load_tree(settings)
+    build(settings, root_node, jobs=jobs, mode=mode, old_state=old_state)
+
+
+def gen_atomic(settings, jobs, mode, old_state):
+    """Build the site into a staging directory and then swap it in place of
+    ``deploy_path``, see :func:`gen`"""
+    deploy_path = settings["deploy_path"]
+    staging = deploy.make_staging(deploy_path)
+    try:
+        if old_state and old_state.nodes and os.path.isdir(deploy_path):
+            deploy.copy_tree(deploy_path, staging)
+
+        staged_settings = Config(dict(settings.items()))
+        staged_settings["deploy_path"] = staging
+        root_node = load_tree(staged_settings)
+        build(staged_settings, root_node, jobs=jobs, mode=mode, old_state=old_state,
+              published_path=deploy.published_path(staging, deploy_path))
+        old = deploy.swap(staging, deploy_path)
+    except BaseException:
+        shutil.rmtree(staging, True)
+        raise
+
+    logger.info("Deployed %s", deploy_path)
+    if old is not None:
+        deploy.remove_later(old)
+
+
+def load_tree(settings):
+    """Returns the root node of the tree found at ``content_path``"""
+    return Node.from_path(pathlib.Path(settings["content_path"]), meta=settings,
+                          jobs=settings.get("discovery_jobs"))
+
+
+def build(settings, root_node, jobs=1, mode="process", old_state=None, published_path=None):
+    """
+    Render the tree at ``root_node`` to ``deploy_path``
+
+    :param jobs:
+        See :func:`gen`
+    :param mode:
+        See :func:`gen`
+    :param old_state:
+        A :class:`BuildState` from a previous build, or ``None``. If given,
+        only nodes that have changed since then are rendered, see
+        :func:`plan_incremental`. The new state is saved and returned.
+    :param published_path:
+        Where ``deploy_path`` will be once the build has finished, if it is
+        a staging directory. This is what the saved state refers to.
+
+    If ``manifest_path`` is set, a manifest of the files that were rendered
+    is written there, see :mod:`exhibition.manifest`.
+    """
+    if old_state is not None:
+        state = BuildState.from_tree(settings, root_node, published_path, old_state)
+        nodes = plan_incremental(root_node, state, old_state)
+    else:
+        state = None
+        nodes = list(root_node.walk(True))
+
+    leaves = []
+    for item in nodes:
+        if item.is_leaf:
+            leaves.append(item)
+        else:
+            logger.info("Rendering %s", item.full_url)
+            item.render()
 
+    if jobs > 1:
+        RENDER_MODES[mode](leaves, jobs)
+    else:
+        render_serial(leaves)
+
+    if state is not None:
+        for item in root_node.walk(True):
+            state.record_output(item, old_state)
+        remove_outputs(settings["deploy_path"], stale_outputs(state, old_state))
+        state.save()
+
+    manifest_path = settings.get(manifest.MANIFEST_PATH_META)
+    if manifest_path:
+        manifest.save(manifest_path, manifest.from_tree(root_node))
+
+    build_finished(root_node)
+    cache.prune_caches()
+    return state
+
+
+def plan_incremental(root_node, state, old_state):
+    """
+    Returns a list of nodes that need to be rendered, in walk order
+
+    Nodes that are new or have changed since ``old_state`` are rendered, as
+    are nodes that depend on them. See :meth:`BuildState.affected`.
+    Unchanged nodes have their :attr:`Node.cache_bust` and
+    :attr:`Node.content_hash` restored from ``old_state``. Nodes that are to
+    be rendered forget anything they have already worked out, in case the
+    tree is being reused. If their meta hasn't changed, they are given the
+    hash of their last output as :attr:`Node.deployed_hash`, so that it isn't
+    written again if their content turns out to be the same.
+
+    Outputs of nodes that have been removed, or have changed from a file to a
+    directory or back again, are deleted.
+    """
+    changed = state.changed(old_state)
+    removed = state.removed(old_state)
+    affected = state.affected(old_state, changed, removed)
+
+    replaced = set()
+    nodes = []
     for item in root_node.walk(True):
+        key = node_key(item)
+        old_record = old_state.nodes.get(key)
+        if old_record is not None and old_record["is_leaf"] != item.is_leaf:
+            replaced.add(key)
+
+        if key in affected:
+            item.forget()
+            if old_record is not None and old_record["meta"] == state.nodes[key]["meta"]:
+                item.deployed_hash = old_record.get("hash")
+            else:
+                item.deployed_hash = None
+            nodes.append(item)
+        elif item.is_leaf:
+            rendered_state = {"cache_bust": old_record["cache_bust"]}
+            if old_record.get("hash") is not None:
+                rendered_state["content_hash"] = old_record["hash"]
+            item.set_rendered_state(rendered_state)
+
+    logger.info("Incremental build: %s changed, %s removed, rendering %s of %s nodes",
+                len(changed), len(removed), len(nodes), len(state.nodes))
+    remove_outputs(root_node.full_path,
+                   [output for key in removed | replaced for output in old_state.outputs(key)])
+
+    return nodes
+
+
+def stale_outputs(state, old_state):
+    """Returns outputs from ``old_state`` that aren't outputs in ``state``"""
+    if old_state is None:
+        return []
+
+    outputs = {output for key in state.nodes for output in state.outputs(key)}
+    return [output for key in old_state.nodes for output in old_state.outputs(key)
+            if output not in outputs]
+
+
+def remove_outputs(deploy_path, outputs):
+    """Delete ``outputs``, which are relative to ``deploy_path``"""
+    for output in sorted(outputs, reverse=True):
+        path = pathlib.Path(deploy_path, output)
+        logger.info("Removing %s", path)
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path)
+            continue
+        elif os.path.lexists(path):
+            path.unlink()
+
+
+def render_serial(nodes):
+    """Render nodes one after the other"""
+    for item in nodes:
         logger.info("Rendering %s", item.full_url)
         item.render()
 
 
+def _render_worker(index):
+    item = _worker_nodes[index]
+    logger.info("Rendering %s", item.full_url)
+    item.render()
+    return index, item.get_rendered_state()
+
+
+def _finish_worker(index):
+    # wait for every worker to pick up one of these tasks so each worker
+    # process runs build_finished exactly once
+    _worker_barrier.wait()
+    build_finished(_worker_nodes[0].root_node)
+
+
+def render_processes(nodes, jobs):
+    """
+    Render nodes in a pool of ``jobs`` worker processes
+
+    Workers are forked after the tree has been loaded, so they don't need to
+    load it again. State that other nodes might need, such as
+    :attr:`Node.marks`, is sent back to the main process once a node has been
+    rendered. Content filters have ``build_finished`` called in each worker
+    once all nodes have been rendered.
+
+    Falls back to :func:`render_serial` on platforms that can't fork.
+    """
+    global _worker_nodes, _worker_barrier
+
+    if not nodes:
+        return
+
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        logger.warning("Platform does not support forking, rendering in serial")
+        render_serial(nodes)
+        return
+
+    _worker_nodes = nodes
+    _worker_barrier = context.Barrier(jobs)
+    chunksize = max(1, len(nodes) // (jobs * 4))
+    try:
+        with context.Pool(jobs) as pool:
+            for index, state in pool.imap_unordered(_render_worker, range(len(nodes)),
+                                                    chunksize):
+                nodes[index].set_rendered_state(state)
+            pool.map(_finish_worker, range(jobs), chunksize=1)
+    finally:
+        _worker_nodes = None
+        _worker_barrier = None
+
+
+def render_threads(nodes, jobs):
+    """
+    Render nodes in a pool of ``jobs`` threads
+
+    Nodes share a single tree, so anything one node computes (such as its
+    :attr:`Node.marks`) is available to the others without being copied.
+    Each node only computes its content once, even if several threads ask for
+    it at the same time.
+    """
+    def render(item):
+        logger.info("Rendering %s", item.full_url)
+        item.render()
+
+    with ThreadPoolExecutor(jobs) as executor:
+        # consume results so exceptions are raised here
+        for _ in executor.map(render, nodes):
+            pass
+
+
+async def _render_tasks(nodes, jobs):
+    loop = asyncio.get_running_loop()
+    # each task uses at most one thread at a time, so a task waiting for a
+    # node that another task is rendering can't starve it of threads
+    loop.set_default_executor(ThreadPoolExecutor(jobs))
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def render(item):
+        async with semaphore:
+            new_owner()
+            logger.info("Rendering %s", item.full_url)
+            await item.async_render()
+
+    await asyncio.gather(*[render(item) for item in nodes])
+
+
+def render_async(nodes, jobs):
+    """
+    Render nodes as :mod:`asyncio` tasks, at most ``jobs`` at a time
+
+    Filters that provide ``async_content_filter`` are awaited, such as
+    :mod:`exhibition.filters.external` and :mod:`exhibition.filters.pandoc`,
+    so many external programs can be running without a thread for each.
+    Other filters and file writes are run in a pool of ``jobs`` threads.
+    """
+    asyncio.run(_render_tasks(nodes, jobs))
+
+
+RENDER_MODES = {
+    "process": render_processes,
+    "thread": render_threads,
+    "async": render_async,
+}
+
+
+def build_finished(root_node):
+    """
+    Calls ``build_finished(root_node)`` on every content filter used in the
+    tree that provides it
+
+    If the site was rendered by :func:`render_processes`, this is also called
+    by each worker process. Render cache statistics are logged too.
+    """
+    call_filter_hook(root_node, "build_finished")
+    cache.build_finished(root_node)
+
+
+def call_filter_hook(root_node, name):
+    """Calls ``name(root_node)`` on every content filter used in the tree that
+    provides it, once per filter"""
+    seen = set()
+    for item in root_node.walk(True):
+        if not item.is_leaf:
+            continue
+        for fltr, _ in item.content_filters():
+            if fltr in seen:
+                continue
+            seen.add(fltr)
+            hook = getattr(fltr, name, None)
+            if hook is not None:
+                hook(root_node)
+
+
+def compile_templates(settings, target, filter_module="exhibition.filters.jinja2"):
+    """
+    Compile templates into Python modules ahead of time
+
+    :param target:
+        A zip file or directory to write the compiled templates to
+    :param filter_module:
+        Dotted path to the module that provides the Jinja2 content filter. Its
+        template filters and extensions are used to compile the templates.
+    """
+    content_filter = import_module(filter_module).content_filter
+    root_node = Node(pathlib.Path(settings["content_path"]), None, meta=settings)
+    content_filter.compile_templates(root_node, target)
+
+
+def routing_table(root_node):
+    """
+    Returns a dictionary of URL paths and the nodes that should be served for
+    them from ``deploy_path``
+
+    URL paths are relative to ``base_url`` and have no leading or trailing
+    slashes. Every file can be found by its :attr:`Node.full_url` and by its
+    path in ``deploy_path``. Directories are mapped to their ``index_file`` if
+    they have one.
+    """
+    routes = {}
+    base_url = root_node.full_url
+    deploy_path = root_node.full_path
+    for item in root_node.walk(True):
+        key = item.full_url[len(base_url):].strip("/")
+        if item.is_leaf:
+            path = os.path.relpath(item.full_path, deploy_path)
+            routes[pathlib.Path(path).as_posix()] = item
+            routes.setdefault(key, item)
+        else:
+            index = item.children.get(item.index_file)
+            routes[key] = index if index is not None and index.is_leaf else item
+
+    return routes
+
+
+class Router:
+    """
+    Keeps a :func:`routing_table` for a :class:`exhibition.watch.WatchedTree`
+
+    The table is built when it is first needed and again after the tree
+    changes.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self._routes = None
+        self._lock = threading.Lock()
+        self._generation = 0
+        tree.listeners.append(self.invalidate)
+
+    @property
+    def routes(self):
+        with self._lock:
+            if self._routes is not None:
+                return self._routes
+            generation = self._generation
+
+        routes = routing_table(self.tree.root_node)
+        with self._lock:
+            if generation == self._generation:
+                self._routes = routes
+        return routes
+
+    def invalidate(self, changed=None):
+        """Throw the table away, it's built again when next needed"""
+        with self._lock:
+            self._generation += 1
+            self._routes = None
+
+    def etag(self, node, path, stat):
+        """
+        Returns an entity tag for ``node``, which has been rendered to
+        ``path``
+
+        :attr:`Node.cache_bust` is used if the node has one. Otherwise the file
+        is hashed by :func:`exhibition.state.file_digest`, which only reads it
+        again once it has changed.
+        """
+        if node.cache_bust:
+            return '"%s"' % node.cache_bust
+        return '"%s"' % file_digest(path, stat)
+
+
+def accepted_encodings(header):
+    """Returns a set of the content codings that an ``Accept-Encoding``
+    header allows"""
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        name = name.strip().lower()
+        if name and quality > 0:
+            accepted.add(name)
+
+    return accepted
+
+
 class ExhibitionBaseHTTPRequestHandler(SimpleHTTPRequestHandler):
+    # every response has a Content-Length, so connections can be kept open
+    protocol_version = "HTTP/1.1"
+    # close idle connections after this many seconds
+    timeout = 60
+
+    # Cache-Control for the current response, see end_headers
+    _cache_control = None
+    # (offset, length) of the part of the file to send, see copyfile
+    _range = None
+
     def _sanitise_path(self, path):
         """ Strip leading and trailing / as well as base_url, if preset """
         path = path.split('?', 1)[0]
@@ -59,47 +520,296 @@ class ExhibitionBaseHTTPRequestHandler(SimpleHTTPRequestHandler):
         return path
 
     def translate_path(self, path):
+        """Look ``path`` up in the :func:`routing_table` for the tree. Paths
+        that aren't in the table are looked for in ``deploy_path``."""
         path = self._sanitise_path(path)
-        root_node = Node.from_path(pathlib.Path(self._settings["content_path"]),
-                                   meta=self._settings)
+        if path is None:
+            return ""
 
         try:
-            node = root_node.get_from_path(pathlib.PurePath(path).parent or path)
-        except (OSError, TypeError):
-            return ""
+            return self._router.routes[path].full_path
+        except KeyError:
+            return str(pathlib.Path(self._settings["deploy_path"], path))
+
+    def send_head(self):
+        """Serve files that belong to a node with an ``ETag`` and support for
+        conditional and range requests. Anything else is served as
+        :class:`http.server.SimpleHTTPRequestHandler` would."""
+        self._range = None
+        path = self._sanitise_path(self.path)
+        node = None if path is None else self._router.routes.get(path)
+        if node is None or not node.is_leaf:
+            return super().send_head()
 
-        path = pathlib.Path(self._settings["deploy_path"], path)
+        full_path = node.full_path
+        formats = compress.node_formats(node)
+        f, path, encoding = self._open_variant(full_path, formats)
+        if f is None:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+
+        try:
+            stat = os.fstat(f.fileno())
+            etag = self._router.etag(node, path, stat)
+            if encoding is not None:
+                etag = '%s-%s"' % (etag[:-1], encoding)
+            if self._send_entity_headers(node, stat.st_size, etag, stat.st_mtime,
+                                         self.guess_type(full_path), encoding, bool(formats)):
+                return f
+            f.close()
+            return None
+        except Exception:
+            f.close()
+            raise
 
-        if not (path.exists() or path.suffix):
-            for ext in node.strip_exts:
-                new_path = path.with_suffix(ext)
-                if new_path.exists():
-                    return str(new_path)
-        elif path.is_dir():
-            new_path = pathlib.Path(path, node.index_file)
-            if new_path.exists():
-                return str(new_path)
+    def _open_variant(self, full_path, formats):
+        """
+        Open the best copy of ``full_path`` that the client accepts, out of
+        the file itself and its compressed copies in ``formats``
 
-        return str(path)
+        Returns the open file, its path and its content coding, or ``None``
+        for each if not even ``full_path`` could be opened.
+        """
+        if formats:
+            accepted = accepted_encodings(self.headers.get("Accept-Encoding", ""))
+            for name in compress.PREFERENCE:
+                if name in formats and name in accepted:
+                    path = full_path + compress.FORMATS[name].suffix
+                    try:
+                        return open(path, "rb"), path, name
+                    except OSError:
+                        continue
+
+        try:
+            return open(full_path, "rb"), full_path, None
+        except OSError:
+            return None, None, None
+
+    def _cache_control_for(self, node):
+        """Returns the ``Cache-Control`` header for ``node``"""
+        if node.cache_bust:
+            return node.meta.get(IMMUTABLE_CACHE_CONTROL_META, DEFAULT_IMMUTABLE_CACHE_CONTROL)
+        return node.meta.get(CACHE_CONTROL_META, DEFAULT_CACHE_CONTROL)
+
+    def _send_entity_headers(self, node, size, etag, mtime, content_type, encoding=None,
+                             vary=False):
+        """
+        Send the status line and headers for ``node``
+
+        ``encoding`` is the content coding of the body, if any. ``vary`` should
+        be ``True`` if the body would be different for another
+        ``Accept-Encoding``.
+
+        Returns ``False`` if there is no body to send, which is the case for
+        ``304 Not Modified`` and ``416 Range Not Satisfiable``. If only part of
+        the body should be sent, :attr:`_range` is set.
+        """
+        self._cache_control = self._cache_control_for(node)
+        last_modified = None if mtime is None else self.date_time_string(mtime)
+        if self._not_modified(etag, mtime):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            if vary:
+                self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return False
+
+        byte_range = self._byte_range(size, etag, last_modified)
+        if byte_range is False:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", "bytes */%d" % size)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return False
+
+        self.send_response(HTTPStatus.OK if byte_range is None else HTTPStatus.PARTIAL_CONTENT)
+        self.send_header("Content-Type", content_type)
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        if vary:
+            self.send_header("Vary", "Accept-Encoding")
+        self.send_header("ETag", etag)
+        if last_modified is not None:
+            self.send_header("Last-Modified", last_modified)
+        self.send_header("Accept-Ranges", "bytes")
+        if byte_range is None:
+            self.send_header("Content-Length", str(size))
+        else:
+            start, end = byte_range
+            self._range = (start, end - start + 1)
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, size))
+            self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        return True
+
+    def _not_modified(self, etag, mtime):
+        """Returns ``True`` if the client's copy is up to date, according to
+        ``If-None-Match`` or, failing that, ``If-Modified-Since``"""
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            # weak comparison, as RFC 9110 asks for
+            return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == etag
+                                      for tag in tags)
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is None or mtime is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+        if since.tzinfo is None:
+            return False
+        return int(mtime) <= since.timestamp()
+
+    def _byte_range(self, size, etag, last_modified):
+        """
+        Returns the ``(first, last)`` byte asked for by a ``Range`` header,
+        ``None`` if the whole body should be sent, or ``False`` if the range
+        can't be satisfied
+
+        Only single ranges are supported, requests for several ranges get the
+        whole body.
+        """
+        header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if header is None or (if_range is not None and if_range not in (etag, last_modified)):
+            return None
+
+        unit, _, spec = header.partition("=")
+        first, sep, last = spec.strip().partition("-")
+        if unit.strip() != "bytes" or not sep or "," in spec:
+            return None
+
+        try:
+            if first:
+                first = int(first)
+                last = int(last) if last else max(first, size - 1)
+                if first < 0 or last < first:
+                    return None
+            else:
+                suffix = int(last)
+                if suffix <= 0:
+                    return False
+                first, last = max(size - suffix, 0), size - 1
+        except ValueError:
+            return None
+
+        if first >= size:
+            return False
+        return first, min(last, size - 1)
 
     def end_headers(self):
-        self.send_header("Cache-Control", "no-store")
+        cache_control = self._cache_control
+        if cache_control is None:
+            cache_control = self._settings.get(CACHE_CONTROL_META, DEFAULT_CACHE_CONTROL)
+        self._cache_control = None
+        self.send_header("Cache-Control", cache_control)
         return super().end_headers()
 
+    def copyfile(self, source, outputfile):
+        """Send files with :meth:`socket.socket.sendfile`, which uses
+        :func:`os.sendfile` where it is available so the file isn't copied
+        through userspace"""
+        offset, count = self._range or (0, None)
+        self._range = None
+        try:
+            source.fileno()
+        except (AttributeError, OSError):
+            source.seek(offset)
+            if count is None:
+                return super().copyfile(source, outputfile)
+            outputfile.write(source.read(count))
+            return
+
+        outputfile.flush()
+        self.connection.sendfile(source, offset, count)
+
+
+class ExhibitionLiveHTTPRequestHandler(ExhibitionBaseHTTPRequestHandler):
+    """
+    Renders each page when it is requested, rather than reading it from
+    ``deploy_path``
+
+    Subclasses must set ``_renderer`` to a :class:`exhibition.live.LiveRenderer`.
+    """
+    def send_head(self):
+        path = self._sanitise_path(self.path)
+        node = None if path is None else self._renderer.resolve(path)
+        if node is not None and not node.is_leaf:
+            parts = urlsplit(self.path)
+            if not parts.path.endswith("/"):
+                self.send_response(HTTPStatus.MOVED_PERMANENTLY)
+                self.send_header("Location", urlunsplit(parts._replace(path=parts.path + "/")))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            node = node.children.get(node.index_file)
+
+        if node is None or not node.is_leaf:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+
+        try:
+            content = self._renderer.render(node)
+        except Exception as exp:
+            self.log_error("Could not render %s: %r", node.path_obj, exp)
+            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, "Could not render page")
+            return None
+
+        self._range = None
+        etag = '"%s"' % (node.cache_bust or hashlib.md5(content).hexdigest())
+        if self._send_entity_headers(node, len(content), etag, None,
+                                     self.guess_type(node.path_obj.name)):
+            return io.BytesIO(content)
+        return None
+
 
-def serve(settings, server_address):
+class ExhibitionHTTPServer(ThreadingHTTPServer):
+    """
+    Handles each connection in its own thread
+
+    Stops watching ``content_path`` when the server is closed.
+    """
+    def server_close(self):
+        super().server_close()
+        self.RequestHandlerClass._tree.close()
+
+
+def serve(settings, server_address, live=False):
     """
     Serves the generated site from ``deploy_path``
 
-    Respects settings like ``base_url`` if present.
+    Respects settings like ``base_url`` if present. The node tree is loaded
+    once and kept up to date as ``content_path`` changes, see
+    :class:`exhibition.watch.WatchedTree`.
+
+    If ``live`` is ``True``, pages are rendered as they are requested and
+    nothing is read from or written to ``deploy_path``, see
+    :class:`exhibition.live.LiveRenderer`.
     """
     logger = logging.getLogger("exhibition.server")
 
+    tree = watch.WatchedTree(settings)
+
     # this is quite ewwww, but whatever.
-    class ExhibitionHTTPRequestHandler(ExhibitionBaseHTTPRequestHandler):
-        _settings = settings
+    if live:
+        class ExhibitionHTTPRequestHandler(ExhibitionLiveHTTPRequestHandler):
+            _settings = settings
+            _tree = tree
+            _renderer = LiveRenderer(tree)
+    else:
+        class ExhibitionHTTPRequestHandler(ExhibitionBaseHTTPRequestHandler):
+            _settings = settings
+            _tree = tree
+            _router = Router(tree)
 
-    httpd = HTTPServer(server_address, ExhibitionHTTPRequestHandler)
+    try:
+        httpd = ExhibitionHTTPServer(server_address, ExhibitionHTTPRequestHandler)
+    except Exception:
+        tree.close()
+        raise
 
     logger.warning("Listening on http://%s:%s", *server_address)
     t = threading.Thread(target=httpd.serve_forever, daemon=True)
@@ -0,0 +1,612 @@
+##
+#
+# Copyright (C) 2026 Matt Molyneaux
+#
+# This file is part of Exhibition.
+#
+# Exhibition is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Exhibition is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Exhibition.  If not, see <https://www.gnu.org/licenses/>.
+#
+##
+
+"""
+Render the site again whenever its files change
+
+``content_path``, every ``templates`` directory and ``site.yaml`` are watched
+with inotify on Linux, or by polling elsewhere. The node tree is kept in
+memory between builds, see :class:`Site`.
+"""
+
+from stat import S_ISDIR
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import pathlib
+import posixpath
+import select
+import shutil
+import struct
+import threading
+import time
+
+from . import config, utils
+from .node import Node
+from .state import BuildState, node_key, template_dirs
+
+DEFAULT_DEBOUNCE = 0.1
+DEFAULT_POLL_INTERVAL = 1.0
+
+# how often the watch loop checks whether it should stop
+STOP_CHECK_INTERVAL = 0.5
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+INOTIFY_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+                | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_inotify_event = struct.Struct("iIII")
+
+logger = logging.getLogger(__name__)
+
+
+class BaseWatcher:
+    """
+    Watches files and directories for changes
+
+    Directories are watched recursively. Subclasses must implement
+    :meth:`wait`.
+    """
+    def __init__(self, paths):
+        """
+        :param paths:
+            Files and directories to watch. Paths that don't exist are
+            ignored.
+        """
+        self.paths = [os.path.abspath(path) for path in paths]
+
+    def is_watched(self, path):
+        """Returns ``True`` if ``path`` is one of :attr:`paths` or is inside
+        one of them"""
+        return any(path == watched or path.startswith(watched + os.sep) for watched in self.paths)
+
+    def wait(self, timeout=None):
+        """
+        Wait for changes
+
+        Returns a set of paths that have been created, modified or removed,
+        which is empty if nothing changed within ``timeout`` seconds. If
+        ``timeout`` is ``None``, wait until something changes.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class InotifyWatcher(BaseWatcher):
+    """
+    Watches paths with Linux's inotify, which is called via :mod:`ctypes`
+
+    Files are watched via their parent directory so that they are still
+    watched after an editor replaces them. New directories are watched as
+    soon as they are seen.
+
+    Raises :class:`OSError` if inotify isn't available.
+    """
+    def __init__(self, paths):
+        super().__init__(paths)
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            inotify_init1 = libc.inotify_init1
+            self._inotify_add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError) as exp:
+            raise OSError("inotify is not available") from exp
+
+        self._inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        self._watches = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                self._add_tree(path)
+            else:
+                self._add(os.path.dirname(path))
+
+    def _add(self, path):
+        wd = self._inotify_add_watch(self.fd, os.fsencode(path), INOTIFY_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                # gone before we could watch it, its parent will tell us
+                return
+            raise OSError(err, os.strerror(err), path)
+        self._watches[wd] = path
+
+    def _add_tree(self, path):
+        for dirpath, _, _ in os.walk(path):
+            self._add(dirpath)
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return set()
+
+            changed = self._read_events()
+            if changed:
+                return changed
+
+    def _read_events(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _inotify_event.unpack_from(data, offset)
+                offset += _inotify_event.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    # events were lost, so anything we watch could have changed
+                    changed.update(self.paths)
+                    changed.update(path for path in self._watches.values()
+                                   if self.is_watched(path))
+                    continue
+
+                base = self._watches.get(wd)
+                if base is None:
+                    continue
+                elif mask & IN_IGNORED:
+                    del self._watches[wd]
+                    continue
+
+                path = os.path.join(base, os.fsdecode(name)) if name else base
+                if not self.is_watched(path):
+                    continue
+
+                changed.add(path)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher(BaseWatcher):
+    """
+    Watches paths by comparing the mode, size and modification time of
+    everything in them every ``interval`` seconds
+    """
+    def __init__(self, paths, interval=DEFAULT_POLL_INTERVAL):
+        super().__init__(paths)
+        self.interval = interval
+        self._snapshot = self.snapshot()
+
+    def snapshot(self):
+        """Returns a dictionary of ``(mode, size, mtime)`` keyed by path for
+        every watched path"""
+        files = {}
+        for path in self.paths:
+            self._scan(path, files)
+        return files
+
+    def _scan(self, path, files):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+
+        files[path] = (stat.st_mode, stat.st_size, stat.st_mtime_ns)
+        if S_ISDIR(stat.st_mode):
+            try:
+                with os.scandir(path) as dir_iter:
+                    entries = [entry.path for entry in dir_iter]
+            except OSError:
+                return
+            for entry in entries:
+                self._scan(entry, files)
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, deadline - time.monotonic())
+            if delay > 0:
+                time.sleep(delay)
+
+            snapshot = self.snapshot()
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+
+def get_watcher(paths, poll_interval=None):
+    """
+    Returns an :class:`InotifyWatcher` for ``paths``, or a
+    :class:`PollingWatcher` if inotify isn't available or ``poll_interval``
+    is set
+    """
+    if poll_interval is None:
+        try:
+            return InotifyWatcher(paths)
+        except OSError as exp:
+            logger.info("Can't use inotify (%s), polling for changes instead", exp)
+            poll_interval = DEFAULT_POLL_INTERVAL
+
+    return PollingWatcher(paths, poll_interval)
+
+
+def content_changes(content_path, paths):
+    """
+    Work out what has to be done to the tree at ``content_path`` now that
+    ``paths`` have changed
+
+    Returns a tuple of whether the tree must be loaded again, because a meta
+    file has changed, and a set of directories that must be read again with
+    :meth:`Node.rescan`. Paths outside of ``content_path`` are ignored.
+    """
+    content_path = pathlib.Path(content_path)
+    reload = False
+    dirs = set()
+    for path in paths:
+        path = pathlib.Path(path)
+        if path == content_path:
+            dirs.add(path)
+        elif content_path in path.parents:
+            if path.name in Node._meta_names:
+                reload = True
+            # path could be a directory too
+            dirs.update([path.parent, path])
+
+    return reload, dirs
+
+
+def template_changes(dirs, paths):
+    """Returns the names of templates in any of ``dirs`` that are among
+    ``paths``, as they would be passed to ``{% include %}``"""
+    dirs = [pathlib.Path(directory) for directory in dirs]
+    names = set()
+    for path in paths:
+        path = pathlib.Path(path)
+        for directory in dirs:
+            if directory in path.parents:
+                names.add(path.relative_to(directory).as_posix())
+    return names
+
+
+def rescan_dirs(root_node, content_path, dirs):
+    """
+    Call :meth:`Node.rescan` for each of ``dirs`` that is a directory in the
+    tree at ``root_node``, parents first
+
+    Returns a set of the dependencies, as found in :attr:`Node.dependencies`,
+    that have changed.
+    """
+    changed = set()
+    for directory in sorted(dirs):
+        try:
+            node = root_node.get_from_path(directory.relative_to(content_path))
+            if node.is_leaf:
+                continue
+            names = node.rescan()
+        except OSError:
+            # not in the tree, or removed since, its parent is rescanned too
+            continue
+
+        if names:
+            key = node_key(node)
+            changed.add(("children", key))
+            changed.update(("node", posixpath.join(key, name) if key != "." else name)
+                           for name in names)
+
+    return changed
+
+
+class WatchedTree:
+    """
+    A node tree for ``content_path`` that is kept up to date in the
+    background
+
+    The tree is loaded the first time :attr:`root_node` is used. After that,
+    directories are only read again when something in them changes and the
+    tree is only loaded again if a meta file changes.
+
+    The ``templates`` directories from ``settings`` are watched too. Callables
+    in :attr:`listeners` are called after each update with a set of the
+    dependencies that changed (see :attr:`Node.dependencies`), or ``None`` if
+    the tree is to be loaded again.
+    """
+    def __init__(self, settings, poll_interval=None):
+        """
+        :param settings:
+            A :class:`exhibition.config.Config`
+        :param poll_interval:
+            See :func:`get_watcher`
+        """
+        self.settings = settings
+        self.content_path = pathlib.Path(settings["content_path"]).resolve()
+        templates = settings.get("templates") or []
+        if not isinstance(templates, (list, tuple)):
+            templates = [templates]
+        self.template_dirs = sorted({str(pathlib.Path(tmpl).resolve()) for tmpl in templates})
+        self.listeners = []
+        self._root_node = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._poll_interval = poll_interval or DEFAULT_POLL_INTERVAL
+        self._watcher = get_watcher([self.content_path] + self.template_dirs, poll_interval)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def root_node(self):
+        with self._lock:
+            if self._root_node is None:
+                self._root_node = utils.load_tree(self.settings)
+            return self._root_node
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    changed = self._watcher.wait(STOP_CHECK_INTERVAL)
+                except OSError:
+                    # e.g. running out of inotify watches
+                    logger.exception("Could not watch for changes, polling instead")
+                    self._start_polling()
+                    continue
+
+                if changed:
+                    try:
+                        self.update(changed)
+                    except Exception:
+                        logger.exception("Could not update tree")
+        finally:
+            self._watcher.close()
+
+    def _start_polling(self):
+        """Replace the watcher with a :class:`PollingWatcher`. Changes could
+        have been missed, so the tree is loaded again."""
+        paths = self._watcher.paths
+        self._watcher.close()
+        self._watcher = PollingWatcher(paths, self._poll_interval)
+        with self._lock:
+            self._root_node = None
+        for listener in self.listeners:
+            listener(None)
+
+    def update(self, paths):
+        """Bring the tree up to date after ``paths`` have changed"""
+        reload, dirs = content_changes(self.content_path, paths)
+        templates = template_changes(self.template_dirs, paths)
+        with self._lock:
+            if self._root_node is None:
+                return
+            elif reload:
+                self._root_node = None
+                changed = None
+            else:
+                changed = rescan_dirs(self._root_node, self.content_path, dirs)
+                if templates:
+                    utils.call_filter_hook(self._root_node, "templates_changed")
+                    changed.update(("template", name) for name in templates)
+
+        if changed is None or changed:
+            for listener in self.listeners:
+                listener(changed)
+
+    def close(self):
+        """Stop watching for changes. The background thread stops within
+        :data:`STOP_CHECK_INTERVAL` seconds."""
+        self._stop.set()
+
+
+class Site:
+    """
+    A site that is kept in memory between builds
+
+    The node tree is kept, along with anything nodes have worked out such as
+    their content and marks, as are the environments that filters like
+    :mod:`exhibition.filters.jinja2` create for the tree. When files change,
+    only the directories that contain them are read again and only nodes
+    that have changed, or depend on something that has, are rendered. See
+    :func:`exhibition.utils.plan_incremental`.
+
+    Changes to ``site.yaml`` or meta files load the whole tree again.
+    """
+    def __init__(self, settings, settings_path=None, jobs=1):
+        """
+        :param settings:
+            A :class:`exhibition.config.Config`
+        :param settings_path:
+            Where ``settings`` was loaded from, so it can be loaded again when
+            it changes
+        :param jobs:
+            The number of threads used to render files
+        """
+        self.settings = settings
+        self.settings_path = settings_path
+        self.jobs = jobs
+        self.root_node = None
+        self.state = None
+
+    @property
+    def content_path(self):
+        return pathlib.Path(self.settings["content_path"]).resolve()
+
+    def watch_paths(self):
+        """Returns a list of paths that should be watched"""
+        paths = [str(self.content_path)]
+        if self.root_node is not None:
+            paths.extend(template_dirs(self.root_node))
+        if self.settings_path is not None:
+            paths.append(str(pathlib.Path(self.settings_path).resolve()))
+        return paths
+
+    def build(self):
+        """
+        Load the tree and render it
+
+        As with ``exhibit gen --incremental``, outputs from the last
+        incremental build are kept if they are still up to date.
+        """
+        if self.settings_path is not None:
+            self.settings = config.Config.from_path(self.settings_path)
+
+        old_state = BuildState.load(self.settings)
+        if not old_state.nodes:
+            shutil.rmtree(self.settings["deploy_path"], True)
+
+        self.root_node = utils.load_tree(self.settings)
+        self._render(old_state)
+
+    def update(self, paths):
+        """
+        Bring the site up to date after ``paths`` have changed
+
+        Returns ``False`` if none of ``paths`` are part of the site, otherwise
+        ``True``.
+        """
+        start = time.monotonic()
+        if self.state is None:
+            reload, templates_changed, dirs = True, False, set()
+        else:
+            reload, templates_changed, dirs = self._classify(paths)
+
+        if reload:
+            self.build()
+        elif templates_changed or dirs:
+            rescan_dirs(self.root_node, self.content_path, dirs)
+            if templates_changed:
+                utils.call_filter_hook(self.root_node, "templates_changed")
+            self._render(self.state)
+        else:
+            return False
+
+        logger.info("Site updated in %.3f seconds", time.monotonic() - start)
+        return True
+
+    def _render(self, old_state):
+        self.state = utils.build(self.settings, self.root_node, jobs=self.jobs, mode="thread",
+                                 old_state=old_state)
+
+    def _classify(self, paths):
+        """Returns whether the tree must be loaded again, whether templates
+        have changed and which directories need to be read again"""
+        reload, dirs = content_changes(self.content_path, paths)
+        templates_changed = bool(template_changes(template_dirs(self.root_node), paths))
+        if self.settings_path is not None:
+            settings_path = pathlib.Path(self.settings_path).resolve()
+            if any(pathlib.Path(path) == settings_path for path in paths):
+                reload = True
+
+        return reload, templates_changed, dirs
+
+
+def watch(settings, settings_path=None, jobs=1, debounce=DEFAULT_DEBOUNCE, poll_interval=None,
+          stop=None):
+    """
+    Render the site and then render it again whenever its files change
+
+    :param settings_path:
+        Where ``settings`` was loaded from, usually ``site.yaml``. It is
+        watched too.
+    :param jobs:
+        The number of threads used to render files
+    :param debounce:
+        Once a change has been seen, wait until nothing else has changed for
+        this many seconds before rendering. This means that bursts of events,
+        such as an editor saving a file, only cause one update.
+    :param poll_interval:
+        Poll for changes every ``poll_interval`` seconds rather than using
+        inotify
+    :param stop:
+        A :class:`threading.Event`, the loop ends once it has been set
+    """
+    site = Site(settings, settings_path, jobs)
+    # start watching before the first build, so nothing is missed
+    watcher = get_watcher(site.watch_paths(), poll_interval)
+    try:
+        try:
+            site.build()
+        except Exception:
+            logger.exception("Could not render site")
+
+        watcher = _check_watcher(site, watcher, poll_interval)
+        logger.warning("Watching %s for changes", ", ".join(watcher.paths))
+        while stop is None or not stop.is_set():
+            changed = watcher.wait(STOP_CHECK_INTERVAL)
+            if not changed:
+                continue
+
+            while True:
+                more = watcher.wait(debounce)
+                if not more:
+                    break
+                changed.update(more)
+
+            try:
+                site.update(changed)
+            except Exception:
+                logger.exception("Could not render site")
+
+            watcher = _check_watcher(site, watcher, poll_interval)
+    finally:
+        watcher.close()
+
+
+def _check_watcher(site, watcher, poll_interval):
+    """Returns a new watcher if the paths that ``site`` needs watched have
+    changed, e.g. ``templates`` in ``site.yaml``"""
+    paths = site.watch_paths()
+    if paths == watcher.paths:
+        return watcher
+
+    new_watcher = get_watcher(paths, poll_interval)
+    watcher.close()
+    return new_watcher
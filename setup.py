@@ -49,6 +49,9 @@ setup(
             "sphinx_rtd_theme",
             "sphinx-click",
         ],
+        "zstd": [
+            "zstandard",
+        ],
     },
     entry_points={
         "console_scripts": [